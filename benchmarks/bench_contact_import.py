@@ -0,0 +1,92 @@
+"""Benchmark the contact CSV import on synthetic Google Contacts exports.
+
+Run from the repository root:
+
+    python benchmarks/bench_contact_import.py [rows ...]
+
+For each export size (10k, 100k and 1M rows by default) it reports the time of the
+vectorized, chunked import into a fresh SQLite store, and of the former row-by-row
+import (iterrows, then a full JSON rewrite) up to 100k rows, where it is still bearable.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from contact_agent.contact_import import import_contacts
+from utilities.storage import Storage
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+# The row-by-row import is only timed up to this size
+LEGACY_MAX_ROWS = 100000
+
+COLUMNS = ['First Name', 'Middle Name', 'Last Name', 'Nickname', 'Organization Name', 'Organization Title',
+           'E-mail 1 - Value', 'E-mail 2 - Value', 'Phone 1 - Value', 'Notes']
+
+def write_export(path, rows):
+    """Write an export where some cells are empty, some e-mails are only in column 2 and 1% of rows repeat."""
+    with open(path, 'w') as file:
+        file.write(','.join(COLUMNS) + '\n')
+        for i in range(rows):
+            n = i - i % 100 if i % 100 == 99 else i
+            email_1 = '' if n % 7 == 0 else f'person{n}@example{n % 50}.com'
+            email_2 = f'alt{n}@example.org' if n % 3 == 0 else ''
+            middle = 'Q' if n % 5 == 0 else ''
+            file.write(f'First{n},{middle},Last{n},,Company {n % 1000},Title {n % 20},{email_1},{email_2},+1 555 {n:07d},\n')
+
+def legacy_import(csv_path, json_path):
+    """The former import: iterrows, pd.isna per field, and a rewrite of the whole JSON file."""
+    contacts = {}
+    new_contacts = pd.read_csv(csv_path)
+    for _, row in new_contacts.iterrows():
+        contact_id = f"{row['First Name']}_{row['Last Name']}_{row['E-mail 1 - Value']}"
+        email = row.get('E-mail 1 - Value') or row.get('E-mail 2 - Value')
+        if pd.isna(email):
+            continue
+        if contact_id not in contacts:
+            contacts[contact_id] = {
+                "first_name": row['First Name'] if not pd.isna(row['First Name']) else "",
+                "middle_name": row['Middle Name'] if not pd.isna(row['Middle Name']) else "",
+                "last_name": row['Last Name'] if not pd.isna(row['Last Name']) else "",
+                "nickname": row['Nickname'] if not pd.isna(row['Nickname']) else "",
+                "organization": row['Organization Name'] if not pd.isna(row['Organization Name']) else "",
+                "title": row['Organization Title'] if not pd.isna(row['Organization Title']) else "",
+                "email": email,
+                "category": None,
+                "vip": False,
+                "last_interaction": None,
+                "created": datetime.now().isoformat()
+            }
+    with open(json_path, 'w') as file:
+        json.dump(contacts, file)
+    return len(contacts)
+
+def main(sizes):
+    print(f"{'rows':>9} {'CSV MB':>7} {'import s':>9} {'rows/s':>10} {'contacts':>9} {'legacy s':>9}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rows in sizes:
+            csv_path = os.path.join(tmpdir, f'contacts_{rows}.csv')
+            write_export(csv_path, rows)
+
+            storage = Storage(os.path.join(tmpdir, f'contacts_{rows}.db'))
+            started = time.perf_counter()
+            added = import_contacts(csv_path, storage)
+            elapsed = time.perf_counter() - started
+            storage.close()
+
+            legacy = '-'
+            if rows <= LEGACY_MAX_ROWS:
+                started = time.perf_counter()
+                legacy_import(csv_path, os.path.join(tmpdir, f'contacts_{rows}.json'))
+                legacy = f'{time.perf_counter() - started:.2f}'
+
+            size = os.path.getsize(csv_path) / 1024 / 1024
+            print(f"{rows:>9} {size:>7.1f} {elapsed:>9.2f} {rows / elapsed:>10.0f} {added:>9} {legacy:>9}")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
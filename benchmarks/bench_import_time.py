@@ -0,0 +1,92 @@
+"""Benchmark the startup of the agents: import times and --help, each in a fresh interpreter.
+
+Run from the repository root:
+
+    python benchmarks/bench_import_time.py [--repeat N] [--json PATH] [--max-ms MS]
+
+For every target it reports the median wall time over N runs and which heavy modules
+(openai, pandas, numpy, the Google discovery client, ...) were loaded. --json writes the
+results for CI to track, and --max-ms makes the run fail when a target gets slower than that.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules that should only be loaded by the command or backend that needs them
+HEAVY_MODULES = ['openai', 'pandas', 'numpy', 'googleapiclient.discovery', 'google_auth_oauthlib', 'requests',
+                 'tiktoken', 'streamlit']
+
+# (name, working directory, code run in a fresh interpreter)
+IMPORT_TARGETS = [
+    ('import email_agents.email_agent', ROOT, 'import email_agents.email_agent'),
+    ('import integration.gmail_integration', ROOT, 'import integration.gmail_integration'),
+    ('import utilities.model_cascade', ROOT, 'import utilities.model_cascade'),
+    ('import contact_agent.main', ROOT, 'import contact_agent.main'),
+]
+COMMAND_TARGETS = [
+    ('main.py --help', ROOT, ['main.py', '--help']),
+    ('contact_agent/main.py --help', os.path.join(ROOT, 'contact_agent'), ['main.py', '--help']),
+]
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+def time_import(cwd, code):
+    output = subprocess.run([sys.executable, '-c', PROBE.format(code=code, heavy=HEAVY_MODULES)], cwd=cwd,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def time_command(cwd, args):
+    """Run a script as __main__ with the given arguments; argparse's --help exits, which ends the timing."""
+    probe = ('import runpy\nsys.argv = {args!r}\n'
+             'try:\n    runpy.run_path({path!r}, run_name="__main__")\nexcept SystemExit:\n    pass').format(
+        args=args, path=os.path.join(cwd, args[0]))
+    return time_import(cwd, probe)
+
+def run(repeat):
+    results = []
+    targets = [(name, lambda cwd=cwd, code=code: time_import(cwd, code)) for name, cwd, code in IMPORT_TARGETS]
+    targets += [(name, lambda cwd=cwd, args=args: time_command(cwd, args)) for name, cwd, args in COMMAND_TARGETS]
+    for name, measure in targets:
+        runs = [measure() for _ in range(repeat)]
+        results.append({
+            'target': name,
+            'median_ms': round(statistics.median(result['seconds'] for result in runs) * 1000, 1),
+            'heavy_modules': runs[-1]['heavy'],
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure agent startup time.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per target (default: 5)')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    parser.add_argument('--max-ms', type=float, default=None, help='Exit with status 1 if a target is slower than this')
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(f"{'target':<40} {'median ms':>10}  heavy modules loaded")
+    for result in results:
+        print(f"{result['target']:<40} {result['median_ms']:>10.1f}  {', '.join(result['heavy_modules']) or '-'}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.max_ms is not None:
+        slow = [result['target'] for result in results if result['median_ms'] > args.max_ms]
+        if slow:
+            print(f"Slower than {args.max_ms:.0f} ms: {', '.join(slow)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark message body extraction on large synthetic emails.
+
+Run from the repository root:
+
+    python benchmarks/bench_message_parser.py
+
+For each fixture it reports the time to extract the body with the default token
+budget and without any budget, and the approximate prompt tokens compared with
+sending the raw base64 data (what the agent used to send).
+"""
+import base64
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utilities import message_parser
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode()
+
+def text_part(mime_type, text, filename=''):
+    return {'mimeType': mime_type, 'filename': filename, 'headers': [], 'body': {'data': encode(text)}}
+
+def long_thread(replies=2000):
+    """A plain-text reply thread where every reply quotes the previous ones."""
+    lines = ["Thanks, the numbers look right. Let's ship it on Friday."]
+    for i in range(replies):
+        lines.append(f"On Mon, Oct {i % 28 + 1}, 2024 at 9:{i % 60:02d} AM Person {i} <p{i}@example.com> wrote:")
+        lines.append("> " + "Previous message content that keeps getting quoted. " * 3)
+    return {'payload': text_part('text/plain', '\n'.join(lines))}
+
+def html_newsletter(items=5000):
+    """An HTML-only newsletter with inline styles and tracking scripts."""
+    rows = ''.join(
+        f'<tr><td style="padding:8px;font-family:Arial"><a href="https://example.com/{i}?utm_source=x">'
+        f'Story number {i}</a><p>Summary of story {i} &amp; more details.</p></td></tr>'
+        for i in range(items)
+    )
+    html = f'<html><head><style>{"td{color:#333}" * 500}</style></head><body><table>{rows}</table><script>track()</script></body></html>'
+    return {'payload': text_part('text/html', html)}
+
+def with_attachment(size_mb=10):
+    """A short nested multipart email with a large attachment."""
+    return {'payload': {'mimeType': 'multipart/mixed', 'parts': [
+        {'mimeType': 'multipart/alternative', 'parts': [
+            text_part('text/plain', 'Please find the report attached.'),
+            text_part('text/html', '<p>Please find the report attached.</p>'),
+        ]},
+        text_part('application/pdf', 'x' * (size_mb * 1024 * 1024), filename='report.pdf'),
+    ]}}
+
+FIXTURES = {
+    'long reply thread': long_thread,
+    'HTML newsletter': html_newsletter,
+    '10 MB attachment': with_attachment,
+}
+
+def raw_base64_size(email_data):
+    """Size of the data the old implementation sent: the first top-level text/plain part, undecoded."""
+    for part in email_data['payload'].get('parts', []):
+        if part['mimeType'] == 'text/plain':
+            return len(part['body'].get('data', ''))
+    return 0
+
+def main(repeat=5):
+    print(f"{'fixture':<20} {'encoded KB':>10} {'budget ms':>10} {'full ms':>10} {'old tokens':>11} {'new tokens':>11}")
+    for name, build in FIXTURES.items():
+        email_data = build()
+        encoded = sum(len(part.get('body', {}).get('data', '')) for part in message_parser.iter_parts(email_data['payload']))
+        budget = min(timeit.repeat(lambda: message_parser.extract_body(email_data), number=1, repeat=repeat))
+        full = min(timeit.repeat(lambda: message_parser.extract_body(email_data, max_tokens=None), number=1, repeat=repeat))
+        body = message_parser.extract_body(email_data)
+        old_tokens = raw_base64_size(email_data) // message_parser.CHARS_PER_TOKEN
+        new_tokens = len(body) // message_parser.CHARS_PER_TOKEN
+        print(f"{name:<20} {encoded / 1024:>10.0f} {budget * 1000:>10.2f} {full * 1000:>10.2f} {old_tokens:>11} {new_tokens:>11}")
+
+if __name__ == '__main__':
+    main()
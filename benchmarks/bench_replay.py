@@ -0,0 +1,334 @@
+"""Replay a mailbox through EmailAgent offline, against a fake Gmail service and a fake model.
+
+Run from the repository root:
+
+    python benchmarks/bench_replay.py [--messages N] [--gmail-latency S] [--llm-latency S] ...
+
+The mailbox is synthetic (thousands of messages with realistic MIME structures and sizes) or
+a recording: --mailbox reads one Gmail API message (format=full) per line, --save-mailbox
+writes the synthetic one in that format, and --record captures real messages from your
+Gmail account (the only option that uses the network). The agent runs the real rules,
+prompt building, batching, retries and bulk actions; only the Gmail HTTP layer and the
+model are fakes, with configurable latency and error rates. It reports emails/sec,
+p50/p99 per-email latency (from fetch to applied action), API calls per email, and
+peak memory.
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'tests'))
+
+from email_agents.email_agent import EmailAgent
+from integration.gmail_integration import GmailIntegration
+from integration.sync_state import SyncState
+from utilities.llm_backends import LLMBackend
+from utilities.llm_helper import DEFAULT_BATCH_SIZE, LLMHelper
+from utilities.metrics import Metrics
+from utilities.resilience import ResilientBackend, RetryPolicy
+from utilities.storage import Storage
+from fake_gmail import FakeGmailService
+
+MODEL = 'replay-model'
+# Retries back off for milliseconds instead of seconds, so injected errors cost retries, not sleeps
+FAST_RETRIES = RetryPolicy(max_attempts=5, base_delay=0.01, max_delay=0.1)
+
+# Synthetic mailbox ---------------------------------------------------------------------------
+
+WORDS = ('meeting invoice update report project review schedule budget proposal contract launch customer '
+         'feedback design release roadmap quarter team hiring offer renewal support ticket agenda notes').split()
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode()
+
+def body_text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+def html_text(rng, size):
+    rows = []
+    length = 0
+    while length < size:
+        row = f'<tr><td style="padding:8px;font-family:Arial"><a href="https://example.com/{rng.randrange(10**6)}">' \
+              f'{body_text(rng, 60)}</a></td></tr>'
+        rows.append(row)
+        length += len(row)
+    return f'<html><head><style>td {{color: #333}}</style></head><body><table>{"".join(rows)}</table></body></html>'
+
+def part(mime_type, text):
+    return {'mimeType': mime_type, 'filename': '', 'headers': [], 'body': {'size': len(text), 'data': encode(text)}}
+
+def synthetic_message(rng, index, ignored_senders):
+    """One message: plain text, multipart/alternative, HTML newsletter or with an attachment.
+
+    Body sizes follow a log-normal distribution (median about 3 KB, long tail into hundreds of KB).
+    """
+    size = min(int(rng.lognormvariate(8.0, 1.2)), 500000)
+    kind = rng.random()
+    sender = f'Person {index % 300} <person{index % 300}@company{index % 40}.com>'
+    to = 'me@example.com'
+    cc = None
+    subject = f'{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} #{index % 500}'
+
+    if kind < 0.25:
+        payload = {'mimeType': 'text/html', 'body': {'size': size, 'data': encode(html_text(rng, size))}}
+        sender = f'Newsletter {index % 20} <news@newsletter{index % 20}.example>'
+    elif kind < 0.65:
+        text = body_text(rng, size)
+        payload = {'mimeType': 'multipart/alternative', 'parts': [part('text/plain', text), part('text/html', f'<p>{text}</p>')]}
+    elif kind < 0.8:
+        payload = {'mimeType': 'multipart/mixed', 'parts': [
+            part('text/plain', body_text(rng, size)),
+            # Gmail's format=full returns an attachment ID, never the attachment data
+            {'mimeType': 'application/pdf', 'filename': 'report.pdf', 'headers': [],
+             'body': {'size': rng.randrange(10**5, 5 * 10**6), 'attachmentId': f'att{index}'}},
+        ]}
+    else:
+        payload = part('text/plain', body_text(rng, size))
+
+    if ignored_senders and rng.random() < 0.05:
+        sender = rng.choice(ignored_senders)
+    elif rng.random() < 0.1:
+        # Only CC'd: answered by the address checks without the LLM
+        to, cc = 'team@example.com', 'me@example.com'
+
+    headers = [{'name': 'Subject', 'value': subject}, {'name': 'From', 'value': sender}, {'name': 'To', 'value': to},
+               {'name': 'Message-ID', 'value': f'<{index}@replay.example>'}]
+    if cc:
+        headers.append({'name': 'Cc', 'value': cc})
+    payload = dict(payload, headers=headers)
+    return {'id': f'r{index:07d}', 'threadId': f't{index // 3:07d}', 'labelIds': ['INBOX', 'UNREAD'], 'payload': payload,
+            'sizeEstimate': size}
+
+def synthetic_mailbox(count, seed=0):
+    rng = random.Random(seed)
+    ignored_senders = []
+    if os.path.exists('training_data.json'):
+        with open('training_data.json') as file:
+            ignored_senders = json.load(file).get('always_ignore_senders', [])
+    return [synthetic_message(rng, index, ignored_senders) for index in range(count)]
+
+def load_mailbox(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def save_mailbox(messages, path):
+    with open(path, 'w') as file:
+        for message in messages:
+            file.write(json.dumps(message) + '\n')
+
+def record_mailbox(path, query, limit):
+    """Save real messages (format=full) from your Gmail account; this one signs in and uses the network."""
+    gmail = GmailIntegration()
+    message_ids = []
+    for message in gmail.iter_messages(query=query):
+        message_ids.append(message['id'])
+        if len(message_ids) >= limit:
+            break
+    messages = [message for message in gmail.get_messages(message_ids) if message is not None]
+    save_mailbox(messages, path)
+    print(f"Recorded {len(messages)} messages to {path}.")
+
+# Fake model --------------------------------------------------------------------------------
+
+class ServiceUnavailable(Exception):
+    """Looks like an openai.APIStatusError 503 to the resilience layer, so it is retried."""
+    status_code = 503
+
+class FakeModelBackend(LLMBackend):
+    """Answers batched classification prompts after a delay, failing a share of the requests with a 503."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def complete(self, system_prompt, user_prompt, max_tokens=None, stop_when=None):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise ServiceUnavailable('injected model error')
+
+        answers = []
+        for line in user_prompt.split('\n'):
+            if not line.startswith('{"id"'):
+                continue
+            email = json.loads(line)
+            # Deterministic answers, spread over the three actions
+            action = ('archive', 'reply', 'ignore')[sum(map(ord, email.get('subject', ''))) % 3]
+            answers.append({'id': email['id'], 'action': action, 'confidence': 0.9, 'explanation': 'Replayed answer'})
+        text = json.dumps(answers)
+        return text, ((len(system_prompt) + len(user_prompt)) // 4, len(text) // 4)
+
+def create_llm_helper(config_dir, latency, error_rate, batch_size, metrics):
+    config_path = os.path.join(config_dir, 'OAI_CONFIG_LIST')
+    with open(config_path, 'w') as file:
+        # A local model, so no price and no OpenAI client
+        json.dump([{'model': MODEL, 'api_type': 'local', 'base_url': 'http://127.0.0.1:9',
+                    'requests_per_minute': 10**9, 'tokens_per_minute': 10**12}], file)
+    helper = LLMHelper(model_choice=MODEL, config_path=config_path, max_batch_size=batch_size, metrics=metrics,
+                       backend=ResilientBackend(MODEL, retry_policy=FAST_RETRIES))
+    helper.model_backend.close()
+    helper.model_backend = FakeModelBackend(latency, error_rate)
+    return helper
+
+# Replay ------------------------------------------------------------------------------------
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def replay(messages, args):
+    """Run the agent once over the mailbox; return the measurements."""
+    service = FakeGmailService(messages)
+    service.latency = args.gmail_latency
+    if args.gmail_error_rate:
+        service.error_rates = {'messages.get': args.gmail_error_rate, 'messages.batchModify': args.gmail_error_rate}
+    backend = None if args.gmail_quota else ResilientBackend('gmail', retry_policy=FAST_RETRIES)
+    metrics = Metrics()
+    gmail = GmailIntegration(service=service, backend=backend, metrics=metrics)
+    if backend is not None:
+        gmail.backend.retry_policy = FAST_RETRIES
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        llm_helper = create_llm_helper(tmpdir, args.llm_latency, args.llm_error_rate, args.llm_batch_size, metrics)
+        storage = Storage(':memory:')
+        sync_state = SyncState(':memory:') if args.sync else None
+        local_classifier_options = {} if args.local_classifier else None
+        agent = EmailAgent(gmail=gmail, llm_helper=llm_helper, concurrency=args.concurrency, storage=storage,
+                           sync_state=sync_state, local_classifier_options=local_classifier_options, metrics=metrics,
+                           log_level=logging.WARNING)
+
+        # Per-email latency: from the end of the batch fetch that returned the email to its applied action
+        fetched_at = {}
+        latencies = []
+        fetch_batch, process_email = agent.fetch_batch, agent.process_email
+
+        def timed_fetch_batch(message_ids):
+            emails = list(fetch_batch(message_ids))
+            now = time.perf_counter()
+            for message_id, _ in emails:
+                fetched_at[message_id] = now
+            return emails
+
+        def timed_process_email(message_id, email_data, suggestion=None):
+            process_email(message_id, email_data, suggestion)
+            latencies.append(time.perf_counter() - fetched_at.pop(message_id))
+
+        agent.fetch_batch, agent.process_email = timed_fetch_batch, timed_process_email
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        started = time.perf_counter()
+        agent.process_emails()
+        elapsed = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+
+        llm_requests = llm_helper.model_backend.requests
+        llm_helper.close()
+        storage.close()
+        if sync_state is not None:
+            sync_state.close()
+
+    snapshot = metrics.snapshot()
+    actions = {}
+    for name, labels, value in snapshot['counters']:
+        if name == 'emails':
+            actions[labels['action']] = actions.get(labels['action'], 0) + value
+    emails = len(latencies)
+    return {
+        'emails': emails,
+        'seconds': elapsed,
+        'emails_per_second': emails / elapsed if elapsed else 0.0,
+        'latency_p50_ms': percentile(latencies, 0.5) * 1000,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+        'gmail_http_requests_per_email': service.http_requests / emails if emails else 0.0,
+        'gmail_calls_per_email': len(service.calls) / emails if emails else 0.0,
+        'llm_requests_per_email': llm_requests / emails if emails else 0.0,
+        'traced_peak_mb': traced_peak / 1024 / 1024 if traced_peak is not None else None,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': {stage: {'count': data['count'], 'p50_ms': data['p50'] * 1000, 'p95_ms': data['p95'] * 1000}
+                   for stage, data in snapshot['stages'].items()},
+        'actions': actions,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a mailbox through EmailAgent with fake Gmail and LLM backends.')
+    parser.add_argument('--messages', type=int, default=2000, help='Size of the synthetic mailbox (default: 2000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic mailbox')
+    parser.add_argument('--mailbox', help='Replay a recorded mailbox (JSON lines of Gmail messages) instead')
+    parser.add_argument('--save-mailbox', help='Write the synthetic mailbox to this file and exit')
+    parser.add_argument('--record', help='Record real messages from Gmail to this file and exit (uses the network)')
+    parser.add_argument('--record-query', default='is:unread', help='Gmail query of the messages to record')
+    parser.add_argument('--record-limit', type=int, default=1000, help='Most messages recorded')
+    parser.add_argument('--gmail-latency', type=float, default=0.0, help='Seconds per Gmail HTTP round trip')
+    parser.add_argument('--gmail-error-rate', type=float, default=0.0, help='Share of messages.get/batchModify calls failing with 503')
+    parser.add_argument('--gmail-quota', action='store_true', help='Apply the real per-user Gmail quota (250 units/s)')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='Seconds per model request')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Share of model requests failing with 503')
+    parser.add_argument('--llm-batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Emails per model request')
+    parser.add_argument('--concurrency', type=int, default=1, help='Model requests in flight')
+    parser.add_argument('--sync', action='store_true', help='Use an (in-memory) processed-message ledger')
+    parser.add_argument('--local-classifier', action='store_true', help='Enable the local classifier')
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false',
+                        help='Do not trace Python allocations (faster, only the process max RSS is reported)')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.record:
+        record_mailbox(args.record, args.record_query, args.record_limit)
+        return
+    messages = load_mailbox(args.mailbox) if args.mailbox else synthetic_mailbox(args.messages, args.seed)
+    if args.save_mailbox:
+        save_mailbox(messages, args.save_mailbox)
+        print(f"Saved {len(messages)} messages to {args.save_mailbox}.")
+        return
+
+    mime_mb = sum(len(json.dumps(message)) for message in messages) / 1024 / 1024
+    print(f"Replaying {len(messages)} messages ({mime_mb:.1f} MB of message resources)...")
+    results = replay(messages, args)
+
+    print(f"{'emails':<32} {results['emails']}")
+    print(f"{'emails/sec':<32} {results['emails_per_second']:.1f}")
+    print(f"{'per-email latency p50 / p99 ms':<32} {results['latency_p50_ms']:.1f} / {results['latency_p99_ms']:.1f}")
+    print(f"{'Gmail HTTP requests per email':<32} {results['gmail_http_requests_per_email']:.3f}")
+    print(f"{'Gmail API calls per email':<32} {results['gmail_calls_per_email']:.3f}")
+    print(f"{'LLM requests per email':<32} {results['llm_requests_per_email']:.3f}")
+    if results['traced_peak_mb'] is not None:
+        print(f"{'peak traced memory MB':<32} {results['traced_peak_mb']:.1f}")
+    print(f"{'process max RSS MB':<32} {results['max_rss_mb']:.1f}")
+    print(f"{'actions':<32} {', '.join(f'{action} {count}' for action, count in sorted(results['actions'].items()))}")
+    for stage, data in results['stages'].items():
+        print(f"  {stage:<30} {data['count']:>7} calls, p50 {data['p50_ms']:.1f} ms, p95 {data['p95_ms']:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Table view of the contacts for the UI: search, pages and the edits to save."""
+import math
+import pandas as pd
+
+# Columns the UI shows; only EDITABLE_COLUMNS can be changed there
+TABLE_COLUMNS = ['name', 'email', 'organization', 'category', 'vip', 'last_interaction']
+EDITABLE_COLUMNS = ['category', 'vip']
+DEFAULT_PAGE_SIZE = 50
+
+def contacts_frame(contacts):
+    """One row per contact, indexed by contact ID and sorted by name."""
+    frame = pd.DataFrame.from_dict(contacts, orient='index').reindex(
+        columns=['first_name', 'last_name', 'nickname', 'email', 'organization', 'category', 'vip', 'last_interaction'])
+    text = frame[['first_name', 'last_name', 'nickname', 'email', 'organization']].fillna('').astype(str)
+    name = (text['first_name'] + ' ' + text['last_name']).str.strip()
+    name = name.where(name != '', text['nickname']).where(lambda value: value != '', text['email'])
+    frame = frame.assign(name=name, email=text['email'], organization=text['organization'],
+                         vip=frame['vip'].fillna(False).astype(bool))
+    frame['category'] = frame['category'].astype(object).where(frame['category'].notna(), None)
+    frame['last_interaction'] = frame['last_interaction'].astype(object).where(frame['last_interaction'].notna(), None)
+    return frame[TABLE_COLUMNS].sort_values('name', kind='stable')
+
+def filter_contacts(frame, search='', category=None):
+    """Rows whose name, e-mail or organization contains search (case-insensitive), in the category if given."""
+    if search:
+        text = frame['name'] + '\n' + frame['email'] + '\n' + frame['organization']
+        frame = frame[text.str.contains(search, case=False, regex=False)]
+    if category:
+        frame = frame[frame['category'] == category]
+    return frame
+
+def page_count(frame, page_size=DEFAULT_PAGE_SIZE):
+    return max(1, math.ceil(len(frame) / page_size))
+
+def get_page(frame, page, page_size=DEFAULT_PAGE_SIZE):
+    """Rows of a page, numbered from 1."""
+    start = (page - 1) * page_size
+    return frame.iloc[start:start + page_size]
+
+def changed_rows(original, edited):
+    """Return {contact_id: {column: value}} for the editable cells that differ between two versions of a page."""
+    changes = {}
+    for column in EDITABLE_COLUMNS:
+        before = original[column].reindex(edited.index)
+        after = edited[column]
+        # None and NaN (an emptied cell) both mean "no value"
+        differs = (before != after) & ~(before.isna() & after.isna())
+        for contact_id, value in after[differs].items():
+            changes.setdefault(contact_id, {})[column] = None if pd.isna(value) else value
+    return changes
+
+def apply_changes(contacts, changes):
+    """Return the changed contacts (copies) with the edits applied, ready to be saved."""
+    updated = {}
+    for contact_id, values in changes.items():
+        contact = dict(contacts[contact_id])
+        for column, value in values.items():
+            contact[column] = bool(value) if column == 'vip' else value
+        updated[contact_id] = contact
+    return updated
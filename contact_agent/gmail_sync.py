@@ -0,0 +1,165 @@
+"""Incremental sync of contacts' last interaction from Gmail message metadata."""
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from integration.gmail_integration import HistoryExpiredError
+from utilities.address_index import normalize_address, parse_addresses
+
+# Only these headers are fetched (format='metadata'), never the message bodies
+SYNC_HEADERS = ['From', 'To', 'Cc', 'Date']
+SYNC_FIELDS = 'id,internalDate,payload/headers'
+# Message IDs listed, fetched and saved per step; a step is the unit the first sync resumes from
+SYNC_PAGE_SIZE = 500
+# Sent and received mail; chats are not interactions with a contact's e-mail address
+SYNC_QUERY = '-in:chats'
+# When the history has expired, mail is rescanned from this long before the last sync
+RESCAN_MARGIN_SECONDS = 24 * 60 * 60
+
+# Sync checkpoints in the contact store's state table
+HISTORY_ID_KEY = 'gmail_sync_history_id'
+SYNCED_AT_KEY = 'gmail_sync_synced_at'
+FULL_SYNC_HISTORY_ID_KEY = 'gmail_sync_full_history_id'
+FULL_SYNC_PAGE_TOKEN_KEY = 'gmail_sync_full_page_token'
+FULL_SYNC_QUERY_KEY = 'gmail_sync_full_query'
+
+def message_time(message):
+    """When a message was sent or received, as a naive local datetime (like the other contact timestamps)."""
+    if message.get('internalDate'):
+        return datetime.fromtimestamp(int(message['internalDate']) / 1000)
+    for header in message.get('payload', {}).get('headers', []):
+        if header['name'].lower() == 'date':
+            try:
+                return parsedate_to_datetime(header['value']).astimezone().replace(tzinfo=None)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+def message_addresses(message):
+    """Lowercased addresses of the From, To and Cc headers."""
+    values = [header['value'] for header in message.get('payload', {}).get('headers', [])
+              if header['name'].lower() in ('from', 'to', 'cc')]
+    return {address for _, address in parse_addresses(*values)}
+
+class ContactIndex:
+    """Maps lowercased e-mail addresses to the IDs of the contacts that use them."""
+
+    def __init__(self, contacts):
+        self.contact_ids = {}
+        for contact_id, contact in contacts.items():
+            address = normalize_address(contact.get('email'))
+            if address:
+                self.contact_ids.setdefault(address, []).append(contact_id)
+
+    def lookup(self, addresses):
+        return [contact_id for address in addresses for contact_id in self.contact_ids.get(address, [])]
+
+class GmailContactSync:
+    """Updates contacts' last_interaction from the metadata of Gmail messages, only reading messages not seen yet.
+
+    The first sync lists the whole mailbox page by page and stores the next page token after each page,
+    so an interrupted first sync continues where it stopped. Later syncs read the mailbox history since
+    the last checkpoint.
+    """
+
+    def __init__(self, gmail, storage, sla_engine=None, page_size=SYNC_PAGE_SIZE, query=SYNC_QUERY):
+        self.gmail = gmail
+        self.storage = storage
+        # Saving through the SLA engine keeps the contacts' due dates in step with their last interaction
+        self.sla_engine = sla_engine
+        self.page_size = page_size
+        self.query = query
+        self.contacts = None
+        self.index = None
+
+    def sync(self):
+        """Run a first or incremental sync; returns (messages read, contacts updated)."""
+        self.contacts = self.storage.load_contacts()
+        self.index = ContactIndex(self.contacts)
+        history_id = self.storage.get_state(HISTORY_ID_KEY)
+        if history_id:
+            try:
+                return self.sync_history(history_id)
+            except HistoryExpiredError:
+                print(f"Gmail history since {history_id} has expired, rescanning mail since the last sync.")
+                synced_at = self.storage.get_state(SYNCED_AT_KEY)
+                self.storage.set_state(HISTORY_ID_KEY, '')
+                if synced_at:
+                    query = f"{self.query} after:{int(float(synced_at)) - RESCAN_MARGIN_SECONDS}"
+                else:
+                    query = self.query
+                return self.full_sync(query)
+        return self.full_sync(self.query)
+
+    def full_sync(self, query):
+        """List matching messages page by page, checkpointing the page token after each page."""
+        history_id = self.storage.get_state(FULL_SYNC_HISTORY_ID_KEY)
+        page_token = None
+        if history_id:
+            # Page tokens only make sense for the query they were listed with
+            query = self.storage.get_state(FULL_SYNC_QUERY_KEY) or query
+            page_token = self.storage.get_state(FULL_SYNC_PAGE_TOKEN_KEY)
+            if page_token:
+                print("Resuming the interrupted Gmail contact sync.")
+        else:
+            # Messages added while this sync runs are picked up by the next incremental sync
+            history_id = self.gmail.get_profile()['historyId']
+            self.storage.set_state(FULL_SYNC_HISTORY_ID_KEY, history_id)
+            self.storage.set_state(FULL_SYNC_QUERY_KEY, query)
+
+        messages = updated = 0
+        while True:
+            message_ids, page_token = self.gmail.list_message_page(query, page_token or None, self.page_size)
+            updated += self.apply_messages(message_ids)
+            messages += len(message_ids)
+            if not page_token:
+                break
+            self.storage.set_state(FULL_SYNC_PAGE_TOKEN_KEY, page_token)
+
+        self.finish(history_id)
+        for key in (FULL_SYNC_HISTORY_ID_KEY, FULL_SYNC_PAGE_TOKEN_KEY, FULL_SYNC_QUERY_KEY):
+            self.storage.set_state(key, '')
+        return messages, updated
+
+    def sync_history(self, history_id):
+        """Read only the messages added since the last checkpoint."""
+        next_history_id = self.gmail.get_profile()['historyId']
+        message_ids = self.gmail.list_added_message_ids(history_id, label_id=None)
+        updated = 0
+        for start in range(0, len(message_ids), self.page_size):
+            updated += self.apply_messages(message_ids[start:start + self.page_size])
+        self.finish(next_history_id)
+        return len(message_ids), updated
+
+    def finish(self, history_id):
+        self.storage.set_state(HISTORY_ID_KEY, str(history_id))
+        self.storage.set_state(SYNCED_AT_KEY, str(datetime.now().timestamp()))
+
+    def apply_messages(self, message_ids):
+        """Fetch the metadata of messages in batches and save the contacts whose last interaction moved forward."""
+        if not message_ids:
+            return 0
+        messages = self.gmail.get_messages(message_ids, format='metadata', fields=SYNC_FIELDS, metadata_headers=SYNC_HEADERS)
+
+        latest = {}
+        for message in messages:
+            if message is None:
+                continue
+            sent_at = message_time(message)
+            if sent_at is None:
+                continue
+            for contact_id in self.index.lookup(message_addresses(message)):
+                if contact_id not in latest or sent_at > latest[contact_id]:
+                    latest[contact_id] = sent_at
+
+        changed = {}
+        for contact_id, sent_at in latest.items():
+            contact = self.contacts[contact_id]
+            last_interaction = contact.get('last_interaction')
+            if not last_interaction or datetime.fromisoformat(last_interaction) < sent_at:
+                contact['last_interaction'] = sent_at.isoformat()
+                changed[contact_id] = contact
+        if changed:
+            if self.sla_engine is not None:
+                self.sla_engine.update_contacts(changed)
+            else:
+                self.storage.save_contacts(changed)
+        return len(changed)
@@ -1,109 +1,98 @@
+import argparse
 import json
 import os
-from datetime import datetime, timedelta
-import pandas as pd
+import sys
 
-# Load settings
-with open('settings.json', 'r') as file:
-    settings = json.load(file)
+# Make the repository's utilities importable when running from contact_agent/, and this
+# directory's modules when imported from elsewhere (tests, benchmarks)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from utilities.storage import Storage
+from sla import SLAEngine, contact_name, sla_days
+from gmail_sync import GmailContactSync
 
-# Load contact data (local JSON)
-DATA_PATH = 'data/contact_data.json'
+# Settings, loaded on first use so importing this module (or --help) does not need them
+SETTINGS_PATH = 'settings.json'
+_settings = None
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        with open(SETTINGS_PATH, 'r') as file:
+            _settings = json.load(file)
+    return _settings
+
+# Contact data (local SQLite store, imported once from the former contact_data.json)
+DATA_PATH = 'data/contact_data.db'
+LEGACY_DATA_PATH = 'data/contact_data.json'
+
+_storage = None
+_sla_engine = None
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        os.makedirs(os.path.dirname(DATA_PATH), exist_ok=True)
+        _storage = Storage(DATA_PATH)
+        if _storage.migrate_contacts(LEGACY_DATA_PATH):
+            SLAEngine(_storage, get_settings()).recompute()
+    return _storage
+
+def get_sla_engine():
+    global _sla_engine
+    if _sla_engine is None:
+        _sla_engine = SLAEngine(get_storage(), get_settings())
+    return _sla_engine
 
 def load_contacts():
-    # Check if file exists and is non-empty
-    if os.path.exists(DATA_PATH):
-        with open(DATA_PATH, 'r') as file:
-            try:
-                data = json.load(file)
-                return data
-            except json.JSONDecodeError:
-                print("Warning: contact_data.json is empty or corrupted. Initializing a new contact data file.")
-                return {}
-    return {}
+    return get_storage().load_contacts()
 
 
 def save_contacts(contacts):
-    os.makedirs(os.path.dirname(DATA_PATH), exist_ok=True)
-    with open(DATA_PATH, 'w') as file:
-        json.dump(contacts, file)
+    # Upserts the given contacts and their SLA due dates in one transaction, contacts that are not passed are kept
+    get_sla_engine().update_contacts(contacts)
 
-# Updated function for importing contacts from Gmail export format
+# Import contacts from a Google Contacts CSV export (see contact_import.py)
 def import_contacts_from_csv(csv_path='contacts.csv'):
     if not os.path.exists(csv_path):
         print("CSV file not found. Please upload a CSV to start.")
-        return {}
-    
-    contacts = load_contacts()
-    new_contacts = pd.read_csv(csv_path)
-    
-    for _, row in new_contacts.iterrows():
-        # Generate a unique contact ID (can be customized)
-        contact_id = f"{row['First Name']}_{row['Last Name']}_{row['E-mail 1 - Value']}"
-        
-        # Skip contacts without at least one email
-        email = row.get('E-mail 1 - Value') or row.get('E-mail 2 - Value')
-        if pd.isna(email):
-            continue
-        
-        # Add contact if it doesn't exist already
-        if contact_id not in contacts:
-            contacts[contact_id] = {
-                "first_name": row['First Name'] if not pd.isna(row['First Name']) else "",
-                "middle_name": row['Middle Name'] if not pd.isna(row['Middle Name']) else "",
-                "last_name": row['Last Name'] if not pd.isna(row['Last Name']) else "",
-                "nickname": row['Nickname'] if not pd.isna(row['Nickname']) else "",
-                "organization": row['Organization Name'] if not pd.isna(row['Organization Name']) else "",
-                "title": row['Organization Title'] if not pd.isna(row['Organization Title']) else "",
-                "email": email,
-                "category": None,
-                "vip": False,
-                "last_interaction": None,
-                "created": datetime.now().isoformat()
-            }
-    
-    save_contacts(contacts)
-    return contacts
+        return 0
+
+    # pandas is only loaded when there is an export to import
+    from contact_import import import_contacts
+    added = import_contacts(csv_path, get_storage())
+    print(f"Imported {added} new contacts from {csv_path}.")
+    return added
 
 # SLA and notifications
 def get_sla_for_contact(contact):
-    category = contact.get("category")
-    if contact.get("vip"):
-        return settings["categories"].get(category, {}).get("vip_sla", 30)
-    return settings["categories"].get(category, {}).get("sla", 60)
+    return sla_days(contact, get_settings())
 
 def check_sla_notifications():
-    contacts = load_contacts()
-    today = datetime.now()
-    notifications = []
+    # Only the due contacts are read, through the due-date index (see sla.py)
+    return [(contact_name(contact), get_sla_for_contact(contact))
+            for contact_id, contact, due_at in get_sla_engine().due_contacts()]
 
-    for contact_id, contact in contacts.items():
-        last_interaction = datetime.fromisoformat(contact['last_interaction']) if contact['last_interaction'] else None
-        sla_days = get_sla_for_contact(contact)
-        if last_interaction and (today - last_interaction).days >= sla_days:
-            notifications.append((contact['name'], sla_days))
-
-    return notifications
-
-# Placeholder for future incremental data fetching
-def fetch_incremental_updates():
-    last_run_path = "data/last_run.txt"
-    last_run = None
-
-    if os.path.exists(last_run_path):
-        with open(last_run_path, "r") as file:
-            last_run = datetime.fromisoformat(file.read().strip())
-    
-    # Update last run date
-    with open(last_run_path, "w") as file:
-        file.write(datetime.now().isoformat())
-
-    return last_run
+# Update last interactions from Gmail (see gmail_sync.py); the first run scans the mailbox, later runs only new mail
+def fetch_incremental_updates(gmail=None):
+    if gmail is None:
+        from integration.gmail_integration import GmailIntegration
+        gmail = GmailIntegration(storage=get_storage())
+    messages, updated = GmailContactSync(gmail, get_storage(), get_sla_engine()).sync()
+    print(f"Read {messages} Gmail messages, updated the last interaction of {updated} contacts.")
+    return updated
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import contacts and list the ones whose SLA is reached.")
+    parser.add_argument('--sync-gmail', action='store_true', help="Update last interactions from Gmail first")
+    args = parser.parse_args()
+
     # Initial import (if CSV provided)
     import_contacts_from_csv()
 
+    if args.sync_gmail:
+        fetch_incremental_updates()
+
     # Check for SLA notifications
     notifications = check_sla_notifications()
     for contact, sla in notifications:
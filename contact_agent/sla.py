@@ -0,0 +1,78 @@
+"""SLA due dates of contacts, kept in an index so reminders only read the contacts that are due."""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+# SLA (days without interaction) when the contact's category does not set one
+DEFAULT_SLA_DAYS = 60
+DEFAULT_VIP_SLA_DAYS = 30
+# Due dates are stored as fixed-width text, so sorting the text sorts the dates
+DUE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Fingerprint of the SLA settings the stored due dates were computed with
+SETTINGS_STATE_KEY = 'sla_settings'
+
+def sla_days(contact, settings):
+    """Days without interaction after which the contact is due."""
+    category = settings['categories'].get(contact.get('category'), {})
+    if contact.get('vip'):
+        return category.get('vip_sla', DEFAULT_VIP_SLA_DAYS)
+    return category.get('sla', DEFAULT_SLA_DAYS)
+
+def contact_name(contact):
+    """First and last name, else nickname, else e-mail."""
+    name = f"{contact.get('first_name') or ''} {contact.get('last_name') or ''}".strip()
+    return name or contact.get('nickname') or contact.get('email') or ''
+
+def settings_fingerprint(settings):
+    return hashlib.sha256(json.dumps(settings['categories'], sort_keys=True).encode('utf-8')).hexdigest()
+
+class SLAEngine:
+    """Keeps each contact's due date (last interaction + SLA) in an indexed table of the contact store."""
+
+    def __init__(self, storage, settings):
+        self.storage = storage
+        # The settings dict is read on every call, so edits made in place (by the UI) are picked up
+        self.settings = settings
+
+    def due_date(self, contact):
+        """Due date of a contact as DUE_FORMAT text, or None if there was no interaction yet."""
+        if not contact.get('last_interaction'):
+            return None
+        last_interaction = datetime.fromisoformat(contact['last_interaction'])
+        return (last_interaction + timedelta(days=sla_days(contact, self.settings))).strftime(DUE_FORMAT)
+
+    def refresh(self):
+        """Recompute all due dates if the SLA settings changed since they were computed (or they never were)."""
+        fingerprint = settings_fingerprint(self.settings)
+        if self.storage.get_state(SETTINGS_STATE_KEY) != fingerprint:
+            self.recompute()
+            self.storage.set_state(SETTINGS_STATE_KEY, fingerprint)
+
+    def update_contacts(self, contacts):
+        """Save contacts and the due dates of these contacts only (after a category, VIP or interaction change)."""
+        self.refresh()
+        self.storage.save_contacts(contacts, {contact_id: self.due_date(contact) for contact_id, contact in contacts.items()})
+
+    def recompute(self, contacts=None):
+        """Recompute the due dates of all contacts with column operations; returns how many contacts have one."""
+        import pandas as pd
+
+        contacts = self.storage.load_contacts() if contacts is None else contacts
+        frame = pd.DataFrame.from_dict(contacts, orient='index').reindex(columns=['category', 'vip', 'last_interaction'])
+        categories = self.settings['categories']
+
+        regular = frame['category'].map({name: data.get('sla', DEFAULT_SLA_DAYS) for name, data in categories.items()})
+        vip = frame['category'].map({name: data.get('vip_sla', DEFAULT_VIP_SLA_DAYS) for name, data in categories.items()})
+        is_vip = frame['vip'].fillna(False).astype(bool)
+        days = vip.fillna(DEFAULT_VIP_SLA_DAYS).where(is_vip, regular.fillna(DEFAULT_SLA_DAYS))
+
+        last_interaction = pd.to_datetime(frame['last_interaction'], errors='coerce', format='ISO8601')
+        due = (last_interaction + pd.to_timedelta(days.astype(float), unit='D')).dropna()
+        rows = list(zip(due.index, due.dt.strftime(DUE_FORMAT)))
+        self.storage.replace_due_dates(rows)
+        return len(rows)
+
+    def due_contacts(self, now=None):
+        """Return (contact_id, contact, due_at) for the contacts whose SLA is reached, most overdue first."""
+        self.refresh()
+        return self.storage.due_contacts((now or datetime.now()).strftime(DUE_FORMAT))
@@ -1,37 +1,69 @@
 import streamlit as st
+import copy
 import json
-from datetime import datetime
-from main import load_contacts, save_contacts, settings
+from main import SETTINGS_PATH, get_settings, get_sla_engine, get_storage, load_contacts, save_contacts
+from contact_table import (DEFAULT_PAGE_SIZE, EDITABLE_COLUMNS, TABLE_COLUMNS, apply_changes, changed_rows,
+                           contacts_frame, filter_contacts, get_page, page_count)
 
-contacts = load_contacts()
+# Reloaded only when the store changed: version is bumped by other connections (the Gmail sync),
+# and the cache is cleared after this UI saves. cache_resource hands out the cached objects without
+# copying them, so they are never modified in place (see apply_changes).
+@st.cache_resource(show_spinner="Loading contacts...")
+def load_contact_table(version):
+    contacts = load_contacts()
+    return contacts, contacts_frame(contacts)
+
+contacts, table = load_contact_table(get_storage().data_version())
 
 st.title("Contact Management Agent")
 st.sidebar.header("Settings")
 
-# Modify settings
-for category, data in settings['categories'].items():
-    sla = st.sidebar.number_input(f"{category.capitalize()} SLA (days)", min_value=1, value=data['sla'])
-    vip_sla = st.sidebar.number_input(f"{category.capitalize()} VIP SLA (days)", min_value=1, value=data['vip_sla'])
-    settings['categories'][category]['sla'] = sla
-    settings['categories'][category]['vip_sla'] = vip_sla
+settings = get_settings()
+
+# Modify settings; settings.json is only written (and due dates recomputed) when a value changed
+edited_settings = copy.deepcopy(settings)
+for category, data in edited_settings['categories'].items():
+    data['sla'] = st.sidebar.number_input(f"{category.capitalize()} SLA (days)", min_value=1, value=data['sla'])
+    data['vip_sla'] = st.sidebar.number_input(f"{category.capitalize()} VIP SLA (days)", min_value=1, value=data['vip_sla'])
 
-# Save settings
-with open('settings.json', 'w') as file:
-    json.dump(settings, file)
+if edited_settings != settings:
+    settings.update(edited_settings)
+    with open(SETTINGS_PATH, 'w') as file:
+        json.dump(settings, file)
+    get_sla_engine().refresh()
+    st.sidebar.success("SLA settings saved.")
 
-# Display contacts for categorization
+# Display contacts for categorization, one page at a time
 st.subheader("Categorize Contacts")
-for contact_id, contact in contacts.items():
-    # Concatenate first name and last name for display
-    contact_name = f"{contact.get('first_name', '')} {contact.get('last_name', '')}".strip()
-    st.write(f"**{contact_name}** - Last interaction: {contact.get('last_interaction', 'N/A')}")
-    
-    category = st.selectbox("Category", options=list(settings['categories'].keys()), index=0, key=contact_id)
-    vip = st.checkbox("VIP", key=f"vip_{contact_id}")
-
-    contacts[contact_id]['category'] = category
-    contacts[contact_id]['vip'] = vip
-    contacts[contact_id]['last_interaction'] = datetime.now().isoformat()
-
-save_contacts(contacts)
-st.success("Contacts updated successfully.")
+categories = list(settings['categories'].keys())
+search_column, category_column, size_column = st.columns([3, 2, 1])
+search = search_column.text_input("Search", placeholder="Name, e-mail or organization")
+category_filter = category_column.selectbox("Category", options=[None] + categories,
+                                            format_func=lambda category: category or "All")
+page_size = size_column.selectbox("Per page", options=[DEFAULT_PAGE_SIZE, 100, 250], index=0)
+
+matching = filter_contacts(table, search, category_filter)
+pages = page_count(matching, page_size)
+page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+rows = get_page(matching, page, page_size)
+st.caption(f"{len(matching)} of {len(table)} contacts")
+
+# Cells start from the stored values; a new key per page/filter keeps edits from following the rows
+edited = st.data_editor(
+    rows,
+    key=f"contacts_{search}_{category_filter}_{page_size}_{page}",
+    disabled=[column for column in TABLE_COLUMNS if column not in EDITABLE_COLUMNS],
+    column_config={
+        'category': st.column_config.SelectboxColumn("Category", options=categories),
+        'vip': st.column_config.CheckboxColumn("VIP"),
+        'last_interaction': st.column_config.TextColumn("Last interaction"),
+    },
+    use_container_width=True,
+)
+
+# Only the edited rows are written, with their SLA due dates
+changes = changed_rows(rows, edited)
+if changes:
+    save_contacts(apply_changes(contacts, changes))
+    load_contact_table.clear()
+    st.success(f"Updated {len(changes)} contacts.")
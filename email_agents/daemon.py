@@ -0,0 +1,159 @@
+import base64
+import json
+import logging
+import queue
+import random
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default number of pending triggers; extra push notifications are coalesced into the pending ones
+DEFAULT_QUEUE_SIZE = 100
+# Upper bound for the backoff after consecutive failed runs (15 minutes)
+DEFAULT_MAX_BACKOFF = 900
+
+class PushHandler(BaseHTTPRequestHandler):
+    """Accepts Pub/Sub push deliveries on POST /push and reports status on GET /healthz."""
+
+    def do_POST(self):
+        if self.path != '/push':
+            self.send_response(404)
+            self.end_headers()
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            envelope = json.loads(self.rfile.read(length) or b'{}')
+            # Pub/Sub wraps the Gmail notification ({"emailAddress", "historyId"}) in base64
+            notification = json.loads(base64.b64decode(envelope['message']['data']))
+        except (ValueError, KeyError, TypeError):
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        self.server.agent_daemon.notify(f"push historyId={notification.get('historyId')}")
+        # Any 2xx acknowledges the message, so Pub/Sub does not redeliver it
+        self.send_response(204)
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path != '/healthz':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.agent_daemon.status()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the daemon's output to one line per run
+        pass
+
+class EmailAgentDaemon:
+    """Keeps an EmailAgent (and its Gmail service and LLM client) warm and runs it on a schedule.
+
+    A run is triggered every poll_interval seconds and whenever a push notification
+    arrives. Triggers go through a bounded queue and a burst of them is handled by
+    a single run, since one incremental sync picks up every new message.
+    """
+
+    def __init__(self, email_agent, poll_interval=300, push_port=None, push_host='127.0.0.1',
+                 queue_size=DEFAULT_QUEUE_SIZE, max_backoff=DEFAULT_MAX_BACKOFF, log_level=logging.INFO):
+        self.email_agent = email_agent
+        # Start, stop and per-run lines are printed at INFO; failed runs at WARNING
+        self.log_level = log_level
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.triggers = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.failures = 0
+        self.runs = 0
+        self.coalesced = 0
+        self.server = None
+        if push_port is not None:
+            self.server = ThreadingHTTPServer((push_host, push_port), PushHandler)
+            self.server.agent_daemon = self
+
+    def notify(self, reason):
+        """Request a run; when the queue is full a run is already pending, so the trigger is dropped."""
+        try:
+            self.triggers.put_nowait(reason)
+        except queue.Full:
+            self.coalesced += 1
+
+    def next_delay(self):
+        """Seconds until the next poll: the poll interval, or exponential backoff with jitter after failures."""
+        if not self.failures:
+            return self.poll_interval
+        backoff = min(self.max_backoff, self.poll_interval * 2 ** self.failures)
+        return backoff * random.uniform(0.5, 1.0)
+
+    def status(self):
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'pending_triggers': self.triggers.qsize(),
+            'coalesced_triggers': self.coalesced,
+            'stopping': self.stop_event.is_set(),
+        }
+
+    def run(self):
+        """Run until stop() is called or SIGINT/SIGTERM is received."""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+            signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+
+        if self.server is not None:
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            self.log(logging.INFO, f"Listening for push notifications on http://{self.server.server_address[0]}:{self.server.server_address[1]}/push")
+
+        # Run once at startup, then on every poll or push
+        reason = 'startup'
+        try:
+            while not self.stop_event.is_set():
+                self.run_once(reason)
+                if self.stop_event.is_set():
+                    break
+                try:
+                    reason = self.triggers.get(timeout=self.next_delay())
+                except queue.Empty:
+                    reason = 'poll'
+                if self.stop_event.is_set():
+                    break
+                # Everything queued so far is covered by the run we are about to do
+                while True:
+                    try:
+                        self.triggers.get_nowait()
+                        self.coalesced += 1
+                    except queue.Empty:
+                        break
+        finally:
+            if self.server is not None:
+                self.server.shutdown()
+                self.server.server_close()
+            self.log(logging.INFO, "Email agent daemon stopped.")
+
+    def run_once(self, reason):
+        started = time.monotonic()
+        try:
+            self.email_agent.process_emails()
+        except Exception as error:
+            self.failures += 1
+            self.log(logging.WARNING, f"Run triggered by {reason} failed ({self.failures} in a row): {error}")
+        else:
+            self.failures = 0
+            self.log(logging.INFO, f"Run triggered by {reason} finished in {time.monotonic() - started:.1f}s")
+        self.runs += 1
+
+    def log(self, level, message):
+        if level >= self.log_level:
+            print(message)
+
+    def stop(self):
+        """Stop after the email being processed; the actions queued so far are still flushed."""
+        self.stop_event.set()
+        self.email_agent.request_stop()
+        self.notify('stop')
@@ -1,68 +1,419 @@
 import colorama
-import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formataddr
 from colorama import Fore, Style
-from integration.gmail_integration import GmailIntegration
-from utilities.llm_helper import LLMHelper
+from email_agents import threads
+from email_agents.rule_engine import RuleEngine
+from integration.gmail_integration import GmailIntegration, HistoryExpiredError
+from utilities import message_parser
+from utilities.address_index import AddressIndex, parse_addresses
+from utilities.llm_helper import THREAD_DIGEST
+from utilities.metrics import Metrics
+from utilities.model_cascade import create_llm_helper
+from utilities.storage import TRAINING_DATA_JSON, Storage
 
 colorama.init(autoreset=True)  # Initialize colorama
 
+# Number of messages fetched per Gmail batch request
+FETCH_BATCH_SIZE = 50
+# Number of queued archive/ignore actions that triggers a bulk flush
+FLUSH_THRESHOLD = 500
+# Fetched messages carrying one of these labels are left alone, like the "is:unread" scan leaves them out
+EXCLUDED_LABELS = {'SPAM', 'TRASH'}
+
 class EmailAgent:
-    def __init__(self, training_mode=False, model_choice="gpt-4-turbo"):
-        self.gmail = GmailIntegration()
+    def __init__(self, training_mode=False, model_choice="gpt-4-turbo", gmail=None, llm_helper=None, concurrency=1,
+                 local_classifier_options=None, sync_state=None, storage=None, drafting_agent=None, metrics=None,
+                 log_level=logging.INFO, training_data_path=TRAINING_DATA_JSON, group_threads=True):
+        # Stage timings and counters of the run, shared with Gmail and the LLM helper
+        self.metrics = metrics or Metrics()
+        # Per-email output is printed at INFO; unattended runs use WARNING to skip formatting it
+        self.log_level = log_level
+        # Training examples, the ignore list and the Gmail OAuth token live in one SQLite store
+        self.storage = storage or Storage()
+        self.gmail = gmail or GmailIntegration(storage=self.storage, metrics=self.metrics, log_level=log_level)
         self.training_mode = training_mode
-        self.llm_helper = LLMHelper(model_choice=model_choice)
-
-        # Load existing training data (if any)
+        # Number of emails classified by the LLM at the same time
+        self.concurrency = max(1, concurrency)
+        self.llm_helper = llm_helper or create_llm_helper(model_choice)
+
+        # Archive/ignore actions are queued and applied in bulk by flush_actions
+        self.pending_actions = {'archive': [], 'ignore': []}
+        # Conversations are classified once, from their latest unread message, and their decision is reused
+        # for new messages that do not change them
+        self.thread_decisions = threads.ThreadDecisions(self.storage) if group_threads else None
+        # Optional EmailDraftingAgent; emails to reply to are queued and drafted together by flush_actions
+        self.drafting_agent = drafting_agent
+        self.pending_replies = []
+
+        # Optional historyId checkpoint and processed-message ledger for incremental runs
+        self.sync_state = sync_state
+        self.next_history_id = None
+        self.processed_since_flush = []
+        self.stop_requested = False
+        # Emails left untouched because the LLM could not classify them (token budget, invalid answers)
+        self.skipped = 0
+        # Emails whose action Gmail did not apply; like skipped ones, they are left for the next run
+        self.failed = 0
+
+        # Load existing training data (if any) and compile it into indexed rules
+        self.training_data_path = training_data_path
         self.training_data = self.load_training_data()
+        self.rule_engine = RuleEngine.from_training_data(self.training_data)
+        # Always-ignored senders, matched on their normalized address (or domain)
+        self.ignored_senders = AddressIndex(self.training_data.get('always_ignore_senders', []))
+        # The user's own address and send-as aliases, fetched from Gmail on first use
+        self.own_addresses = None
+
+        # Optional nearest-neighbour stage that answers without the LLM when similar emails agree
+        self.local_classifier = None
+        if local_classifier_options is not None:
+            # numpy is only loaded when the local classifier is used
+            from email_agents.local_classifier import LocalClassifier
+            self.local_classifier = LocalClassifier.from_training_data(self.training_data, **local_classifier_options)
 
     def load_training_data(self):
-        """Load existing training data from a JSON file."""
-        try:
-            with open('training_data.json', 'r') as file:
-                return json.load(file)
-        except FileNotFoundError:
-            return {}
+        """Load existing training data from the store, importing training_data.json on first use."""
+        self.storage.migrate_training_data(self.training_data_path)
+        return self.storage.load_training_data()
 
-    def save_training_data(self):
-        """Save the current training data to a JSON file."""
-        with open('training_data.json', 'w') as file:
-            json.dump(self.training_data, file, indent=4)
+    def logs(self, level):
+        """True if messages of this level are printed; training mode always shows the emails it asks about."""
+        return self.training_mode or level >= self.log_level
 
     def process_emails(self):
         """Process emails based on the current mode (training/automatic)."""
-        messages = self.gmail.list_messages(query="is:unread")
-        
-        for msg in messages:
-            email_data = self.gmail.get_message(msg['id'])
-            subject = self.get_subject(email_data)
+        for _ in self.iter_turns():
+            pass
+
+    def iter_turns(self, turn_size=None):
+        """Process the unread emails like process_emails, pausing after every turn_size emails.
 
+        Yields the number of emails processed in each turn, so a scheduler can run other agents in
+        between (see multi_account.py). Closing the generator early flushes the queued actions but
+        keeps the history checkpoint, like a stop request.
+        """
+        processed = 0
+        try:
+            for message_id, email_data, suggestion in self.iter_classified_emails(query="is:unread"):
+                self.process_email(message_id, email_data, suggestion)
+                processed += 1
+                if self.stop_requested:
+                    if self.logs(logging.WARNING):
+                        print(f"{Fore.YELLOW}Stop requested, finishing after the current email.")
+                    yield processed
+                    return
+                if turn_size and processed >= turn_size:
+                    yield processed
+                    processed = 0
+        finally:
+            # Apply whatever is still queued, even if processing was interrupted
+            self.flush_actions()
+
+        # Only move the checkpoint forward once every new message has been handled;
+        # skipped and failed emails are picked up again by the next run
+        if self.skipped or self.failed:
+            if self.skipped and self.logs(logging.WARNING):
+                print(f"{Fore.YELLOW}{self.skipped} emails could not be classified and were left for the next run.")
+            if self.failed and self.logs(logging.WARNING):
+                print(f"{Fore.YELLOW}{self.failed} emails could not be updated in Gmail and were left for the next run.")
+            self.skipped = 0
+            self.failed = 0
+        elif self.sync_state is not None and self.next_history_id:
+            self.sync_state.set_history_id(self.next_history_id)
+        if processed:
+            yield processed
+
+    def request_stop(self):
+        """Ask a running process_emails to stop after the current email (thread-safe)."""
+        self.stop_requested = True
+
+    def iter_message_ids(self, query="is:unread"):
+        """Yield the IDs to process: mail added since the last run when possible, otherwise every match of query."""
+        if self.sync_state is not None:
+            # Read the checkpoint before listing, so mail arriving during the run is picked up next time
+            self.next_history_id = self.gmail.get_profile()['historyId']
+            start_history_id = self.sync_state.get_history_id()
+            if start_history_id:
+                try:
+                    yield from self.gmail.list_added_message_ids(start_history_id)
+                    return
+                except HistoryExpiredError:
+                    self.metrics.increment('history_expired')
+                    if self.logs(logging.INFO):
+                        print(f"{Fore.YELLOW}Gmail history since {start_history_id} has expired, falling back to a full scan.")
+
+        # List every page before any email is processed: queued actions are flushed along the way, and
+        # marking emails read while paging through "is:unread" could move later ones to pages already read
+        for msg in self.gmail.list_messages(query=query):
+            yield msg['id']
+
+    def iter_email_batches(self, query="is:unread"):
+        """Stream lists of (message_id, email_data) pairs, one per batch of fetched messages."""
+        batch = []
+        for message_id in self.iter_message_ids(query=query):
+            batch.append(message_id)
+            if len(batch) >= FETCH_BATCH_SIZE:
+                emails = list(self.fetch_batch(batch))
+                if emails:
+                    yield emails
+                batch = []
+        if batch:
+            emails = list(self.fetch_batch(batch))
+            if emails:
+                yield emails
+
+    def fetch_batch(self, message_ids):
+        """Fetch a batch of messages, skipping the ones Gmail failed to return or that were already processed.
+
+        The history only tells which labels a message had when it was added, so messages read since
+        then, or moved to spam or trash, are dropped here on their current labels.
+        """
+        if self.sync_state is not None:
+            message_ids = self.sync_state.filter_unprocessed(message_ids)
+            if not message_ids:
+                return
+        for message_id, email_data in zip(message_ids, self.gmail.get_messages(message_ids)):
+            if email_data is None:
+                if self.logs(logging.WARNING):
+                    print(f"{Fore.RED}Could not fetch message {message_id}, skipping.")
+                continue
+            labels = set(email_data.get('labelIds', ['UNREAD']))
+            if 'UNREAD' not in labels or labels & EXCLUDED_LABELS:
+                self.metrics.increment('emails_no_longer_unread')
+                continue
+            yield message_id, email_data
+
+    def iter_classified_emails(self, query="is:unread"):
+        """Stream (message_id, email_data, suggestion) triples in inbox order.
+
+        Rules and the local classifier answer first; the other emails of each fetched batch are sent
+        to the LLM several at a time. With concurrency > 1, a pool of worker threads sends those
+        requests in parallel, and the next batch is classified while the current one is being applied
+        (or answered by the user in training mode).
+        """
+        if self.concurrency == 1:
+            for emails in self.iter_email_batches(query=query):
+                yield from self.collect_suggestions(self.submit_batch(emails))
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        previous = None
+        try:
+            for emails in self.iter_email_batches(query=query):
+                # At most two fetched batches are in flight, so memory stays bounded on large inboxes
+                submitted = self.submit_batch(emails, executor)
+                if previous is not None:
+                    yield from self.collect_suggestions(previous)
+                previous = submitted
+            if previous is not None:
+                yield from self.collect_suggestions(previous)
+        finally:
+            # Drop the precomputed suggestions nobody will consume (e.g. after 'exit')
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit_batch(self, emails, executor=None):
+        """Classify a fetched batch with the rules and the local classifier, and group the rest into LLM requests.
+
+        Without an executor, the LLM requests are only sent when collect_suggestions reaches them.
+        """
+        suggestions = [self.timed_classify_locally(email_data) for _, email_data in emails]
+        pending = [index for index, suggestion in enumerate(suggestions) if suggestion is None]
+        inputs = {index: emails[index][1] for index in pending}
+        followers = {}
+        if self.thread_decisions is not None:
+            inputs, followers = self.group_by_thread(emails, pending, suggestions)
+        pending = sorted(inputs)
+        requests = {}
+        for start in range(0, len(pending), self.llm_helper.max_batch_size):
+            indexes = pending[start:start + self.llm_helper.max_batch_size]
+            request = {'indexes': indexes, 'emails': [inputs[index] for index in indexes], 'future': None}
+            if executor is not None:
+                request['future'] = executor.submit(self.llm_helper.suggest_actions, request['emails'])
+            for position, index in enumerate(indexes):
+                requests[index] = (request, position)
+        return emails, suggestions, requests, followers
+
+    def collect_suggestions(self, submitted):
+        """Yield the (message_id, email_data, suggestion) triples of a submitted batch, in order."""
+        emails, suggestions, requests, followers = submitted
+
+        def resolve(index):
+            if suggestions[index] is None:
+                if index in followers:
+                    # An earlier message of a conversation takes the decision made on its latest message
+                    suggestions[index] = self.thread_suggestion(resolve(followers[index]))
+                else:
+                    request, position = requests[index]
+                    if 'results' not in request:
+                        future = request['future']
+                        request['results'] = future.result() if future is not None else self.llm_helper.suggest_actions(request['emails'])
+                    suggestions[index] = self.llm_suggestion(request['results'][position])
+            return suggestions[index]
+
+        for index, (message_id, email_data) in enumerate(emails):
+            yield message_id, email_data, resolve(index)
+
+    def group_by_thread(self, emails, pending, suggestions):
+        """Answer the pending emails whose conversation has a decision that still applies, and keep one email
+        per remaining conversation for the LLM.
+
+        Returns (inputs, followers): {index: email_data to classify, the latest of its conversation with a
+        digest of the earlier ones} and {index of an earlier email: index of its conversation's latest}.
+        """
+        self.thread_decisions.load([emails[index][1].get('threadId') for index in pending])
+        own_addresses = self.get_own_addresses()
+        remaining = []
+        for index in pending:
+            decision = self.thread_decisions.reusable(emails[index][1], own_addresses)
+            if decision:
+                suggestions[index] = self.thread_suggestion((decision['action'], decision['explanation'], 'llm'))
+            else:
+                remaining.append(index)
+
+        inputs = {}
+        followers = {}
+        for latest, earlier in threads.group_by_thread(emails, remaining).items():
+            inputs[latest] = emails[latest][1]
+            if earlier:
+                inputs[latest] = dict(emails[latest][1], **{THREAD_DIGEST: threads.digest([emails[index][1] for index in earlier])})
+                followers.update((index, latest) for index in earlier)
+        return inputs, followers
+
+    def thread_suggestion(self, suggestion):
+        """Turn the suggestion made for another message of a conversation into this message's suggestion."""
+        action, explanation, source = suggestion
+        if source == 'skipped':
+            return suggestion
+        return action, f"Same conversation as an email classified {action}" + (f": {explanation}" if explanation else ""), 'thread'
+
+    def classify_email(self, email_data):
+        """Return (action, explanation, source) for an email, without applying it."""
+        return self.classify_locally(email_data) or self.llm_suggestion(self.llm_helper.suggest_action(email_data))
+
+    def timed_classify_locally(self, email_data):
+        with self.metrics.timer('rules'):
+            return self.classify_locally(email_data)
+
+    def classify_locally(self, email_data):
+        """Return (action, explanation, source) from the address checks, the rules or the local classifier, or None if the LLM is needed."""
+        suggestion = self.classify_by_address(email_data)
+        if suggestion:
+            return suggestion
+
+        # Check if a rule compiled from the training data matches this email
+        rule = self.rule_engine.match_email(email_data)
+        if rule:
+            return rule.action, f"Matched rule {rule.describe()}", 'rule'
+
+        # Check if enough similar labelled emails agree on an action
+        if self.local_classifier is not None:
+            sender, _, _ = self.get_sender_and_recipients(email_data)
+            prediction = self.local_classifier.predict(self.get_subject(email_data), sender)
+            if prediction:
+                return prediction.action, f"{len(prediction.neighbors)} similar labelled emails agree ({prediction.confidence:.0%})", 'local'
+        return None
+
+    def classify_by_address(self, email_data):
+        """Return an ignore suggestion when the sender is always ignored or the user is only CC'd, else None."""
+        sender, recipients, cc_list = self.get_sender_and_recipients(email_data)
+        if sender in self.ignored_senders:
+            return 'ignore', "Sender is in the 'always ignore' list", 'address'
+
+        own_addresses = self.get_own_addresses()
+        if own_addresses.match_any(cc_list) and not own_addresses.match_any(recipients):
+            return 'ignore', "You are CC'd, not a direct recipient", 'address'
+        return None
+
+    def get_own_addresses(self):
+        """Return the index of the user's addresses (the mailbox address and its send-as aliases)."""
+        if self.own_addresses is None:
+            self.own_addresses = AddressIndex(self.gmail.get_own_addresses())
+        return self.own_addresses
+
+    def llm_suggestion(self, result):
+        """Turn an LLM (action, explanation, confidence) result into (action, explanation, source)."""
+        action, explanation, confidence = result
+        if action is None:
+            # Token budget reached or no valid answer: leave the email for a later run
+            return None, explanation, 'skipped'
+        if confidence is not None:
+            explanation = f"{explanation} (confidence {confidence:.0%})".strip()
+        return action, explanation, 'llm'
+
+    def process_email(self, message_id, email_data, suggestion=None):
+        """Apply the suggested (or freshly classified) action for a single email."""
+        started = time.perf_counter()
+        # Ties the email's JSON log records together (None unless an exporter records events)
+        trace_id = self.metrics.new_trace_id()
+        subject = self.get_subject(email_data)
+        action, explanation, source = suggestion or self.classify_email(email_data)
+
+        if self.training_mode and source not in ('address', 'rule'):
+            # The batch was classified ahead of time; a correction made since then may now match
+            rule = self.rule_engine.match_email(email_data)
+            updated = self.classify_by_address(email_data)
+            if updated is None and rule:
+                updated = rule.action, f"Matched rule {rule.describe()}", 'rule'
+            if updated:
+                action, explanation, source = updated
+
+        verbose = self.logs(logging.INFO)
+        if verbose:
             # Add section separator and subject header
             print(f"{Fore.CYAN}{'='*50}")
             print(f"{Fore.CYAN}Processing Email: {Fore.GREEN}{subject}")
             print(f"{Fore.CYAN}{'='*50}")
 
-            # Check if we have training data for this subject
-            if subject in self.training_data:
-                # Apply the stored action
-                action = self.training_data[subject]
-                print(f"{Fore.YELLOW}Found stored action: {Fore.GREEN}{action}")
-            else:
-                # Use LLM to get a suggestion if no training data is found
-                action, explanation = self.llm_helper.suggest_action(email_data)
-                print(f"{Fore.YELLOW}LLM suggested action: {Fore.GREEN}{action}")
+        if source == 'skipped':
+            # Leave the email as it is (and out of the ledger) so a later run classifies it
+            self.skipped += 1
+            self.metrics.increment('emails_skipped')
+            self.metrics.event('email', trace_id=trace_id, message_id=message_id, source=source, reason=explanation)
+            if verbose:
+                print(f"{Fore.RED}Skipped: {explanation}.")
+                print(f"{Fore.CYAN}{'='*50}\n")
+            return
 
-                # Output the explanation separately (optional)
-                if explanation:
-                    print(f"{Fore.CYAN}{'-'*50}")
-                    print(f"{Fore.LIGHTBLACK_EX}Explanation: {explanation}")
-                    print(f"{Fore.CYAN}{'-'*50}")
+        if verbose:
+            self.print_suggestion(action, explanation, source)
 
+        with self.metrics.timer('apply'):
             if self.training_mode:
-                self.process_email_with_training(msg['id'], email_data, subject, action)
+                action = self.process_email_with_training(message_id, email_data, subject, action)
             else:
-                self.apply_instruction(msg['id'], action)
+                self.apply_instruction(message_id, action, email_data)
+        if self.thread_decisions is not None and source in ('llm', 'local', 'thread'):
+            # Reused decisions keep the explanation they were made with
+            self.thread_decisions.remember(email_data, action, explanation if source != 'thread' else None, self.get_own_addresses())
+        self.metrics.increment('emails', action=action, source=source)
+        self.metrics.event('email', trace_id=trace_id, message_id=message_id, action=action, source=source,
+                           seconds=round(time.perf_counter() - started, 6))
+        if verbose:
             print(f"{Fore.CYAN}{'='*50}\n")
 
+    def print_suggestion(self, action, explanation, source):
+        """Print where the suggested action comes from."""
+        if source == 'address':
+            print(f"{Fore.RED}Note: {explanation}. Suggesting ignore.")
+        elif source == 'rule':
+            # Apply the stored action
+            print(f"{Fore.YELLOW}Found stored action: {Fore.GREEN}{action} {Fore.LIGHTBLACK_EX}({explanation})")
+        elif source == 'local':
+            print(f"{Fore.YELLOW}Local classifier suggested action: {Fore.GREEN}{action} {Fore.LIGHTBLACK_EX}({explanation})")
+        elif source == 'thread':
+            print(f"{Fore.YELLOW}Conversation action: {Fore.GREEN}{action} {Fore.LIGHTBLACK_EX}({explanation})")
+        else:
+            print(f"{Fore.YELLOW}LLM suggested action: {Fore.GREEN}{action}")
+
+            # Output the explanation separately (optional)
+            if explanation:
+                print(f"{Fore.CYAN}{'-'*50}")
+                print(f"{Fore.LIGHTBLACK_EX}Explanation: {explanation}")
+                print(f"{Fore.CYAN}{'-'*50}")
+
     def process_email_with_training(self, message_id, email_data, subject, suggested_action):
         """Process each email in training mode with LLM-based suggestions and user feedback."""
         
@@ -75,16 +426,6 @@ class EmailAgent:
         if cc_list:
             print(f"{Fore.CYAN}CC: {Fore.GREEN}{', '.join(cc_list)}")
 
-        # Check if sender is in the dynamic 'always ignore' list
-        if sender in self.always_ignore_senders():
-            suggested_action = 'ignore'
-            print(f"{Fore.RED}Note: This sender is in the 'always ignore' list. Auto-suggesting ignore.")
-
-        # Check if user is CC'd and update suggestion
-        if 'your_email@domain.com' in cc_list and suggested_action != 'ignore':
-            suggested_action = 'ignore'
-            print(f"{Fore.RED}Note: You are CC'd in this email. Auto-suggesting ignore.")
-
         # Display LLM suggested action
         print(f"{Fore.YELLOW}LLM suggested action for email '{subject}': {Fore.GREEN}{suggested_action}")
         
@@ -93,6 +434,7 @@ class EmailAgent:
 
         if confirmation == 'exit':
             print(f"{Fore.RED}Exiting process.")
+            self.flush_actions()
             exit()
 
         if confirmation == 'n':
@@ -121,114 +463,149 @@ class EmailAgent:
                 'recipients': recipients,
                 'cc_list': cc_list
             }
-            self.save_training_data()
+            self.rule_engine.add_example(subject, self.training_data[subject])
+            if self.local_classifier is not None:
+                self.local_classifier.add_example(subject, sender, action)
+            # Only the corrected example is written
+            self.storage.save_example(subject, self.training_data[subject])
 
         # Apply the confirmed action
-        self.apply_instruction(message_id, action)
+        self.apply_instruction(message_id, action, email_data)
         print(f"{Fore.YELLOW}Processed email '{subject}' with action '{Fore.GREEN}{action}'.")
-
-    def get_sender_and_recipients(self, email_data):
-        """Extract the sender, recipients, and CC list from the email headers."""
-        headers = email_data['payload'].get('headers', [])
-        
-        sender = ""
-        recipients = []
-        cc_list = []
-
-        for header in headers:
-            if header['name'] == 'From':
-                sender = header['value']
-            elif header['name'] == 'To':
-                recipients = header['value'].split(', ')
-            elif header['name'] == 'Cc':
-                cc_list = header['value'].split(', ')
-
-        return sender, recipients, cc_list
+        return action
 
     def always_ignore_senders(self):
-        """Return the dynamic list of senders that should always be ignored."""
-        # Load the ignore list from the training data if it exists, otherwise return an empty list
-        return self.training_data.get('always_ignore_senders', [])
+        """Return the index of senders that should always be ignored."""
+        return self.ignored_senders
 
     def update_ignore_list(self, sender):
         """Update the dynamic ignore list with a new sender and save it in the training data."""
-        ignore_list = self.training_data.get('always_ignore_senders', [])
-        if sender not in ignore_list:
-            ignore_list.append(sender)
-            self.training_data['always_ignore_senders'] = ignore_list
-            self.save_training_data()
+        # "Name" <a@b.com> and a@b.com are the same sender
+        if sender not in self.ignored_senders and self.storage.add_ignored_sender(sender):
+            self.ignored_senders.add(sender)
+            self.training_data.setdefault('always_ignore_senders', []).append(sender)
+            self.rule_engine.add_ignored_sender(sender)
             print(f"{Fore.GREEN}Added {sender} to the 'always ignore' list.")
         else:
             print(f"{Fore.YELLOW}{sender} is already in the 'always ignore' list.")
 
 
-    def build_prompt_for_llm(self, email_data):
-        """Construct a simple prompt for the LLM."""
-        subject = self.get_subject(email_data)
-        body = self.get_body(email_data)
-        sender, recipients, cc_list = self.get_sender_and_recipients(email_data)
+    def apply_instruction(self, message_id, instruction, email_data=None):
+        """Apply the user-provided instruction to the email (email_data, when given, saves a refetch for replies)."""
+        if self.sync_state is not None:
+            self.processed_since_flush.append((message_id, instruction))
 
-        prompt = f"Subject: {subject}\nFrom: {sender}\nTo: {', '.join(recipients)}\n"
-        if cc_list:
-            prompt += f"CC: {', '.join(cc_list)}\n"
-        prompt += f"Body: {body}\n\nWhat action should be taken on this email (archive/reply/ignore)?"
-
-        return prompt
-
-    def apply_instruction(self, message_id, instruction):
-        """Apply the user-provided instruction to the email."""
         if instruction == 'archive':
-            self.archive_email(message_id)
+            self.archive_email(message_id, email_data)
         elif instruction == 'reply':
-            self.mark_as_todo_and_draft_reply(message_id)
+            self.mark_as_todo_and_draft_reply(message_id, email_data)
         elif instruction == 'ignore':
             self.ignore_email(message_id)
-        else:
+        elif self.logs(logging.INFO):
             print(f"{Fore.YELLOW}Ignored message {message_id}.")
 
     def get_subject(self, email_data):
         """Extract the subject from the email headers."""
-        headers = email_data['payload'].get('headers', [])
-        for header in headers:
-            if header['name'] == 'Subject':
-                return header['value']
-        return "No Subject"
+        return message_parser.get_header(email_data, 'Subject', "No Subject")
 
     def get_body(self, email_data):
-        """Extract the body of the email."""
-        if 'parts' in email_data['payload']:
-            for part in email_data['payload']['parts']:
-                if part['mimeType'] == 'text/plain':
-                    return part['body'].get('data', '')
-        return "No body content"
+        """Extract the decoded, readable body of the email, cut to the prompt's token budget."""
+        return message_parser.extract_body(email_data)
 
     def get_sender_and_recipients(self, email_data):
         """Extract the sender, recipients, and CC list from the email headers."""
         headers = email_data['payload'].get('headers', [])
-        
+
         sender = ""
-        recipients = []
-        cc_list = []
+        to_values = []
+        cc_values = []
 
         for header in headers:
-            if header['name'] == 'From':
-                sender = header['value']
-            elif header['name'] == 'To':
-                recipients = header['value'].split(', ')
-            elif header['name'] == 'Cc':
-                cc_list = header['value'].split(', ')
-
+            name = header['name'].lower()
+            if name == 'from' and not sender:
+                sender = header['value'].strip()
+            elif name == 'to':
+                to_values.append(header['value'])
+            elif name == 'cc':
+                cc_values.append(header['value'])
+
+        # RFC 5322 parsing: a comma inside a quoted display name does not split the address
+        recipients = [formataddr(pair) for pair in parse_addresses(*to_values)]
+        cc_list = [formataddr(pair) for pair in parse_addresses(*cc_values)]
         return sender, recipients, cc_list
 
-    def archive_email(self, message_id):
-        """Archive an email by removing it from the inbox."""
-        self.gmail.archive_message(message_id)
-
-    def mark_as_todo_and_draft_reply(self, message_id):
-        """Mark an email as to-do and draft a reply."""
-        # In a real implementation, this would draft a reply and mark the message for follow-up
-        print(f"{Fore.YELLOW}Marked email {message_id} as to-do and drafted a reply.")
+    def archive_email(self, message_id, email_data=None):
+        """Queue an email to be archived (removed from the inbox) in the next bulk flush.
+
+        Only the classified message is archived, not its thread: the thread may hold unread messages
+        that were not classified yet (in a later batch, or arrived after the listing).
+        """
+        self.queue_action('archive', message_id)
+
+    def mark_as_todo_and_draft_reply(self, message_id, email_data=None):
+        """Mark an email as to-do and queue a reply draft for the next bulk flush."""
+        if self.drafting_agent is None:
+            if self.logs(logging.INFO):
+                print(f"{Fore.YELLOW}Marked email {message_id} as to-do.")
+            return
+        if email_data is None:
+            email_data = self.gmail.get_message(message_id)
+        if email_data is not None:
+            self.pending_replies.append(email_data)
+            self.flush_if_full()
+
+    def draft_replies(self, emails):
+        """Write the replies to several emails concurrently, then create their drafts with batch requests."""
+        if self.drafting_agent.your_name is None:
+            self.drafting_agent.your_name = self.gmail.get_display_name()
+        with self.metrics.timer('drafts'):
+            texts = self.drafting_agent.draft_replies(emails)
+            replies = [(email_data, text) for email_data, text in zip(emails, texts) if text]
+            drafts = self.gmail.create_drafts(replies)
+        self.metrics.increment('drafts', len(drafts))
+        if self.logs(logging.INFO):
+            print(f"{Fore.GREEN}Drafted {len(drafts)} of {len(emails)} replies.")
+        # Return the emails whose written reply Gmail did not save as a draft
+        return [email_data['id'] for email_data, _ in replies if email_data['id'] not in drafts]
 
     def ignore_email(self, message_id):
         """Ignore an email, which in practice could delete or mark it as read."""
-        self.gmail.mark_as_read(message_id)
+        self.queue_action('ignore', message_id)
+
+    def queue_action(self, action, message_id):
+        """Queue a bulk action and flush the queue once it gets large."""
+        self.pending_actions[action].append(message_id)
+        self.flush_if_full()
+
+    def flush_if_full(self):
+        if sum(len(ids) for ids in self.pending_actions.values()) + len(self.pending_replies) >= FLUSH_THRESHOLD:
+            self.flush_actions()
+
+    def flush_actions(self):
+        """Apply all queued archive/ignore actions with one batchModify call per action, and create the queued drafts."""
+        pending, self.pending_actions = self.pending_actions, {'archive': [], 'ignore': []}
+        failed = set()
+        if pending['archive']:
+            failed.update(self.gmail.archive_messages(pending['archive']))
+        if pending['ignore']:
+            unread = self.gmail.mark_messages_as_read(pending['ignore'])
+            failed.update(unread)
+            if self.logs(logging.INFO):
+                print(f"Marked {len(set(pending['ignore'])) - len(unread)} messages as read.")
+        if self.pending_replies:
+            replies, self.pending_replies = self.pending_replies, []
+            if self.thread_decisions is not None:
+                # Every unread message of a conversation classified 'reply' takes that action, but only the
+                # latest one gets a draft; the others are just marked to-do
+                replies = threads.latest_per_thread(replies)
+            failed.update(self.draft_replies(replies))
+        if failed:
+            self.failed += len(failed)
+            self.metrics.increment('emails_failed', len(failed))
+
+        # Record the messages in the ledger only once their actions reached Gmail
+        if self.processed_since_flush:
+            processed, self.processed_since_flush = self.processed_since_flush, []
+            self.sync_state.mark_processed([entry for entry in processed if entry[0] not in failed])
+        if self.thread_decisions is not None:
+            self.thread_decisions.save()
@@ -1,18 +1,60 @@
-import openai
+import functools
+import hashlib
 import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parseaddr
+from utilities import message_parser
+from utilities.model_cascade import create_llm_helper
+
+# Bump whenever the drafting prompt changes so cached drafts for the old prompt are not reused
+DRAFT_PROMPT_VERSION = 1
+# Longest draft the model may write
+DRAFT_MAX_TOKENS = 300
+# Part of the original email given to the model as context
+DRAFT_CONTEXT_TOKENS = 500
+# Replies drafted at the same time
+DEFAULT_DRAFT_WORKERS = 4
+
+DRAFT_SYSTEM_PROMPT = "You write short, friendly email replies. You answer with the body of the email only."
+
+class TemplateFields(dict):
+    """Template values; placeholders without a value are kept as they are, for the LLM to fill in."""
+
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+@functools.lru_cache(maxsize=None)
+def parse_templates(path, mtime):
+    """Parse a templates file; cached until the file changes (mtime is part of the cache key)."""
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def render_template(template, **fields):
+    """Fill the known {placeholders} of a template and keep the others."""
+    return template.format_map(TemplateFields({name: value for name, value in fields.items() if value}))
 
 class EmailDraftingAgent:
-    def __init__(self, model_choice="gpt-4-turbo"):
+    def __init__(self, model_choice="gpt-4-turbo", llm_helper=None, cache=None, your_name=None, templates_path='templates.json',
+                 max_workers=DEFAULT_DRAFT_WORKERS):
         # Load the OpenAI model and any specific templates or instructions
         self.model_choice = model_choice
+        self.templates_path = templates_path
         self.templates = self.load_templates()
+        # LLMHelper (or model cascade) used for refinements; created on first use when not given
+        self.llm_helper = llm_helper
+        # Optional persistent LLMCache, on top of the in-memory refinements of this run (context hash -> Future)
+        self.cache = cache
+        self.your_name = your_name
+        self.max_workers = max(1, max_workers)
+        self.refinements = {}
+        self.lock = threading.Lock()
 
     def load_templates(self):
         """Load email templates from an external file (templates.json)."""
         try:
-            with open('templates.json', 'r') as file:
-                templates = json.load(file)
-                return templates
+            return parse_templates(self.templates_path, os.path.getmtime(self.templates_path))
         except FileNotFoundError:
             print("Error: Template file not found.")
             return {}
@@ -27,31 +69,77 @@ class EmailDraftingAgent:
         else:
             return self.templates.get('status_update', "No template available for status updates.")
 
-    def draft_email(self, email_context, recipient_name, your_name):
+    def draft_email(self, email_context, recipient_name, your_name, topic=None):
         """Draft an email based on the context using an LLM to refine the template."""
-        # Select the appropriate template
-        template = self.select_template(email_context)
+        # Select the appropriate template and fill in what we already know
+        template = render_template(self.select_template(email_context), recipient_name=recipient_name,
+                                   your_name=your_name, topic=topic, project=topic)
 
         # Use LLM to refine the email if necessary
         refined_email = self.refine_email_with_llm(template, email_context, recipient_name, your_name)
 
         return refined_email
 
+    def draft_reply(self, email_data):
+        """Draft the text of a reply to a Gmail API message."""
+        subject = message_parser.get_header(email_data, 'Subject', '')
+        sender = message_parser.get_header(email_data, 'Reply-To', '') or message_parser.get_header(email_data, 'From', '')
+        name, address = parseaddr(sender)
+        body = message_parser.extract_body(email_data, max_tokens=DRAFT_CONTEXT_TOKENS)
+        topic = subject[3:].strip() if subject.lower().startswith('re:') else subject
+        return self.draft_email(f"{subject}\n\n{body}", name or address.partition('@')[0], self.your_name, topic=topic)
+
+    def draft_replies(self, emails):
+        """Draft replies to several messages concurrently; the text is None for emails that could not be drafted."""
+        def draft(email_data):
+            try:
+                return self.draft_reply(email_data)
+            except Exception as error:
+                print(f"Could not draft a reply to message {email_data.get('id')}: {error}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(draft, emails))
+
     def refine_email_with_llm(self, template, email_context, recipient_name, your_name):
-        """Refine the email template with OpenAI for customization."""
+        """Refine the email template with the LLM for customization, reusing earlier refinements of the same context."""
         prompt = (
             f"Please customize the following email template based on this context: '{email_context}'. "
-            f"Make sure to include the recipient's name '{recipient_name}' and the sender's name '{your_name}':\n\n"
+            f"Make sure to include the recipient's name '{recipient_name}' and the sender's name '{your_name}', "
+            f"and replace any remaining {{placeholder}} using the context:\n\n"
             f"{template}"
         )
 
-        response = openai.Completion.create(
-            model=self.model_choice,
-            prompt=prompt,
-            max_tokens=150
-        )
+        key = hashlib.sha256(f"{self.model_choice}\0{DRAFT_PROMPT_VERSION}\0{prompt}".encode('utf-8')).hexdigest()
+        # Replies drafted at the same time for the same context wait for a single refinement
+        with self.lock:
+            future = self.refinements.get(key)
+            owner = future is None
+            if owner:
+                future = self.refinements[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            refined = self.cache.get(key) if self.cache is not None else None
+            if refined is None:
+                refined = self.get_llm_helper().complete(DRAFT_SYSTEM_PROMPT, prompt, max_tokens=DRAFT_MAX_TOKENS, action='draft')
+                if self.cache is not None:
+                    self.cache.set(key, refined)
+        except Exception as error:
+            # Let a later draft try again
+            with self.lock:
+                del self.refinements[key]
+            future.set_exception(error)
+            raise
+        future.set_result(refined)
+        return refined
 
-        return response.choices[0].text.strip()
+    def get_llm_helper(self):
+        with self.lock:
+            if self.llm_helper is None:
+                self.llm_helper = create_llm_helper(self.model_choice)
+            return self.llm_helper
 
 # Example usage
 if __name__ == "__main__":
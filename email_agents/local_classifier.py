@@ -0,0 +1,134 @@
+import re
+import zlib
+from collections import namedtuple
+from email.utils import parseaddr
+import numpy as np
+
+# Number of hashed feature buckets; 4096 float32 columns cost 16 KB per labelled example
+DEFAULT_DIMENSIONS = 4096
+# Number of neighbours that vote on the action
+DEFAULT_NEIGHBORS = 5
+# Neighbours less similar than this (cosine) are ignored
+DEFAULT_MIN_SIMILARITY = 0.6
+# Share of the neighbours' (similarity-weighted) votes the winning action needs
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['.][a-z0-9]+)*")
+
+Prediction = namedtuple('Prediction', ['action', 'confidence', 'neighbors'])
+
+class HashingVectorizer:
+    """Turns an email's subject and sender into an L2-normalized vector using the hashing trick."""
+
+    def __init__(self, dimensions=DEFAULT_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def features(self, subject, sender):
+        """Yield (feature, weight) pairs: subject words and bigrams, the sender address and domain."""
+        words = TOKEN_PATTERN.findall((subject or '').lower())
+        # Numbers change between recurring emails, so they are collapsed into one token
+        words = ['<n>' if word.isdigit() else word for word in words]
+        for word in words:
+            yield 'w:' + word, 1.0
+        for first, second in zip(words, words[1:]):
+            yield f'b:{first} {second}', 1.0
+
+        address = parseaddr(sender or '')[1].lower()
+        if address:
+            yield 's:' + address, 2.0
+            yield 'd:' + address.rpartition('@')[2], 1.5
+
+    def transform(self, subject, sender):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in self.features(subject, sender):
+            hashed = zlib.crc32(feature.encode('utf-8'))
+            # The hash's top bit picks the sign so that collisions tend to cancel out
+            vector[hashed % self.dimensions] += weight if hashed & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class LocalClassifier:
+    """Nearest-neighbour classifier over the labelled emails in the training data.
+
+    When the nearest labelled emails agree with enough confidence, their action is
+    used directly and the LLM is not called.
+    """
+
+    def __init__(self, neighbors=DEFAULT_NEIGHBORS, min_similarity=DEFAULT_MIN_SIMILARITY,
+                 min_confidence=DEFAULT_MIN_CONFIDENCE, dimensions=DEFAULT_DIMENSIONS):
+        self.neighbors = neighbors
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self.vectorizer = HashingVectorizer(dimensions)
+        # Rows beyond self.size are spare capacity, so adding an example is amortized O(1)
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.actions = []
+        self.subjects = []
+        self.size = 0
+
+    @classmethod
+    def from_training_data(cls, training_data, **options):
+        classifier = cls(**options)
+        for subject, example in training_data.items():
+            if isinstance(example, dict) and 'action' in example:
+                classifier.add_example(subject, example.get('sender', ''), example['action'])
+        return classifier
+
+    def add_example(self, subject, sender, action):
+        """Add a labelled email to the index."""
+        if self.size == len(self.vectors):
+            grown = np.zeros((max(64, 2 * len(self.vectors)), self.vectorizer.dimensions), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size] = self.vectorizer.transform(subject, sender)
+        self.actions.append(action)
+        self.subjects.append(subject)
+        self.size += 1
+
+    def predict(self, subject, sender):
+        """Return a Prediction when the nearest neighbours agree, otherwise None."""
+        if not self.size:
+            return None
+        similarities = self.vectors[:self.size] @ self.vectorizer.transform(subject, sender)
+        return self.vote(similarities)
+
+    def vote(self, similarities):
+        """Similarity-weighted vote among the k most similar labelled emails."""
+        k = min(self.neighbors, len(similarities))
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+        nearest = [i for i in nearest if similarities[i] >= self.min_similarity]
+        if not nearest:
+            return None
+
+        votes = {}
+        for i in nearest:
+            votes[self.actions[i]] = votes.get(self.actions[i], 0.0) + float(similarities[i])
+        action, weight = max(votes.items(), key=lambda item: item[1])
+        confidence = weight / sum(votes.values())
+        if confidence < self.min_confidence:
+            return None
+        return Prediction(action, confidence, [self.subjects[i] for i in nearest])
+
+    def evaluate(self):
+        """Leave-one-out evaluation over the labelled emails.
+
+        Returns how many emails would have been answered locally (the LLM calls saved)
+        and how often the local answer agreed with the stored label.
+        """
+        vectors = self.vectors[:self.size]
+        similarity_matrix = vectors @ vectors.T
+        # An example must not vote for itself
+        np.fill_diagonal(similarity_matrix, -1.0)
+
+        answered = agreed = 0
+        for i in range(self.size):
+            prediction = self.vote(similarity_matrix[i])
+            if prediction is not None:
+                answered += 1
+                agreed += prediction.action == self.actions[i]
+        return {
+            'examples': self.size,
+            'answered_locally': answered,
+            'llm_call_reduction': answered / self.size if self.size else 0.0,
+            'agreement_rate': agreed / answered if answered else 0.0,
+        }
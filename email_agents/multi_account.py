@@ -0,0 +1,145 @@
+"""Serve several Gmail accounts from one process, sharing the LLM client, cache and rate limiters."""
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from colorama import Fore
+from email_agents.email_agent import EmailAgent
+from integration.gmail_integration import CREDENTIALS_PATH, GmailIntegration
+from integration.sync_state import SyncState
+from utilities.storage import Storage
+
+# Manifest listing the accounts, and the directory holding each account's state by default
+ACCOUNTS_PATH = 'accounts.json'
+ACCOUNTS_DIR = 'accounts'
+# Emails an account processes before the next account gets a turn
+DEFAULT_TURN_SIZE = 50
+# Accounts processed at the same time
+DEFAULT_ACCOUNT_WORKERS = 4
+
+ACCOUNT_NAME = re.compile(r'[\w.@+-]+')
+
+class Account:
+    """An account of the manifest and the files of its own: OAuth token, training data, ignore list and sync ledger."""
+
+    def __init__(self, name, data_dir=None, credentials=CREDENTIALS_PATH, training_data=None):
+        self.name = name
+        self.data_dir = data_dir or os.path.join(ACCOUNTS_DIR, name)
+        # The OAuth client is usually the app's, shared by every account; the token obtained with it is not
+        self.credentials_path = credentials
+        self.training_data_path = training_data or os.path.join(self.data_dir, 'training_data.json')
+
+    def path(self, filename):
+        return os.path.join(self.data_dir, filename)
+
+    def create_agent(self, llm_helper, metrics, sync=True, gmail=None, **agent_options):
+        """Build the account's EmailAgent on the shared LLM helper and metrics; its Gmail service is built (and kept) here."""
+        os.makedirs(self.data_dir, exist_ok=True)
+        storage = Storage(self.path('agent_data.db'))
+        if gmail is None:
+            # The account's own quota limiter, since Gmail's quota is per user; token.pickle is left to single-account runs
+            gmail = GmailIntegration(storage=storage, metrics=metrics, credentials_path=self.credentials_path, token_pickle=None,
+                                     log_level=agent_options.get('log_level', logging.INFO))
+        sync_state = SyncState(self.path('sync_state.db')) if sync else None
+        return EmailAgent(gmail=gmail, llm_helper=llm_helper, storage=storage, sync_state=sync_state, metrics=metrics,
+                          training_data_path=self.training_data_path, **agent_options)
+
+def load_accounts(path=ACCOUNTS_PATH):
+    """Read the accounts manifest: a JSON list of {"name", and optionally "data_dir", "credentials", "training_data"}."""
+    with open(path, 'r') as file:
+        entries = json.load(file)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path} must be a non-empty JSON list of accounts")
+
+    accounts = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not ACCOUNT_NAME.fullmatch(str(entry.get('name', ''))):
+            raise ValueError(f"Invalid account in {path}: {entry!r} (a name of letters, digits and . @ + - _ is required)")
+        unknown = set(entry) - {'name', 'data_dir', 'credentials', 'training_data'}
+        if unknown:
+            raise ValueError(f"Unknown settings {sorted(unknown)} for account {entry['name']} in {path}")
+        account = Account(**entry)
+        # Accounts sharing a name or a directory would share their token, rules and ledger
+        for other in accounts:
+            if other.name == account.name or os.path.abspath(other.data_dir) == os.path.abspath(account.data_dir):
+                raise ValueError(f"Accounts {other.name} and {account.name} in {path} must have different names and data directories")
+        accounts.append(account)
+    return accounts
+
+class MultiAccountRunner:
+    """Processes the unread emails of several accounts' agents concurrently and fairly.
+
+    Accounts wait in a round-robin queue: a worker takes the account at the head, processes one
+    turn of turn_size emails and puts it back at the tail, so a large inbox cannot hold up the
+    others. An account is only run by one worker at a time. Has the process_emails/request_stop
+    interface of EmailAgent, so EmailAgentDaemon keeps every account warm the same way.
+    """
+
+    def __init__(self, agents, workers=DEFAULT_ACCOUNT_WORKERS, turn_size=DEFAULT_TURN_SIZE):
+        # Account name -> EmailAgent
+        self.agents = agents
+        self.workers = max(1, workers)
+        self.turn_size = max(1, turn_size)
+        # Emails, turns and last error of the latest run, per account
+        self.results = {}
+
+    def process_emails(self):
+        """Run every account until its unread emails are processed; a failing account does not stop the others.
+
+        Raises RuntimeError when every account failed, so the daemon backs off.
+        """
+        results = {name: {'emails': 0, 'turns': 0, 'error': None} for name in self.agents}
+        ready = deque((name, agent.iter_turns(self.turn_size)) for name, agent in self.agents.items())
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    if not ready:
+                        # The accounts still running are put back by the workers running them
+                        return
+                    name, turns = ready.popleft()
+                try:
+                    emails = next(turns)
+                except StopIteration:
+                    continue
+                except Exception as error:
+                    results[name]['error'] = str(error)
+                    print(f"{Fore.RED}Account {name} failed: {error}")
+                    continue
+                results[name]['emails'] += emails
+                results[name]['turns'] += 1
+                with lock:
+                    ready.append((name, turns))
+
+        workers = min(self.workers, len(self.agents))
+        if workers:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(work) for _ in range(workers)]:
+                    future.result()
+
+        self.results = results
+        for name, result in results.items():
+            if result['error'] is None:
+                print(f"{Fore.GREEN}{name}: {result['emails']} emails processed.")
+        if self.agents and all(result['error'] is not None for result in results.values()):
+            raise RuntimeError(f"All {len(results)} accounts failed")
+        return results
+
+    def request_stop(self):
+        """Ask every account to stop after its current email (thread-safe)."""
+        for agent in self.agents.values():
+            agent.request_stop()
+
+    def report(self):
+        """Return each account's Gmail throttling, retries and circuit breaker activity, as a list of lines."""
+        return [f"{name}: {agent.gmail.backend.summary()}" for name, agent in self.agents.items()]
+
+    def close(self):
+        for agent in self.agents.values():
+            agent.storage.close()
+            if agent.sync_state is not None:
+                agent.sync_state.close()
@@ -0,0 +1,197 @@
+import re
+from collections import namedtuple
+from email.utils import getaddresses
+from utilities.address_index import address_domain, normalize_address, parent_domains
+
+# Fields a rule can match on, in precedence order (the first field that matches wins)
+RULE_FIELDS = [
+    'subject',           # exact subject, after normalization
+    'subject_template',  # subject with dates, numbers and IDs replaced by placeholders
+    'subject_prefix',    # normalized subject starts with the pattern (longest prefix wins)
+    'subject_regex',     # regular expression searched in the normalized subject
+    'list_id',           # List-Id header, e.g. "digest.example.com"
+    'sender',            # sender e-mail address
+    'sender_domain',     # sender domain; "example.com" also matches "mail.example.com"
+    'recipient',         # an address (or "*@domain") in To
+    'cc',                # an address (or "*@domain") in Cc
+]
+
+# Constructs that depend on a pattern's own group numbers or position, which a combined alternation would break:
+# numbered or named backreferences, conditionals on a group and global flags like (?i) (not preceded by an escape)
+SELF_REFERENCING = re.compile(r'(?<!\\)(?:\\\\)*(?:\\[1-9]|\\g<|\(\?P=|\(\?\(|^\(\?[aiLmsux]+\))')
+
+REPLY_PREFIX = re.compile(r'^\s*((re|fw|fwd|aw|tr)\s*:\s*)+', re.IGNORECASE)
+MONTHS = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+TEMPLATE_PATTERNS = [
+    (re.compile(r'\b\d{4}-\d{1,2}-\d{1,2}\b'), '<date>'),
+    (re.compile(r'\b\d{1,2}[/.]\d{1,2}[/.]\d{2,4}\b'), '<date>'),
+    (re.compile(rf'\b{MONTHS}\s+\d{{1,2}}(st|nd|rd|th)?(,?\s+\d{{4}})?\b'), '<date>'),
+    (re.compile(rf'\b\d{{1,2}}(st|nd|rd|th)?\s+{MONTHS}(,?\s+\d{{4}})?\b'), '<date>'),
+    (re.compile(r'\b[0-9a-f]*\d[0-9a-f]*\b', re.IGNORECASE), '<n>'),
+]
+
+class Rule(namedtuple('Rule', ['field', 'pattern', 'action', 'reason', 'source'])):
+    def describe(self):
+        """Human readable description of the rule, e.g. "sender_domain=intuit.com"."""
+        return f"{self.field}={self.pattern} ({self.source})"
+
+def normalize_subject(subject):
+    """Lowercase, drop Re:/Fwd: prefixes and collapse whitespace."""
+    subject = REPLY_PREFIX.sub('', subject or '')
+    return re.sub(r'\s+', ' ', subject).strip().lower()
+
+def template_subject(subject):
+    """Replace the parts of a subject that change between recurring emails with placeholders."""
+    templated = normalize_subject(subject)
+    for pattern, placeholder in TEMPLATE_PATTERNS:
+        templated = pattern.sub(placeholder, templated)
+    return templated
+
+class RuleEngine:
+    """Compiled, indexed set of rules built from the training data.
+
+    Exact fields live in hash maps and subject prefixes in a character trie, so those lookups
+    cost a handful of dict probes whatever the number of rules. Subject regexes are joined into
+    one alternation, which saves a search call per rule but is still backtracking: its cost grows
+    with the number of regex rules. Regexes using backreferences, named groups or global flags
+    are compiled on their own and tried after the combined ones.
+    """
+
+    def __init__(self, rules=()):
+        self.exact = {field: {} for field in ('subject', 'subject_template', 'list_id', 'sender', 'sender_domain', 'recipient', 'cc')}
+        self.prefix_trie = {}
+        self.regex_rules = []
+        self.combined_regex = None
+        # (compiled pattern, rule) of the regexes that cannot be part of the alternation
+        self.separate_regexes = []
+        for rule in rules:
+            self.add_rule(rule, compile_regexes=False)
+        self.compile_regexes()
+
+    @classmethod
+    def from_training_data(cls, training_data):
+        """Build rules from training examples, the always-ignore list and explicit 'rules' entries."""
+        engine = cls()
+        for subject, example in training_data.items():
+            if isinstance(example, dict) and 'action' in example:
+                engine.add_example(subject, example, compile_regexes=False)
+        for sender in training_data.get('always_ignore_senders', []):
+            engine.add_ignored_sender(sender)
+        for entry in training_data.get('rules', []):
+            engine.add_rule(Rule(entry['field'], entry['pattern'], entry['action'], entry.get('reason', ''), 'rules'), compile_regexes=False)
+        engine.compile_regexes()
+        return engine
+
+    def add_example(self, subject, example, compile_regexes=True):
+        """Add the exact and templated subject rules for one training example."""
+        action, reason = example['action'], example.get('reason', '')
+        self.add_rule(Rule('subject', normalize_subject(subject), action, reason, 'training'), compile_regexes)
+        self.add_rule(Rule('subject_template', template_subject(subject), action, reason, 'training'), compile_regexes)
+
+    def add_ignored_sender(self, sender):
+        self.add_rule(Rule('sender', normalize_address(sender) or sender.strip().lower(), 'ignore', 'always ignore', 'always_ignore_senders'))
+
+    def add_rule(self, rule, compile_regexes=True):
+        """Index a single rule; later rules for the same key override earlier ones."""
+        if rule.field not in RULE_FIELDS:
+            raise ValueError(f"Unknown rule field: {rule.field}")
+
+        pattern = rule.pattern.strip().lower()
+        if rule.field == 'subject_prefix':
+            node = self.prefix_trie
+            for char in normalize_subject(pattern):
+                node = node.setdefault(char, {})
+            node[None] = rule
+        elif rule.field == 'subject_regex':
+            try:
+                compiled = re.compile(rule.pattern, re.IGNORECASE)
+            except re.error as error:
+                raise ValueError(f"Invalid subject_regex {rule.pattern!r}: {error}") from error
+            if compiled.groupindex or SELF_REFERENCING.search(rule.pattern):
+                self.separate_regexes.append((compiled, rule))
+            else:
+                self.regex_rules.append(rule)
+                if compile_regexes:
+                    self.compile_regexes()
+        else:
+            if rule.field in ('subject', 'subject_template'):
+                pattern = normalize_subject(pattern)
+            elif rule.field == 'list_id':
+                pattern = pattern.strip('<>')
+            self.exact[rule.field][pattern] = rule
+
+    def compile_regexes(self):
+        """Combine the self-contained subject regexes into one alternation with a named group per rule."""
+        if self.regex_rules:
+            self.combined_regex = re.compile('|'.join(f'(?P<r{i}>{rule.pattern})' for i, rule in enumerate(self.regex_rules)), re.IGNORECASE)
+        else:
+            self.combined_regex = None
+
+    def match(self, subject='', sender='', recipients=(), cc_list=(), list_id=''):
+        """Return the first rule (in RULE_FIELDS order) that matches the email, or None."""
+        normalized = normalize_subject(subject)
+
+        rule = self.exact['subject'].get(normalized) or self.exact['subject_template'].get(template_subject(subject))
+        if rule:
+            return rule
+
+        rule = self.match_prefix(normalized)
+        if rule:
+            return rule
+
+        if self.combined_regex is not None:
+            found = self.combined_regex.search(normalized)
+            if found:
+                return self.regex_rules[int(found.lastgroup[1:])]
+        for compiled, rule in self.separate_regexes:
+            if compiled.search(normalized):
+                return rule
+
+        if list_id:
+            rule = self.exact['list_id'].get(normalize_address(list_id) or list_id.strip().strip('<>').lower())
+            if rule:
+                return rule
+
+        sender_address = normalize_address(sender)
+        if sender_address:
+            rule = self.exact['sender'].get(sender_address) or self.match_domain('sender_domain', address_domain(sender_address))
+            if rule:
+                return rule
+
+        for field, values in (('recipient', recipients), ('cc', cc_list)):
+            for _, address in getaddresses(list(values)):
+                address = address.lower()
+                rule = self.exact[field].get(address) or self.match_domain(field, address_domain(address), prefix='*@')
+                if rule:
+                    return rule
+        return None
+
+    def match_prefix(self, normalized_subject):
+        """Walk the prefix trie and return the rule of the longest matching prefix."""
+        node, best = self.prefix_trie, None
+        for char in normalized_subject:
+            node = node.get(char)
+            if node is None:
+                break
+            best = node.get(None, best)
+        return best
+
+    def match_domain(self, field, domain, prefix=''):
+        for candidate in parent_domains(domain):
+            rule = self.exact[field].get(prefix + candidate)
+            if rule:
+                return rule
+        return None
+
+    def match_email(self, email_data):
+        """Match a Gmail API message against the rules."""
+        headers = {}
+        for header in email_data['payload'].get('headers', []):
+            headers.setdefault(header['name'].lower(), header['value'])
+        return self.match(
+            subject=headers.get('subject', ''),
+            sender=headers.get('from', ''),
+            recipients=[headers['to']] if 'to' in headers else [],
+            cc_list=[headers['cc']] if 'cc' in headers else [],
+            list_id=headers.get('list-id', ''),
+        )
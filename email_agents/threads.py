@@ -0,0 +1,133 @@
+"""Conversation-level classification: group unread messages by thread and reuse a thread's decision."""
+import re
+from utilities import message_parser
+from utilities.address_index import normalize_address, parse_addresses
+
+# Earlier messages summarized in the digest sent with a thread's latest message, and the length of each line
+DIGEST_MESSAGES = 5
+DIGEST_LINE_CHARS = 160
+# Reply and forward prefixes, in a few languages, removed to compare the subjects of a thread
+SUBJECT_PREFIXES = re.compile(r'^\s*((re|fw|fwd|aw|wg|tr|sv|rv)\s*(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+
+def thread_subject(subject):
+    """Subject without reply/forward prefixes, lowercased with collapsed whitespace."""
+    return ' '.join(SUBJECT_PREFIXES.sub('', subject or '').split()).lower()
+
+def message_time(email_data):
+    """Gmail's internalDate (milliseconds), or 0 when the message has none."""
+    try:
+        return int(email_data.get('internalDate', 0))
+    except (TypeError, ValueError):
+        return 0
+
+def participants(email_data):
+    """Normalized addresses of the From, To and Cc headers."""
+    values = [message_parser.get_header(email_data, name, '') for name in ('From', 'To', 'Cc')]
+    return {address for _, address in parse_addresses(*values)}
+
+def is_reply(email_data):
+    """True if the message answers an earlier one, so its thread may hold other messages."""
+    return bool(message_parser.get_header(email_data, 'In-Reply-To') or message_parser.get_header(email_data, 'References'))
+
+def digest(emails):
+    """One line per earlier message (oldest first, at most DIGEST_MESSAGES): sender and the start of its text."""
+    lines = []
+    for email_data in sorted(emails, key=message_time)[-DIGEST_MESSAGES:]:
+        sender = message_parser.get_header(email_data, 'From', '')
+        text = email_data.get('snippet') or message_parser.extract_body(email_data, max_tokens=DIGEST_LINE_CHARS // 4)
+        line = f"{normalize_address(sender) or sender}: {' '.join(text.split())}"
+        lines.append(line if len(line) <= DIGEST_LINE_CHARS else line[:DIGEST_LINE_CHARS - 3] + '...')
+    return '\n'.join(lines)
+
+def group_by_thread(emails, indexes):
+    """Split indexes of (message_id, email_data) pairs into the latest message of each thread and its earlier ones.
+
+    Returns {latest index: [earlier indexes]}; messages without a threadId are their own group.
+    """
+    latest = {}
+    groups = {}
+    for index in indexes:
+        thread_id = emails[index][1].get('threadId') or ('message', index)
+        current = latest.get(thread_id)
+        # Gmail lists newest first, so on equal times the first message listed is the latest
+        if current is None or message_time(emails[index][1]) > message_time(emails[current][1]):
+            latest[thread_id] = index
+        groups.setdefault(thread_id, []).append(index)
+    return {latest[thread_id]: [index for index in group if index != latest[thread_id]] for thread_id, group in groups.items()}
+
+def latest_per_thread(emails):
+    """Keep the latest of the emails of each conversation, in their original order."""
+    latest = {}
+    for email_data in emails:
+        thread_id = email_data.get('threadId') or ('message', email_data['id'])
+        if thread_id not in latest or message_time(email_data) > message_time(latest[thread_id]):
+            latest[thread_id] = email_data
+    kept = {id(email_data) for email_data in latest.values()}
+    return [email_data for email_data in emails if id(email_data) in kept]
+
+class ThreadDecisions:
+    """The last action taken on each conversation, and what it was based on, stored with the agent's other data.
+
+    A decision is reused for a new message of the thread unless the message changes the participants
+    (an address that was not on the thread before), the intent (a different subject once reply and forward
+    prefixes are removed), or whether the user is a direct recipient. Decisions are written in bulk with
+    the queued actions (see EmailAgent.flush_actions).
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        # Decisions read or made during this run, and the thread IDs not written yet
+        self.decisions = {}
+        self.unsaved = set()
+
+    def load(self, thread_ids):
+        """Read the stored decisions of the threads not seen yet in this run, in one query."""
+        missing = [thread_id for thread_id in dict.fromkeys(thread_ids) if thread_id and thread_id not in self.decisions]
+        if missing:
+            stored = self.storage.load_thread_decisions(missing)
+            for thread_id in missing:
+                self.decisions[thread_id] = stored.get(thread_id)
+
+    def reusable(self, email_data, own_addresses):
+        """Return the thread's decision if it still applies to this message, else None."""
+        decision = self.decisions.get(email_data.get('threadId'))
+        if decision is None:
+            return None
+        if thread_subject(message_parser.get_header(email_data, 'Subject', '')) != decision['subject']:
+            return None
+        if not participants(email_data) <= set(decision['participants']):
+            return None
+        if self.is_direct(email_data, own_addresses) != decision['direct']:
+            return None
+        return decision
+
+    def is_direct(self, email_data, own_addresses):
+        return own_addresses.match_any(address for _, address in parse_addresses(message_parser.get_header(email_data, 'To', '')))
+
+    def remember(self, email_data, action, explanation, own_addresses):
+        """Record the action taken on a message as its thread's decision (the earlier explanation is kept for reused ones)."""
+        thread_id = email_data.get('threadId')
+        if not thread_id:
+            return
+        previous = self.decisions.get(thread_id)
+        known = set(previous['participants']) if previous else set()
+        if previous and message_time(email_data) < previous.get('time', 0):
+            # An earlier message of the conversation only adds its participants to the newer decision
+            decision = dict(previous)
+        else:
+            decision = {
+                'action': action,
+                'explanation': explanation if explanation is not None else (previous or {}).get('explanation', ''),
+                'subject': thread_subject(message_parser.get_header(email_data, 'Subject', '')),
+                'direct': self.is_direct(email_data, own_addresses),
+                'time': message_time(email_data),
+            }
+        decision['participants'] = sorted(known | participants(email_data))
+        self.decisions[thread_id] = decision
+        self.unsaved.add(thread_id)
+
+    def save(self):
+        """Write the decisions made since the last save in one transaction."""
+        if self.unsaved:
+            unsaved, self.unsaved = self.unsaved, set()
+            self.storage.save_thread_decisions({thread_id: self.decisions[thread_id] for thread_id in unsaved})
@@ -1,99 +1,343 @@
-import os
-import pickle
+import json
 import base64
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import logging
+import time
 from googleapiclient.errors import HttpError
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from utilities.metrics import Metrics
+from utilities.rate_limiter import RateLimiter
+from utilities.resilience import ResilientBackend, is_retryable
+from utilities.storage import TOKEN_PICKLE, Storage
 
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify',  # Allows reading, modifying, and deleting emails
     'https://www.googleapis.com/auth/gmail.send'     # Allows sending emails
 ]
 
+# Name of the OAuth token in the agent's storage
+TOKEN_NAME = 'gmail'
+# OAuth client of the app (the same for every account; each account's token is kept in its own storage)
+CREDENTIALS_PATH = 'credentials.json'
+
+# Gmail accepts up to 100 calls per batch request but recommends no more than 50
+BATCH_SIZE = 50
+# messages.batchModify accepts at most 1000 message IDs per call
+BATCH_MODIFY_LIMIT = 1000
+
+# Gmail quota units per method, see https://developers.google.com/gmail/api/reference/quota
+QUOTA_UNITS = {
+    'getProfile': 1,
+    'settings.sendAs.list': 1,
+    'history.list': 2,
+    'labels.list': 1,
+    'labels.create': 5,
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.modify': 5,
+    'messages.batchModify': 50,
+    'drafts.create': 10,
+}
+# Per-user limit of 250 quota units per second
+QUOTA_UNITS_PER_SECOND = 250
+
+def default_gmail_backend(log_level=logging.INFO):
+    """Rate limiter, retries and circuit breaker sized to the per-user Gmail quota."""
+    return ResilientBackend('gmail', limiters={
+        'quota': RateLimiter(QUOTA_UNITS_PER_SECOND * 60, burst=QUOTA_UNITS_PER_SECOND),
+    }, log_level=log_level)
+
+# Headers of the original message needed to reply in its thread
+REPLY_HEADERS = ['Subject', 'From', 'Reply-To', 'Message-ID', 'References']
+
+def build_reply(email_data, response_text):
+    """Return the drafts.create body of a reply to a Gmail API message, threaded with In-Reply-To and References."""
+    headers = {}
+    for header in email_data['payload'].get('headers', []):
+        headers.setdefault(header['name'].lower(), header['value'])
+
+    message = MIMEMultipart()
+    message['to'] = headers.get('reply-to') or headers.get('from', '')
+    subject = headers.get('subject', '')
+    message['subject'] = subject if subject.lower().startswith('re:') else f'Re: {subject}'
+    message_id = headers.get('message-id')
+    if message_id:
+        message['In-Reply-To'] = message_id
+        message['References'] = f"{headers['references']} {message_id}" if headers.get('references') else message_id
+    message.attach(MIMEText(response_text, 'plain'))
+
+    draft = {'message': {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}}
+    if email_data.get('threadId'):
+        draft['message']['threadId'] = email_data['threadId']
+    return draft
+
+class HistoryExpiredError(Exception):
+    """Raised when a startHistoryId is too old for users.history.list and a full sync is needed."""
+
 class GmailIntegration:
-    def __init__(self):
+    def __init__(self, service=None, backend=None, storage=None, metrics=None, credentials_path=CREDENTIALS_PATH,
+                 token_pickle=TOKEN_PICKLE, log_level=logging.INFO):
         self.creds = None
-        self.authenticate()
+        self.storage = storage
+        self.credentials_path = credentials_path
+        # Token pickled by earlier versions, or None when it belongs to another account
+        self.token_pickle = token_pickle
+        # Time of every call per API method ('gmail.messages.list', ...) and failed calls
+        self.metrics = metrics or Metrics()
+        # Every API call goes through the backend's quota limiter, retries and circuit breaker
+        self.backend = backend or default_gmail_backend(log_level)
+        if service is not None:
+            # Use a pre-built (or fake) Gmail service instead of running the OAuth flow
+            self.service = service
+        else:
+            self.authenticate()
 
     def authenticate(self):
         """Authenticate the user and build the Gmail service."""
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
-                self.creds = pickle.load(token)
+        # The auth and discovery modules are only needed here, not by runs that are handed a service
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from googleapiclient.discovery import build
+
+        storage = self.storage or Storage()
+        # Tokens pickled by earlier versions are moved to the store once
+        if self.token_pickle:
+            storage.migrate_pickled_token(TOKEN_NAME, self.token_pickle)
+        token = storage.load_token(TOKEN_NAME)
+        if token is not None:
+            self.creds = Credentials.from_authorized_user_info(json.loads(token), SCOPES)
 
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
                 self.creds.refresh(Request())
             else:
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+                flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, SCOPES)
                 self.creds = flow.run_local_server(port=0)
 
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(self.creds, token)
+            storage.save_token(TOKEN_NAME, self.creds.to_json())
 
+        # google-api-python-client 2.x builds from its bundled discovery document by default, without fetching it
         self.service = build('gmail', 'v1', credentials=self.creds)
 
+    def execute(self, request, method):
+        """Execute an API request, throttled by its quota cost and retried on 429/5xx."""
+        try:
+            with self.metrics.timer(f'gmail.{method}'):
+                return self.backend.call(request.execute, {'quota': QUOTA_UNITS[method]})
+        except Exception:
+            self.metrics.increment('errors', stage=f'gmail.{method}')
+            raise
+
     def list_messages(self, query=''):
         """List all messages that match the query string."""
-        try:
-            results = self.service.users().messages().list(userId='me', q=query).execute()
-            messages = results.get('messages', [])
-            return messages
-        except HttpError as error:
-            print(f'An error occurred: {error}')
-            return []
+        return list(self.iter_messages(query=query))
+
+    def iter_messages(self, query='', page_size=500):
+        """Yield the messages that match the query string, following nextPageToken page by page."""
+        messages_api = self.service.users().messages()
+        request = messages_api.list(userId='me', q=query, maxResults=page_size)
+        while request is not None:
+            try:
+                results = self.execute(request, 'messages.list')
+            except HttpError as error:
+                print(f'An error occurred: {error}')
+                return
+            for message in results.get('messages', []):
+                yield message
+            request = messages_api.list_next(request, results)
+
+    def list_message_page(self, query='', page_token=None, page_size=500):
+        """Return the message IDs of one page of results and the token of the next page (None on the last page)."""
+        params = {'userId': 'me', 'q': query, 'maxResults': page_size}
+        if page_token:
+            params['pageToken'] = page_token
+        results = self.execute(self.service.users().messages().list(**params), 'messages.list')
+        return [message['id'] for message in results.get('messages', [])], results.get('nextPageToken')
 
     def get_message(self, message_id):
         """Retrieve a specific message by its ID."""
         try:
-            message = self.service.users().messages().get(userId='me', id=message_id).execute()
+            message = self.execute(self.service.users().messages().get(userId='me', id=message_id), 'messages.get')
             return message
         except HttpError as error:
             print(f'An error occurred: {error}')
             return None
 
-    def archive_message(self, message_id):
-        """Archive a specific message by ID."""
+    def get_profile(self):
+        """Return the mailbox profile (emailAddress, historyId, ...)."""
+        return self.execute(self.service.users().getProfile(userId='me'), 'getProfile')
+
+    def get_send_as(self):
+        """Return the send-as aliases of the mailbox (sendAsEmail, displayName, isPrimary, ...), or [] on error."""
         try:
-            self.service.users().messages().modify(userId='me', id=message_id, body={'removeLabelIds': ['INBOX']}).execute()
+            response = self.execute(self.service.users().settings().sendAs().list(userId='me'), 'settings.sendAs.list')
         except HttpError as error:
-            print(f'An error occurred: {error}')
+            print(f'Could not list send-as aliases: {error}')
+            return []
+        return response.get('sendAs', [])
 
-    def draft_reply(self, message_id, response_text):
-        """Draft a reply to a specific message."""
-        try:
-            original_message = self.service.users().messages().get(userId='me', id=message_id).execute()
-            message_payload = original_message['payload']
-            headers = message_payload.get('headers', [])
-            subject = [h['value'] for h in headers if h['name'] == 'Subject'][0]
-            sender = [h['value'] for h in headers if h['name'] == 'From'][0]
+    def get_own_addresses(self):
+        """Return the mailbox address and its send-as aliases."""
+        addresses = [self.get_profile()['emailAddress']]
+        for alias in self.get_send_as():
+            if alias['sendAsEmail'] not in addresses:
+                addresses.append(alias['sendAsEmail'])
+        return addresses
 
-            message = MIMEMultipart()
-            message['to'] = sender
-            message['subject'] = f'Re: {subject}'
+    def get_display_name(self):
+        """Return the display name of the primary send-as address, or the mailbox address' local part."""
+        for alias in self.get_send_as():
+            if alias.get('isPrimary') and alias.get('displayName'):
+                return alias['displayName']
+        return self.get_profile()['emailAddress'].partition('@')[0]
 
-            msg_text = MIMEText(response_text, 'plain')
-            message.attach(msg_text)
+    def list_added_message_ids(self, start_history_id, label_id='UNREAD'):
+        """Return the IDs of messages added since start_history_id that still carry label_id (any label if None).
 
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        Raises HistoryExpiredError when Gmail no longer has history that far back.
+        """
+        history_api = self.service.users().history()
+        params = {'userId': 'me', 'startHistoryId': start_history_id, 'historyTypes': ['messageAdded']}
+        if label_id is not None:
+            params['labelId'] = label_id
+        request = history_api.list(**params)
+        message_ids = []
+        while request is not None:
+            try:
+                results = self.execute(request, 'history.list')
+            except HttpError as error:
+                if error.resp.status == 404:
+                    raise HistoryExpiredError(f'History {start_history_id} is no longer available') from error
+                raise
+            for record in results.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added['message']
+                    if label_id is None or label_id in message.get('labelIds', [label_id]):
+                        message_ids.append(message['id'])
+            request = history_api.list_next(request, results)
+        return list(dict.fromkeys(message_ids))
 
-            draft = self.service.users().drafts().create(
-                userId='me',
-                body={'message': {'raw': raw_message}}
-            ).execute()
+    def get_messages(self, message_ids, format='full', fields=None, metadata_headers=None):
+        """Retrieve several messages through the batch HTTP API, in the same order as message_ids.
+
+        Messages that could not be fetched are returned as None, like get_message.
+        """
+        def make_request(message_id):
+            params = {'userId': 'me', 'id': message_id, 'format': format}
+            if fields:
+                params['fields'] = fields
+            if metadata_headers:
+                params['metadataHeaders'] = metadata_headers
+            return self.service.users().messages().get(**params)
+
+        results = self.execute_batch(list(dict.fromkeys(message_ids)), make_request, 'messages.get', 'fetching message')
+        return [results.get(message_id) for message_id in message_ids]
+
+    def execute_batch(self, request_ids, make_request, method, description):
+        """Run make_request(request_id) for every ID through the batch HTTP API; return {request_id: response}.
+
+        Calls of a batch that were rate limited or failed with a 5xx are retried in a new batch.
+        """
+        pending = list(request_ids)
+        results = {}
+        failed = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                failed[request_id] = exception
+            else:
+                results[request_id] = response
+
+        attempt = 1
+        while pending:
+            for start in range(0, len(pending), BATCH_SIZE):
+                chunk = pending[start:start + BATCH_SIZE]
+                batch = self.service.new_batch_http_request(callback=callback)
+                for request_id in chunk:
+                    batch.add(make_request(request_id), request_id=request_id)
+                try:
+                    with self.metrics.timer(f'gmail.{method}.batch'):
+                        self.backend.call(batch.execute, {'quota': QUOTA_UNITS[method] * len(chunk)})
+                except HttpError as error:
+                    self.metrics.increment('errors', stage=f'gmail.{method}')
+                    print(f'An error occurred: {error}')
+
+            # Individual calls of a batch can be rate limited too; retry just those
+            pending = [request_id for request_id, error in failed.items() if is_retryable(error)]
+            if pending and attempt < self.backend.retry_policy.max_attempts:
+                self.backend.metrics.increment('retries', len(pending))
+                time.sleep(self.backend.retry_policy.delay(attempt))
+                attempt += 1
+                for request_id in pending:
+                    del failed[request_id]
+            else:
+                pending = []
+
+        if failed:
+            self.metrics.increment('errors', len(failed), stage=f'gmail.{method}')
+        for request_id, error in failed.items():
+            print(f'An error occurred while {description} {request_id}: {error}')
+        return results
+
+    def batch_modify(self, message_ids, add_label_ids=None, remove_label_ids=None):
+        """Add and/or remove labels on many messages with messages.batchModify; return the IDs that failed."""
+        message_ids = list(dict.fromkeys(message_ids))
+        failed = []
+        for start in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+            body = {'ids': message_ids[start:start + BATCH_MODIFY_LIMIT]}
+            if add_label_ids:
+                body['addLabelIds'] = add_label_ids
+            if remove_label_ids:
+                body['removeLabelIds'] = remove_label_ids
+            try:
+                self.execute(self.service.users().messages().batchModify(userId='me', body=body), 'messages.batchModify')
+            except HttpError as error:
+                print(f'An error occurred: {error}')
+                failed.extend(body['ids'])
+        return failed
 
-            return draft
+    def archive_messages(self, message_ids):
+        """Archive several messages at once; return the IDs that could not be archived."""
+        return self.batch_modify(message_ids, remove_label_ids=['INBOX'])
+
+    def mark_messages_as_read(self, message_ids):
+        """Mark several messages as read at once; return the IDs that could not be marked."""
+        return self.batch_modify(message_ids, remove_label_ids=['UNREAD'])
+
+    def archive_message(self, message_id):
+        """Archive a specific message by ID."""
+        try:
+            self.execute(self.service.users().messages().modify(userId='me', id=message_id, body={'removeLabelIds': ['INBOX']}), 'messages.modify')
+        except HttpError as error:
+            print(f'An error occurred: {error}')
+
+    def draft_reply(self, message_id, response_text, email_data=None):
+        """Draft a reply to a specific message, in its thread.
+
+        Pass the already fetched message as email_data to save a messages.get call.
+        """
+        try:
+            if email_data is None:
+                email_data = self.execute(self.service.users().messages().get(
+                    userId='me', id=message_id, format='metadata', metadataHeaders=REPLY_HEADERS), 'messages.get')
+            return self.execute(self.service.users().drafts().create(
+                userId='me',
+                body=build_reply(email_data, response_text)
+            ), 'drafts.create')
         except HttpError as error:
             print(f'An error occurred: {error}')
             return None
 
+    def create_drafts(self, replies):
+        """Create reply drafts for (email_data, response_text) pairs in batch requests; return {message_id: draft}."""
+        bodies = {email_data['id']: build_reply(email_data, response_text) for email_data, response_text in replies}
+        make_request = lambda message_id: self.service.users().drafts().create(userId='me', body=bodies[message_id])
+        return self.execute_batch(list(bodies), make_request, 'drafts.create', 'drafting a reply to')
+
     def get_or_create_label(self, label_name):
         """Get the label ID for the given label name or create it if it doesn't exist."""
-        labels = self.service.users().labels().list(userId='me').execute()
+        labels = self.execute(self.service.users().labels().list(userId='me'), 'labels.list')
         for label in labels['labels']:
             if label['name'] == label_name:
                 return label['id']
@@ -104,25 +348,25 @@ class GmailIntegration:
             'messageListVisibility': 'show',
             'name': label_name
         }
-        new_label = self.service.users().labels().create(userId='me', body=label).execute()
+        new_label = self.execute(self.service.users().labels().create(userId='me', body=label), 'labels.create')
         return new_label['id']
 
     def apply_label(self, message_id, label_id):
         """Apply a label to a message."""
-        self.service.users().messages().modify(
+        self.execute(self.service.users().messages().modify(
             userId='me',
             id=message_id,
             body={'addLabelIds': [label_id]}
-        ).execute()
+        ), 'messages.modify')
 
     def mark_as_read(self, message_id):
         """Mark a specific message as read."""
         try:
-            self.service.users().messages().modify(
+            self.execute(self.service.users().messages().modify(
                 userId='me',
                 id=message_id,
                 body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            ), 'messages.modify')
             print(f'Marked message {message_id} as read.')
         except HttpError as error:
             print(f'An error occurred while marking message {message_id} as read: {error}')
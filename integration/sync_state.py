@@ -0,0 +1,52 @@
+import sqlite3
+import threading
+import time
+
+class SyncState:
+    """Persists the last Gmail historyId and a ledger of messages that were already processed."""
+
+    def __init__(self, path='sync_state.db'):
+        self.lock = threading.Lock()
+        # Turns of a multi-account run resume on whichever worker thread is free, serialized by self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS processed ('
+            'message_id TEXT PRIMARY KEY, action TEXT, processed_at REAL NOT NULL)'
+        )
+        self.conn.commit()
+
+    def get_history_id(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM state WHERE key = 'history_id'").fetchone()
+        return row[0] if row else None
+
+    def set_history_id(self, history_id):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('history_id', ?)", (str(history_id),))
+
+    def filter_unprocessed(self, message_ids):
+        """Return the message IDs that are not in the ledger yet, keeping their order."""
+        processed = set()
+        # Stay well below SQLite's limit on bound parameters
+        with self.lock:
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f'SELECT message_id FROM processed WHERE message_id IN ({placeholders})', chunk)
+                processed.update(row[0] for row in rows)
+        return [message_id for message_id in message_ids if message_id not in processed]
+
+    def mark_processed(self, entries):
+        """Record (message_id, action) pairs in the ledger in a single transaction."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO processed (message_id, action, processed_at) VALUES (?, ?, ?)',
+                [(message_id, action, now) for message_id, action in entries]
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,12 +1,107 @@
 import argparse
-from email_agents.email_agent import EmailAgent
+import logging
+from utilities.llm_helper import DEFAULT_BATCH_SIZE
+from utilities.prompt_builder import DEFAULT_EMAIL_TOKENS
 
-def main(training=False, model="gpt-4"):
-    # Initialize Email Agent with training mode and selected model
-    email_agent = EmailAgent(training_mode=training, model_choice=model)
+# The agents (and openai, the Google clients and numpy behind them) are imported by the command that runs,
+# so --help and -evaluate-local start without them
 
-    # Process unread emails
-    email_agent.process_emails()
+def main(training=False, model="gpt-4", concurrency=1, use_cache=True, local_classifier_options=None, sync=True,
+         daemon=False, poll_interval=300, push_port=None, max_email_tokens=DEFAULT_EMAIL_TOKENS, max_run_tokens=None, llm_batch_size=DEFAULT_BATCH_SIZE,
+         draft_replies=False, your_name=None, log_level=logging.INFO, metrics_json=None, metrics_port=None,
+         accounts_path=None, account_name=None, account_workers=4, turn_size=50, group_threads=True):
+    from email_agents.daemon import EmailAgentDaemon
+    from email_agents.email_agent import EmailAgent
+    from email_agents.email_drafting_agent import EmailDraftingAgent
+    from integration.sync_state import SyncState
+    from utilities.llm_cache import LLMCache
+    from utilities.metrics import JsonLinesExporter, Metrics, PrometheusExporter, SummaryExporter
+    from utilities.model_cascade import create_llm_helper
+
+    # Stage timings and counters: a table at the end, plus JSON lines and/or a Prometheus endpoint when asked
+    metrics = Metrics([SummaryExporter()])
+    if metrics_json:
+        metrics.add_exporter(JsonLinesExporter(metrics_json))
+    if metrics_port is not None:
+        metrics.add_exporter(PrometheusExporter(metrics_port))
+
+    # Reuse earlier LLM answers for emails that were already classified
+    cache = LLMCache() if use_cache else None
+    # A single model, or a cascade of models ('cascade:small,large') that escalates unsure answers
+    llm_helper = create_llm_helper(model, cache=cache, max_email_tokens=max_email_tokens, max_run_tokens=max_run_tokens,
+                                   max_batch_size=llm_batch_size, metrics=metrics, log_level=log_level)
+
+    # Write a reply draft, in the right thread, for every email classified 'reply'
+    create_drafting_agent = lambda: EmailDraftingAgent(model_choice=model, llm_helper=llm_helper, cache=cache,
+                                                       your_name=your_name) if draft_replies else None
+
+    if accounts_path:
+        # One warm agent per account of the manifest, each with its own Gmail service, token, rules and ledger,
+        # all sharing the LLM client, cache, rate limiters and run budget
+        from email_agents.multi_account import MultiAccountRunner, load_accounts
+        accounts = load_accounts(accounts_path)
+        if account_name:
+            accounts = [account for account in accounts if account.name == account_name]
+            if not accounts:
+                raise ValueError(f"Account {account_name} is not in {accounts_path}")
+        agents = {account.name: account.create_agent(llm_helper, metrics, sync=sync, training_mode=training, model_choice=model,
+                                                     concurrency=concurrency, local_classifier_options=local_classifier_options,
+                                                     drafting_agent=create_drafting_agent(), log_level=log_level,
+                                                     group_threads=group_threads)
+                  for account in accounts}
+        email_agent = MultiAccountRunner(agents, workers=account_workers, turn_size=turn_size)
+    else:
+        # Only fetch mail added since the last run, and never classify a message twice
+        sync_state = SyncState() if sync else None
+
+        # Initialize Email Agent with training mode, selected model and LLM concurrency
+        email_agent = EmailAgent(training_mode=training, model_choice=model, llm_helper=llm_helper, concurrency=concurrency,
+                                 local_classifier_options=local_classifier_options, sync_state=sync_state,
+                                 drafting_agent=create_drafting_agent(), metrics=metrics, log_level=log_level,
+                                 group_threads=group_threads)
+
+    if daemon:
+        # Keep Gmail and the LLM client warm, and process new mail on every poll or push notification
+        EmailAgentDaemon(email_agent, poll_interval=poll_interval, push_port=push_port, log_level=log_level).run()
+    else:
+        # Process unread emails
+        email_agent.process_emails()
+
+    # Report throttling, retries and circuit breaker activity
+    if accounts_path:
+        for line in email_agent.report():
+            print(line)
+        email_agent.close()
+    else:
+        print(email_agent.gmail.backend.summary())
+
+    if cache is not None:
+        stats = cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        cache.close()
+
+    # Report LLM throttling, token usage and estimated spend per suggested action (per tier for a cascade)
+    for line in llm_helper.report():
+        print(line)
+    llm_helper.close()
+
+    # Print the stage timings, write the final JSON record and stop the metrics endpoint
+    metrics.close()
+
+def evaluate_local_classifier(local_classifier_options):
+    """Report how many LLM calls the local classifier would save on the labelled emails."""
+    from email_agents.local_classifier import LocalClassifier
+    from utilities.storage import Storage
+
+    storage = Storage()
+    storage.migrate_training_data()
+    training_data = storage.load_training_data()
+    storage.close()
+
+    report = LocalClassifier.from_training_data(training_data, **local_classifier_options).evaluate()
+    print(f"Labelled emails: {report['examples']}")
+    print(f"Answered locally: {report['answered_locally']} (LLM call reduction: {report['llm_call_reduction']:.0%})")
+    print(f"Agreement with labels: {report['agreement_rate']:.0%}")
 
 if __name__ == '__main__':
     # Initialize the argument parser
@@ -24,11 +119,197 @@ if __name__ == '__main__':
         '-model',
         type=str,
         default='gpt-4-turbo',  # Default model is 'gpt-4-turbo' if no model is specified
-        help='Choose which model to use for LLM processing (e.g., gpt-4, gpt-3.5-turbo, or TheBloke/Llama-2-13B-chat-GGUF)'
+        help='Choose which model to use for LLM processing (e.g., gpt-4, gpt-3.5-turbo, or TheBloke/Llama-2-13B-chat-GGUF), '
+             'or a cascade of models tried from cheapest to largest (e.g., cascade:gpt-4o-mini,gpt-4o)'
+    )
+
+    # Add the `--concurrency` argument to classify several emails at once
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        help='Number of emails classified by the LLM in parallel (default: 1, sequential)'
+    )
+
+    # Add the `--no-cache` flag to always query the LLM
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the on-disk LLM response cache (llm_cache.db)'
+    )
+
+    # Add the `--no-sync` flag to scan every unread email like a first run
+    parser.add_argument(
+        '--no-sync',
+        action='store_true',
+        help='Ignore the saved Gmail history checkpoint and processed-message ledger (sync_state.db)'
+    )
+
+    # Add the daemon options
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Keep running and process new mail every --poll-interval seconds and on push notifications'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        type=int,
+        default=300,
+        help='Seconds between two polls in daemon mode (default: 300)'
+    )
+    parser.add_argument(
+        '--push-port',
+        type=int,
+        default=None,
+        help='Local port for Pub/Sub push notifications (POST /push) in daemon mode'
+    )
+
+    # Add the local classifier options
+    parser.add_argument(
+        '--no-local-classifier',
+        action='store_true',
+        help='Send every email without a matching rule to the LLM'
+    )
+    parser.add_argument(
+        '--local-confidence',
+        type=float,
+        default=0.8,
+        help='Share of the similar labelled emails that must agree to skip the LLM (default: 0.8)'
+    )
+    parser.add_argument(
+        '--local-similarity',
+        type=float,
+        default=0.6,
+        help='Minimum cosine similarity for a labelled email to count as similar (default: 0.6)'
+    )
+    parser.add_argument(
+        '--local-neighbors',
+        type=int,
+        default=5,
+        help='Number of similar labelled emails that vote on the action (default: 5)'
+    )
+
+    # Add the token budget options
+    parser.add_argument(
+        '--max-email-tokens',
+        type=int,
+        default=DEFAULT_EMAIL_TOKENS,
+        help=f'Maximum tokens of subject and body sent to the LLM per email (default: {DEFAULT_EMAIL_TOKENS})'
+    )
+    parser.add_argument(
+        '--max-run-tokens',
+        type=int,
+        default=None,
+        help='Stop querying the LLM once this many tokens were used (for the lifetime of the process in daemon mode); remaining emails are left for the next run'
+    )
+
+    # Add the `--llm-batch-size` argument to classify several emails per LLM request
+    parser.add_argument(
+        '--llm-batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f'Most emails classified in one LLM request; batches are smaller when the token budgets require it (default: {DEFAULT_BATCH_SIZE}, 1 to disable batching)'
+    )
+
+    # Add the `--draft-replies` flag to draft an answer to every email classified 'reply'
+    parser.add_argument(
+        '--draft-replies',
+        action='store_true',
+        help='Create a Gmail draft replying to each email classified "reply", from templates.json refined by the LLM'
+    )
+
+    # Add the `--your-name` argument used to sign drafted replies
+    parser.add_argument(
+        '--your-name',
+        type=str,
+        default=None,
+        help="Name used to sign drafted replies (default: the display name of your Gmail address)"
+    )
+
+    # Add the logging and metrics options
+    parser.add_argument(
+        '--log-level',
+        choices=['debug', 'info', 'warning', 'error'],
+        default='info',
+        help='info prints every email; warning only prints problems, for unattended runs (training mode always prints)'
+    )
+    parser.add_argument(
+        '--metrics-json',
+        type=str,
+        default=None,
+        help='Append one JSON line per email (with a trace ID) and a final summary to this file ("-" for stdout)'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=None,
+        help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics while the agent runs'
+    )
+
+    # Add the `--no-thread-grouping` flag to classify every message of a conversation on its own
+    parser.add_argument(
+        '--no-thread-grouping',
+        action='store_true',
+        help='Classify each unread message on its own instead of once per conversation, without reusing earlier decisions on the thread'
+    )
+
+    # Add the multi-account options
+    parser.add_argument(
+        '--accounts',
+        type=str,
+        default=None,
+        help='Serve every account of this manifest (e.g. accounts.json) from one process, each with its own token, training data and ledger'
+    )
+    parser.add_argument(
+        '--account',
+        type=str,
+        default=None,
+        help='With --accounts, only process (or train, with -training) the account of this name'
+    )
+    parser.add_argument(
+        '--account-workers',
+        type=int,
+        default=4,
+        help='Number of accounts processed at the same time with --accounts (default: 4)'
+    )
+    parser.add_argument(
+        '--turn-size',
+        type=int,
+        default=50,
+        help='Emails an account processes before the next account gets a turn with --accounts (default: 50)'
+    )
+
+    # Add the `-evaluate-local` flag to measure the local classifier offline
+    parser.add_argument(
+        '-evaluate-local',
+        action='store_true',
+        help='Evaluate the local classifier on the training data (leave-one-out) and exit'
     )
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
-    # Call the main function with the training flag and selected model
-    main(training=args.training, model=args.model)
+    local_classifier_options = {
+        'neighbors': args.local_neighbors,
+        'min_similarity': args.local_similarity,
+        'min_confidence': args.local_confidence,
+    }
+    if args.daemon and args.training:
+        parser.error('-training is interactive and cannot be combined with --daemon')
+    if args.account and not args.accounts:
+        parser.error('--account selects an account of the --accounts manifest')
+    if args.accounts and args.training and not args.account:
+        parser.error('-training is interactive; pick the account to train with --account')
+
+    if args.evaluate_local:
+        evaluate_local_classifier(local_classifier_options)
+    else:
+        # Call the main function with the training flag, selected model and concurrency
+        main(training=args.training, model=args.model, concurrency=args.concurrency, use_cache=not args.no_cache,
+             local_classifier_options=None if args.no_local_classifier else local_classifier_options,
+             sync=not args.no_sync, daemon=args.daemon, poll_interval=args.poll_interval, push_port=args.push_port,
+             max_email_tokens=args.max_email_tokens, max_run_tokens=args.max_run_tokens, llm_batch_size=args.llm_batch_size,
+             draft_replies=args.draft_replies, your_name=args.your_name, log_level=getattr(logging, args.log_level.upper()),
+             metrics_json=args.metrics_json, metrics_port=args.metrics_port, accounts_path=args.accounts,
+             account_name=args.account, account_workers=args.account_workers, turn_size=args.turn_size,
+             group_threads=not args.no_thread_grouping)
@@ -0,0 +1,255 @@
+"""In-memory stand-in for the Gmail API service returned by googleapiclient's build()."""
+import base64
+import random
+import time
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+class FakeRequest:
+    def __init__(self, service, method, handler):
+        self.service = service
+        self.method = method
+        self.handler = handler
+
+    def execute(self):
+        self.service.round_trip()
+        return self.run()
+
+    def run(self):
+        self.service.calls.append(self.method)
+        # Injected errors are raised before the call has any effect
+        errors = self.service.errors.get(self.method)
+        if errors:
+            raise errors.pop(0)
+        rate = self.service.error_rates.get(self.method)
+        if rate and self.service.random.random() < rate:
+            raise http_error(503)
+        return self.handler()
+
+
+class FakeBatchRequest:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request))
+
+    def execute(self):
+        # A whole batch costs a single HTTP round trip
+        self.service.round_trip()
+        for request_id, request in self.requests:
+            try:
+                response, exception = request.run(), None
+            except Exception as error:
+                response, exception = None, error
+            self.callback(request_id, response, exception)
+
+
+class FakeMessages:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, q='', maxResults=100, pageToken=None):
+        def handler():
+            matching = [m for m in self.service.messages.values() if self.service.matches(m, q)]
+            start = int(pageToken or 0)
+            page = matching[start:start + maxResults]
+            result = {'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in page]}
+            if start + maxResults < len(matching):
+                result['nextPageToken'] = str(start + maxResults)
+            return result
+        request = FakeRequest(self.service, 'messages.list', handler)
+        request.params = {'q': q, 'maxResults': maxResults}
+        return request
+
+    def list_next(self, previous_request, previous_response):
+        page_token = previous_response.get('nextPageToken')
+        if not page_token:
+            return None
+        return self.list('me', pageToken=page_token, **previous_request.params)
+
+    def get(self, userId, id, format='full', fields=None, metadataHeaders=None):
+        def handler():
+            if id not in self.service.messages:
+                raise KeyError(f'Message {id} not found')
+            return self.service.messages[id]
+        return FakeRequest(self.service, 'messages.get', handler)
+
+    def modify(self, userId, id, body):
+        def handler():
+            self.service.apply_labels(id, body)
+            return self.service.messages[id]
+        return FakeRequest(self.service, 'messages.modify', handler)
+
+    def batchModify(self, userId, body):
+        def handler():
+            for message_id in body['ids']:
+                self.service.apply_labels(message_id, body)
+            return {}
+        return FakeRequest(self.service, 'messages.batchModify', handler)
+
+
+class FakeHistory:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, labelId=None, pageToken=None):
+        def handler():
+            if int(startHistoryId) < self.service.oldest_history_id:
+                raise http_error(404)
+            # Like Gmail's, a messageAdded record carries the labels the message had when it was added
+            records = [
+                {'id': str(history_id), 'messagesAdded': [{'message': {
+                    'id': message_id,
+                    'threadId': self.service.messages[message_id]['threadId'],
+                    'labelIds': list(label_ids),
+                }}]}
+                for history_id, message_id, label_ids in self.service.history
+                if history_id > int(startHistoryId) and (labelId is None or labelId in label_ids)
+            ]
+            return {'history': records, 'historyId': str(self.service.history_id)}
+        return FakeRequest(self.service, 'history.list', handler)
+
+    def list_next(self, previous_request, previous_response):
+        return None
+
+
+class FakeDrafts:
+    def __init__(self, service):
+        self.service = service
+
+    def create(self, userId, body):
+        def handler():
+            draft = {'id': f'draft{len(self.service.drafts) + 1}', 'message': body['message']}
+            self.service.drafts.append(draft)
+            return draft
+        return FakeRequest(self.service, 'drafts.create', handler)
+
+
+class FakeSendAs:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId):
+        def handler():
+            primary = {'sendAsEmail': self.service.email_address, 'isPrimary': True}
+            return {'sendAs': [primary] + [{'sendAsEmail': alias} for alias in self.service.aliases]}
+        return FakeRequest(self.service, 'settings.sendAs.list', handler)
+
+
+class FakeSettings:
+    def __init__(self, service):
+        self.service = service
+
+    def sendAs(self):
+        return FakeSendAs(self.service)
+
+
+class FakeUsers:
+    def __init__(self, service):
+        self.service = service
+
+    def settings(self):
+        return FakeSettings(self.service)
+
+    def drafts(self):
+        return FakeDrafts(self.service)
+
+    def messages(self):
+        return FakeMessages(self.service)
+
+    def history(self):
+        return FakeHistory(self.service)
+
+    def getProfile(self, userId):
+        def handler():
+            return {'emailAddress': self.service.email_address, 'historyId': str(self.service.history_id)}
+        return FakeRequest(self.service, 'getProfile', handler)
+
+
+class FakeGmailService:
+    """Keeps messages in memory and records every API method and HTTP round trip."""
+
+    def __init__(self, messages=None, email_address='me@example.com', aliases=()):
+        self.messages = {}
+        self.calls = []
+        self.http_requests = 0
+        # Maps an API method (e.g. 'messages.get') to exceptions raised by its next calls
+        self.errors = {}
+        # Maps an API method to the share of its calls failing with a 503, and the delay of every HTTP round trip
+        self.error_rates = {}
+        self.random = random.Random(0)
+        self.latency = 0.0
+        self.email_address = email_address
+        # Send-as aliases, listed after the primary address by settings.sendAs.list
+        self.aliases = list(aliases)
+        self.drafts = []
+        # Every added message bumps the mailbox historyId, like Gmail does
+        self.history_id = 1000
+        self.history = []
+        self.oldest_history_id = 0
+        for message in messages or []:
+            self.add_message(message)
+
+    def round_trip(self):
+        self.http_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_message(self, message):
+        message.setdefault('threadId', message['id'])
+        message.setdefault('labelIds', ['INBOX', 'UNREAD'])
+        self.messages[message['id']] = message
+        self.history_id += 1
+        self.history.append((self.history_id, message['id'], tuple(message['labelIds'])))
+
+    def expire_history(self):
+        """Drop the recorded history, so older startHistoryIds get a 404."""
+        self.oldest_history_id = self.history_id
+
+    def matches(self, message, query):
+        if query == 'is:unread':
+            return 'UNREAD' in message['labelIds']
+        return True
+
+    def apply_labels(self, message_id, body):
+        labels = self.messages[message_id]['labelIds']
+        for label in body.get('removeLabelIds', []):
+            if label in labels:
+                labels.remove(label)
+        for label in body.get('addLabelIds', []):
+            if label not in labels:
+                labels.append(label)
+
+    def users(self):
+        return FakeUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+
+def http_error(status, headers=None, content=b'{}'):
+    """Build a googleapiclient HttpError with the given status and response headers."""
+    response = httplib2.Response(dict(headers or {}, status=status))
+    return HttpError(response, content)
+
+
+def make_message(message_id, subject='Hello', sender='sender@example.com', to='me@example.com', cc=None, body=''):
+    """Build a Gmail API message resource with the given headers."""
+    headers = [
+        {'name': 'Subject', 'value': subject},
+        {'name': 'From', 'value': sender},
+        {'name': 'To', 'value': to},
+    ]
+    if cc:
+        headers.append({'name': 'Cc', 'value': cc})
+    return {
+        'id': message_id,
+        'payload': {
+            'headers': headers,
+            'parts': [{'mimeType': 'text/plain', 'body': {'data': base64.urlsafe_b64encode(body.encode()).decode()}}],
+        },
+    }
@@ -0,0 +1,38 @@
+"""In-memory stand-in for LLMHelper, used by the agent tests."""
+import threading
+
+class FakeLLMHelper:
+    """Answers each email with suggest(email_data) -> (action, explanation) and records what was classified."""
+
+    def __init__(self, suggest=None, max_batch_size=10):
+        self.suggest = suggest or (lambda email_data: ('reply', ''))
+        self.max_batch_size = max_batch_size
+        self.lock = threading.Lock()
+        self.classified = []
+        self.requests = 0
+
+    def suggest_action(self, email_data):
+        return self.suggest_actions([email_data])[0]
+
+    def suggest_actions(self, emails):
+        with self.lock:
+            self.requests += 1
+            self.classified.extend(email_data['id'] for email_data in emails)
+        results = []
+        for email_data in emails:
+            action, explanation = self.suggest(email_data)
+            results.append((action, explanation, None))
+        return results
+
+def answers(*suggestions):
+    """Return a suggest function giving each suggestion in turn; exceptions in the list are raised."""
+    remaining = list(suggestions)
+    lock = threading.Lock()
+
+    def suggest(email_data):
+        with lock:
+            suggestion = remaining.pop(0)
+        if isinstance(suggestion, Exception):
+            raise suggestion
+        return suggestion
+    return suggest
@@ -0,0 +1,92 @@
+"""Local OpenAI-compatible completions server (like llama.cpp's) for the backend tests."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeCompletionsHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive between requests
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests.append(body)
+            server.connections.add(self.client_address)
+            status = server.statuses.pop(0) if server.statuses else 200
+
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        answer = server.answer(body['prompt'])
+        if not body.get('stream'):
+            payload = json.dumps({'choices': [{'text': answer + server.trailer}],
+                                  'usage': {'prompt_tokens': len(body['prompt']) // 4, 'completion_tokens': 42}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        text = answer + server.trailer
+        try:
+            for start in range(0, len(text), server.chunk_size):
+                self.write_chunk('data: ' + json.dumps({'choices': [{'text': text[start:start + server.chunk_size]}]}) + '\n\n')
+                with server.lock:
+                    server.chunks_sent += 1
+                time.sleep(server.delay)
+            self.write_chunk('data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early, like a llama.cpp server that stops generating
+            with server.lock:
+                server.hang_ups += 1
+            self.close_connection = True
+
+    def write_chunk(self, data):
+        data = data.encode()
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+class FakeCompletionsServer(ThreadingHTTPServer):
+    """Answers POST /completions with answer(prompt), streamed in small chunks, followed by trailer."""
+
+    daemon_threads = True
+
+    def __init__(self, answer, trailer='', chunk_size=8, delay=0.0):
+        super().__init__(('127.0.0.1', 0), FakeCompletionsHandler)
+        self.answer = answer
+        self.trailer = trailer
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = set()
+        self.statuses = []
+        self.chunks_sent = 0
+        self.hang_ups = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
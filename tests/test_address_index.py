@@ -0,0 +1,36 @@
+import sys
+import os
+import unittest
+
+# Ensure the repository root is in the Python path to access utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utilities.address_index import AddressIndex, parse_addresses
+
+class TestAddressIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up an index with an address, a header value and domain rules."""
+        self.index = AddressIndex(['ceo@example.com', '"News, Weekly" <News@Digest.example>', '*@bigcustomer.com', '@partner.org'])
+
+    def test_addresses_are_normalized(self):
+        """Test that display names and case do not matter."""
+        self.assertIn('CEO <CEO@example.com>', self.index)
+        self.assertIn('news@digest.example', self.index)
+        self.assertNotIn('cfo@example.com', self.index)
+
+    def test_domain_rules_match_subdomains(self):
+        """Test that domain rules match the domain and its subdomains only."""
+        self.assertIn('Jane <jane@bigcustomer.com>', self.index)
+        self.assertIn('jane@eu.bigcustomer.com', self.index)
+        self.assertNotIn('jane@notbigcustomer.com', self.index)
+        self.assertTrue(self.index.match_any(['a@example.net', 'b@mail.partner.org']))
+        self.assertFalse(self.index.match_any(['', 'not an address']))
+
+    def test_parse_addresses_keeps_quoted_commas(self):
+        """Test that a comma inside a quoted display name does not split an address."""
+        self.assertEqual(parse_addresses('"Doe, Jane" <Jane@Example.com>, bob@example.com', 'Carol <carol@example.com>'), [
+            ('Doe, Jane', 'jane@example.com'), ('', 'bob@example.com'), ('Carol', 'carol@example.com'),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import sys
+import os
+import tempfile
+import unittest
+
+# Ensure the repository root is in the Python path to access contact_agent and utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from contact_agent.contact_import import import_contacts
+from utilities.storage import Storage
+
+HEADER = 'First Name,Middle Name,Last Name,Nickname,Organization Name,Organization Title,E-mail 1 - Value,E-mail 2 - Value,Phone 1 - Value\n'
+
+class TestContactImport(unittest.TestCase):
+    def setUp(self):
+        """Set up an in-memory store and a temporary export file."""
+        self.storage = Storage(':memory:')
+        self.addCleanup(self.storage.close)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.csv_path = os.path.join(self.tmpdir.name, 'contacts.csv')
+
+    def write_export(self, rows):
+        with open(self.csv_path, 'w') as file:
+            file.write(HEADER + ''.join(row + '\n' for row in rows))
+
+    def test_rows_are_normalized(self):
+        """Test null filling, e-mail coalescing, and that rows without e-mail are skipped."""
+        self.write_export([
+            'John,,Doe,JD,Acme,CEO,john@acme.com,,555',
+            ',,Solo,,,,,solo@example.com ::: other@example.com,',
+            'No,,Email,,,,,,',
+        ])
+
+        self.assertEqual(import_contacts(self.csv_path, self.storage), 2)
+
+        contacts = self.storage.load_contacts()
+        self.assertEqual(sorted(contacts), ['John_Doe_john@acme.com', '_Solo_solo@example.com'])
+        john = contacts['John_Doe_john@acme.com']
+        self.assertEqual((john['middle_name'], john['organization'], john['title']), ('', 'Acme', 'CEO'))
+        self.assertEqual((john['category'], john['vip'], john['last_interaction']), (None, False, None))
+
+    def test_import_is_chunked_and_keeps_existing_contacts(self):
+        """Test that duplicates across chunks and already stored contacts are not overwritten."""
+        self.storage.save_contact('Ann_Lee_ann@example.com', {'email': 'ann@example.com', 'category': 'friends', 'vip': True})
+        self.write_export([f'Person,,{i},,,,p{i}@example.com,,' for i in range(25)] +
+                          ['Person,,0,,,,p0@example.com,,', 'Ann,,Lee,,,,ann@example.com,,'])
+
+        self.assertEqual(import_contacts(self.csv_path, self.storage, chunk_size=10), 25)
+
+        contacts = self.storage.load_contacts()
+        self.assertEqual(len(contacts), 26)
+        self.assertEqual(contacts['Ann_Lee_ann@example.com']['category'], 'friends')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import sys
+import os
+import unittest
+
+# Ensure the repository root is in the Python path to access contact_agent
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from contact_agent.contact_table import (apply_changes, changed_rows, contacts_frame, filter_contacts, get_page,
+                                         page_count)
+
+CONTACTS = {
+    'bob': {'first_name': 'Bob', 'last_name': 'Stone', 'email': 'bob@acme.com', 'organization': 'Acme',
+            'category': 'customers', 'vip': True, 'last_interaction': '2024-05-01T09:00:00'},
+    'ann': {'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com', 'organization': '',
+            'category': None, 'vip': False, 'last_interaction': None},
+    'x': {'first_name': '', 'last_name': '', 'nickname': '', 'email': 'x@example.org', 'organization': 'Acme'},
+}
+
+class TestContactTable(unittest.TestCase):
+    def setUp(self):
+        self.frame = contacts_frame(CONTACTS)
+
+    def test_frame_keeps_stored_values(self):
+        self.assertEqual(list(self.frame.index), ['ann', 'bob', 'x'])
+        self.assertEqual(self.frame.loc['bob', 'category'], 'customers')
+        self.assertTrue(self.frame.loc['bob', 'vip'])
+        self.assertIsNone(self.frame.loc['ann', 'category'])
+        self.assertFalse(self.frame.loc['x', 'vip'])
+        self.assertEqual(self.frame.loc['x', 'name'], 'x@example.org')
+
+    def test_search_and_category_filter(self):
+        self.assertEqual(list(filter_contacts(self.frame, 'ACME').index), ['bob', 'x'])
+        self.assertEqual(list(filter_contacts(self.frame, 'acme', 'customers').index), ['bob'])
+        self.assertEqual(len(filter_contacts(self.frame)), 3)
+
+    def test_pages(self):
+        self.assertEqual(page_count(self.frame, 2), 2)
+        self.assertEqual(page_count(self.frame.iloc[:0], 2), 1)
+        self.assertEqual(list(get_page(self.frame, 2, 2).index), ['x'])
+
+    def test_only_edited_cells_are_changes(self):
+        edited = self.frame.copy()
+        self.assertEqual(changed_rows(self.frame, edited), {})
+        edited.loc['ann', 'category'] = 'friends'
+        edited.loc['bob', 'vip'] = False
+        self.assertEqual(changed_rows(self.frame, edited), {'ann': {'category': 'friends'}, 'bob': {'vip': False}})
+
+    def test_apply_changes_copies_only_changed_contacts(self):
+        updated = apply_changes(CONTACTS, {'ann': {'category': 'friends', 'vip': True}})
+        self.assertEqual(list(updated), ['ann'])
+        self.assertEqual(updated['ann']['category'], 'friends')
+        self.assertIs(updated['ann']['vip'], True)
+        self.assertIsNone(CONTACTS['ann']['category'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import sys
+import os
+import base64
+import io
+import json
+import logging
+import threading
+import time
+import unittest
+import urllib.request
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock
+
+# Ensure the repository root is in the Python path to access email_agents
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from email_agents.daemon import EmailAgentDaemon
+
+def push(port, history_id):
+    """Deliver a Pub/Sub push envelope, like the Gmail watch() subscription does."""
+    data = base64.b64encode(json.dumps({'emailAddress': 'me@example.com', 'historyId': history_id}).encode()).decode()
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/push', data=json.dumps({'message': {'data': data}}).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    return urllib.request.urlopen(request).status
+
+class TestEmailAgentDaemon(unittest.TestCase):
+    def setUp(self):
+        """Set up a daemon around a fake agent whose runs take 50ms."""
+        self.agent = MagicMock()
+        self.runs = []
+        self.agent.process_emails.side_effect = lambda: (self.runs.append(time.monotonic()), time.sleep(0.05))
+        self.daemon = EmailAgentDaemon(self.agent, poll_interval=60, push_port=0, queue_size=5)
+        self.port = self.daemon.server.server_address[1]
+        self.thread = threading.Thread(target=self.daemon.run)
+        self.thread.start()
+        self.addCleanup(self.thread.join, 5)
+        self.addCleanup(self.daemon.stop)
+
+    def test_burst_of_push_notifications_is_coalesced(self):
+        """Test that a burst of pushes triggers a few runs, not one per notification."""
+        for history_id in range(30):
+            self.assertEqual(push(self.port, history_id), 204)
+        time.sleep(0.3)
+
+        # One startup run plus at most a couple of runs for the whole burst
+        self.assertGreaterEqual(len(self.runs), 2)
+        self.assertLessEqual(len(self.runs), 4)
+        self.assertGreater(self.daemon.coalesced, 0)
+
+    def test_stop_waits_for_current_run(self):
+        """Test that stopping lets the in-flight run finish and shuts the endpoint down."""
+        time.sleep(0.01)
+        self.daemon.stop()
+        self.thread.join(5)
+
+        self.assertFalse(self.thread.is_alive())
+        self.agent.request_stop.assert_called_once()
+        self.assertEqual(self.daemon.runs, 1)
+
+    def test_backoff_after_failures(self):
+        """Test that consecutive failures back off exponentially up to the cap."""
+        self.daemon.failures = 0
+        self.assertEqual(self.daemon.next_delay(), 60)
+        self.daemon.failures = 2
+        self.assertTrue(120 <= self.daemon.next_delay() <= 240)
+        self.daemon.failures = 10
+        self.assertLessEqual(self.daemon.next_delay(), self.daemon.max_backoff)
+
+class TestDaemonOutput(unittest.TestCase):
+    def test_warning_level_only_prints_failed_runs(self):
+        """Test that unattended daemons print failed runs but not the per-run chatter."""
+        agent = MagicMock()
+        daemon = EmailAgentDaemon(agent, log_level=logging.WARNING)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            daemon.run_once('poll')
+            agent.process_emails.side_effect = RuntimeError('Gmail down')
+            daemon.run_once('poll')
+        self.assertEqual(output.getvalue(), 'Run triggered by poll failed (1 in a row): Gmail down\n')
+
+if __name__ == '__main__':
+    unittest.main()
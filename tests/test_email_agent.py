@@ -1,18 +1,31 @@
 import sys
 import os
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 
 # Ensure the parent directory is in the Python path to access email_agents and integration
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'email_agents')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'integration')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 
 from email_agent import EmailAgent
+from gmail_integration import GmailIntegration
+from fake_gmail import FakeGmailService, make_message
+from fake_llm import FakeLLMHelper
+from utilities.storage import Storage
 
 class TestEmailAgent(unittest.TestCase):
     def setUp(self):
         """Set up the email agent for each test."""
-        self.agent = EmailAgent(training_mode=True)
+        self.service = FakeGmailService()
+        # An in-memory store seeded from training_data.json, so the tests never write to disk
+        self.storage = Storage(':memory:')
+        self.addCleanup(self.storage.close)
+        self.agent = EmailAgent(training_mode=True, gmail=GmailIntegration(service=self.service), llm_helper=FakeLLMHelper(),
+                                storage=self.storage)
 
     @patch('integration.gmail_integration.GmailIntegration')  # Corrected path to integration
     def test_process_email_with_training(self, MockGmailIntegration):
@@ -37,30 +50,95 @@ class TestEmailAgent(unittest.TestCase):
 
         self.assertEqual(self.agent.training_data["Follow Up Task"]['action'], 'reply')
         self.assertEqual(self.agent.training_data["Follow Up Task"]['reason'], 'Urgent task to follow up')
+        self.assertEqual(self.storage.load_training_data()["Follow Up Task"]['action'], 'reply')
 
-    @patch('integration.gmail_integration.GmailIntegration')  # Corrected path to integration
-    def test_auto_ignore_when_cc(self, MockGmailIntegration):
-        """Test that the agent auto-suggests ignore when the user is CC'd."""
-        mock_gmail = MockGmailIntegration.return_value
-        mock_gmail.get_message.return_value = {
-            'payload': {
-                'headers': [
-                    {'name': 'From', 'value': 'test_sender@example.com'},
-                    {'name': 'To', 'value': 'primary_recipient@domain.com'},
-                    {'name': 'Cc', 'value': 'your_email@domain.com'}
-                ]
-            }
-        }
+    def test_auto_ignore_when_cc(self):
+        """Test that the agent auto-suggests ignore when one of the user's addresses is only CC'd."""
+        self.service.aliases = ['me@alias.example']
+        email_data = make_message('12345', subject='Project kickoff', to='"Doe, Jane" <jane@example.com>, bob@example.com',
+                                  cc='"Me, Myself" <ME@alias.example>')
 
         with patch('builtins.input', side_effect=['y']):
-            self.agent.process_email_with_training(
-                message_id="12345",
-                email_data=mock_gmail.get_message("12345"),
-                subject="Jesus just messaged you",
-                suggested_action="reply"
-            )
+            self.agent.process_email('12345', email_data)
+
+        self.assertEqual(self.agent.pending_actions['ignore'], ['12345'])
+        self.assertEqual(self.agent.get_sender_and_recipients(email_data)[1], ['"Doe, Jane" <jane@example.com>', 'bob@example.com'])
+
+    def test_cc_and_ignore_list_apply_in_automatic_mode(self):
+        """Test that automatic mode ignores CC-only mail and always-ignored senders without asking the LLM."""
+        self.agent.training_mode = False
+        self.agent.update_ignore_list('News <news@example.com>')
+        self.service.add_message(make_message('cc', subject='FYI', to='team@example.com', cc='me@example.com'))
+        self.service.add_message(make_message('news', subject='Weekly news', sender='"The News" <NEWS@example.com>'))
+        self.service.add_message(make_message('direct', subject='Question for you', to='me@example.com', cc='me@example.com'))
+
+        self.agent.process_emails()
+
+        self.assertEqual(self.agent.llm_helper.classified, ['direct'])
+        read = [message_id for message_id, message in self.service.messages.items() if 'UNREAD' not in message['labelIds']]
+        self.assertEqual(sorted(read), ['cc', 'news'])
+        self.assertEqual(self.storage.load_training_data()['always_ignore_senders'][-1], 'News <news@example.com>')
+
+    def test_reply_drafts_are_created_in_bulk(self):
+        """Test that emails classified 'reply' get a threaded draft, without refetching them."""
+        self.agent.training_mode = False
+        self.agent.drafting_agent = MagicMock(your_name=None)
+        self.agent.drafting_agent.draft_replies.side_effect = lambda emails: [f"Re {email_data['id']}" for email_data in emails]
+        for i in range(3):
+            self.service.add_message(make_message(f'r{i}', subject=f'Question {i}'))
+
+        self.agent.process_emails()
+
+        self.assertEqual(self.agent.drafting_agent.your_name, 'me')
+        self.assertEqual([draft['message']['threadId'] for draft in self.service.drafts], ['r0', 'r1', 'r2'])
+        # The originals are fetched once, to classify them
+        self.assertEqual(self.service.calls.count('messages.get'), 3)
+
+    def test_process_emails_flushes_actions_in_bulk(self):
+        """Test that automatic mode fetches in batches and applies actions with batchModify."""
+        for i in range(120):
+            self.service.add_message(make_message(f'm{i}', subject=f'Unseen subject {i}'))
+        self.agent.training_mode = False
+        self.agent.llm_helper.suggest = lambda email_data: (
+            ('archive', '') if int(email_data['id'][1:]) % 2 else ('ignore', ''))
+
+        self.agent.process_emails()
+
+        self.assertEqual(self.service.calls.count('messages.batchModify'), 2)
+        self.assertNotIn('messages.modify', self.service.calls)
+        self.assertNotIn('INBOX', self.service.messages['m1']['labelIds'])
+        self.assertNotIn('UNREAD', self.service.messages['m2']['labelIds'])
+        self.assertEqual(self.agent.pending_actions, {'archive': [], 'ignore': []})
+
+    def test_concurrent_classification_applies_actions_in_order(self):
+        """Test that batched LLM requests run in parallel but actions are applied in inbox order."""
+        for i in range(20):
+            self.service.add_message(make_message(f'm{i}', subject=f'Unseen subject {i}'))
+        self.agent.training_mode = False
+        self.agent.concurrency = 4
+        self.agent.llm_helper.max_batch_size = 5
+
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_suggestion(email_data):
+            with lock:
+                active.append(email_data['id'])
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(email_data['id'])
+            return 'reply', ''
+        self.agent.llm_helper.suggest = slow_suggestion
+
+        applied = []
+        with patch.object(self.agent, 'apply_instruction', side_effect=lambda message_id, action, email_data=None: applied.append(message_id)):
+            self.agent.process_emails()
 
-        self.assertEqual(self.agent.training_data["Jesus just messaged you"]['action'], 'ignore')
+        self.assertEqual(applied, [f'm{i}' for i in range(20)])
+        self.assertGreater(max(peak), 1)
+        self.assertLessEqual(max(peak), 4)
 
 if __name__ == '__main__':
     unittest.main()
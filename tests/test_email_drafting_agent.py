@@ -1,24 +1,30 @@
 import sys
 import os
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock
 
 # Ensure the parent directory is in the Python path to access email_agents
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'email_agents')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 
-from email_drafting_agent import EmailDraftingAgent
+from email_drafting_agent import EmailDraftingAgent, render_template
+from fake_gmail import make_message
 
 class TestEmailDraftingAgent(unittest.TestCase):
     def setUp(self):
         """Set up the drafting agent for each test."""
-        self.agent = EmailDraftingAgent()
+        self.llm_helper = MagicMock()
+        self.llm_helper.complete.return_value = "Refined email content"
+        self.agent = EmailDraftingAgent(llm_helper=self.llm_helper, your_name="Francis")
 
     def test_load_templates(self):
-        """Test that templates are loaded correctly from the external file."""
+        """Test that templates are loaded correctly from the external file, and parsed only once."""
         templates = self.agent.load_templates()
         self.assertIn('follow_up', templates)
         self.assertIn('meeting_request', templates)
         self.assertIn('status_update', templates)
+        self.assertIs(EmailDraftingAgent().load_templates(), templates)
 
     def test_select_template(self):
         """Test the correct template is selected based on context."""
@@ -30,25 +36,41 @@ class TestEmailDraftingAgent(unittest.TestCase):
         self.assertIn('schedule a meeting', meeting_template)
         self.assertIn('update', status_template)
 
-    @patch('openai.Completion.create')
-    def test_refine_email_with_llm(self, mock_openai):
-        """Test that the LLM is called to refine the email template and print the generated email."""
-        mock_openai.return_value.choices = [unittest.mock.Mock(text="Refined email content")]
+    def test_render_template_keeps_unknown_placeholders(self):
+        """Test that known placeholders are filled and the others are left for the LLM."""
+        rendered = render_template("Hi {recipient_name}, about {topic}: {update_details}", recipient_name="John", topic=None)
+        self.assertEqual(rendered, "Hi John, about {topic}: {update_details}")
 
+    def test_refine_email_with_llm(self):
+        """Test that the LLM is called to refine the email template."""
         # Generate a refined email
         refined_email = self.agent.draft_email(
             email_context="Please follow up with the client",
             recipient_name="John Doe",
-            your_name="Francis"
+            your_name="Francis",
+            topic="pricing"
         )
 
-        # Print the generated email to see the output
-        print("Generated Email Content:\n", refined_email)
-        
-        # Check the mock was called
-        mock_openai.assert_called_once()
+        # Check the LLM was called once, on the filled-in template
+        self.llm_helper.complete.assert_called_once()
+        prompt = self.llm_helper.complete.call_args.args[1]
+        self.assertIn("our previous conversation about pricing", prompt)
+        self.assertIn("Cheers,\nFrancis", prompt)
         # Ensure the refined email contains the expected content
         self.assertIn("Refined email content", refined_email)
 
+    def test_replies_are_drafted_concurrently_and_cached(self):
+        """Test that replies to several emails are drafted, and the same context is refined once."""
+        emails = [make_message('m1', subject='Meeting next week', sender='John Doe <john@example.com>', body='Are you free?'),
+                  make_message('m2', subject='Meeting next week', sender='John Doe <john@example.com>', body='Are you free?'),
+                  make_message('m3', subject='Status', sender='ann@example.com', body='Where are we?')]
+        self.llm_helper.complete.side_effect = lambda system, prompt, **options: f"Draft for {prompt.count('John')}"
+
+        drafts = self.agent.draft_replies(emails)
+
+        self.assertEqual(drafts, ['Draft for 2', 'Draft for 2', 'Draft for 0'])
+        self.assertEqual(self.llm_helper.complete.call_count, 2)
+        self.assertIn("'ann'", self.llm_helper.complete.call_args_list[-1].args[1])
+
 if __name__ == '__main__':
     unittest.main()
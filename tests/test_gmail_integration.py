@@ -0,0 +1,78 @@
+import sys
+import os
+import base64
+import email
+import unittest
+
+# Ensure the repository root is in the Python path to access integration
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from integration.gmail_integration import GmailIntegration, build_reply
+from fake_gmail import FakeGmailService, make_message
+
+class TestGmailIntegration(unittest.TestCase):
+    def setUp(self):
+        """Set up a Gmail integration backed by a fake service with 1,200 unread messages."""
+        self.service = FakeGmailService([make_message(f'm{i}', subject=f'Email {i}') for i in range(1200)])
+        self.gmail = GmailIntegration(service=self.service)
+
+    def test_list_messages_follows_next_page_token(self):
+        """Test that listing walks every page instead of stopping after the first one."""
+        messages = self.gmail.list_messages(query='is:unread')
+
+        self.assertEqual(len(messages), 1200)
+        self.assertEqual(self.service.calls.count('messages.list'), 3)
+
+    def test_get_messages_batches_requests_and_keeps_order(self):
+        """Test that messages are fetched in batch requests and returned in order."""
+        ids = ['m5', 'm3', 'missing'] + [f'm{i}' for i in range(100, 200)]
+        messages = self.gmail.get_messages(ids)
+
+        self.assertEqual(messages[0]['id'], 'm5')
+        self.assertEqual(messages[1]['id'], 'm3')
+        self.assertIsNone(messages[2])
+        self.assertEqual(len(messages), len(ids))
+        # 103 messages at 50 per batch take 3 HTTP round trips
+        self.assertEqual(self.service.http_requests, 3)
+
+    def test_bulk_archive_and_mark_as_read_use_batch_modify(self):
+        """Test that bulk actions go through messages.batchModify in chunks of 1000."""
+        ids = [f'm{i}' for i in range(1200)]
+        self.gmail.archive_messages(ids)
+        self.gmail.mark_messages_as_read(ids[:10])
+
+        self.assertEqual(self.service.calls.count('messages.batchModify'), 3)
+        self.assertNotIn('messages.modify', self.service.calls)
+        self.assertNotIn('INBOX', self.service.messages['m1199']['labelIds'])
+        self.assertNotIn('UNREAD', self.service.messages['m0']['labelIds'])
+        self.assertIn('UNREAD', self.service.messages['m10']['labelIds'])
+
+    def test_replies_are_threaded(self):
+        """Test that a reply keeps the thread, the subject and the References chain of the original."""
+        original = make_message('m1', subject='Re: Pricing', sender='Ann <ann@example.com>')
+        original['threadId'] = 't1'
+        original['payload']['headers'] += [{'name': 'Message-ID', 'value': '<2@mail.example.com>'},
+                                           {'name': 'References', 'value': '<1@mail.example.com>'}]
+
+        draft = build_reply(original, 'Thanks!')
+        reply = email.message_from_bytes(base64.urlsafe_b64decode(draft['message']['raw']))
+
+        self.assertEqual(draft['message']['threadId'], 't1')
+        self.assertEqual(reply['To'], 'Ann <ann@example.com>')
+        self.assertEqual(reply['Subject'], 'Re: Pricing')
+        self.assertEqual(reply['In-Reply-To'], '<2@mail.example.com>')
+        self.assertEqual(reply['References'], '<1@mail.example.com> <2@mail.example.com>')
+
+    def test_create_drafts_uses_batch_requests(self):
+        """Test that drafts are created in batches, without fetching the originals again."""
+        replies = [(self.service.messages[f'm{i}'], f'Reply {i}') for i in range(60)]
+        drafts = self.gmail.create_drafts(replies)
+
+        self.assertEqual(len(drafts), 60)
+        self.assertEqual(self.service.http_requests, 2)
+        self.assertNotIn('messages.get', self.service.calls)
+        self.assertEqual(self.service.drafts[0]['message']['threadId'], 'm0')
+
+if __name__ == '__main__':
+    unittest.main()
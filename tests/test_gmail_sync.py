@@ -0,0 +1,101 @@
+import sys
+import os
+import unittest
+from datetime import datetime
+
+# Ensure the repository root is in the Python path to access contact_agent, integration and utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from contact_agent.gmail_sync import GmailContactSync
+from contact_agent.sla import SLAEngine
+from integration.gmail_integration import GmailIntegration
+from utilities.storage import Storage
+from fake_gmail import FakeGmailService, make_message
+
+SETTINGS = {'categories': {'friends': {'sla': 60, 'vip_sla': 30}}}
+
+def mail(message_id, when, sender, to='me@example.com', cc=None):
+    message = make_message(message_id, sender=sender, to=to, cc=cc)
+    message['internalDate'] = str(int(when.timestamp() * 1000))
+    return message
+
+class TestGmailContactSync(unittest.TestCase):
+    def setUp(self):
+        """Set up an in-memory store with three contacts and a fake mailbox."""
+        self.storage = Storage(':memory:')
+        self.addCleanup(self.storage.close)
+        self.storage.save_contacts({
+            'ann': {'first_name': 'Ann', 'email': 'Ann@Example.com', 'category': 'friends', 'last_interaction': None},
+            'bob': {'first_name': 'Bob', 'email': 'bob@example.com', 'category': 'friends', 'last_interaction': '2024-05-20T00:00:00'},
+            'cid': {'first_name': 'Cid', 'email': 'cid@example.com', 'category': 'friends', 'last_interaction': None},
+        })
+        self.service = FakeGmailService([
+            mail('m1', datetime(2024, 5, 1), '"Doe, Ann" <ann@example.com>'),
+            mail('m2', datetime(2024, 5, 10), 'me@example.com', to='ANN@example.com', cc='bob@example.com'),
+            mail('m3', datetime(2024, 4, 1), 'stranger@example.org'),
+        ])
+        self.gmail = GmailIntegration(service=self.service)
+        self.engine = SLAEngine(self.storage, SETTINGS)
+        self.sync = GmailContactSync(self.gmail, self.storage, self.engine, page_size=2)
+
+    def last_interactions(self):
+        return {contact_id: contact['last_interaction'] for contact_id, contact in self.storage.load_contacts().items()}
+
+    def test_first_sync_sets_latest_interaction(self):
+        self.assertEqual(self.sync.sync(), (3, 1))
+        self.assertEqual(self.last_interactions(), {
+            'ann': datetime(2024, 5, 10).isoformat(),
+            # A newer interaction is never replaced by an older message
+            'bob': '2024-05-20T00:00:00',
+            'cid': None,
+        })
+        # Only metadata is requested, in batches
+        self.assertEqual(self.service.calls.count('messages.get'), 3)
+        self.assertEqual(self.service.calls.count('messages.list'), 2)
+
+    def test_sync_updates_sla_due_dates(self):
+        self.sync.sync()
+        due = self.engine.due_contacts(datetime(2024, 7, 10))
+        self.assertEqual([contact_id for contact_id, _, _ in due], ['ann'])
+
+    def test_later_syncs_only_read_new_messages(self):
+        self.sync.sync()
+        self.service.calls.clear()
+        self.assertEqual(self.sync.sync(), (0, 0))
+        self.assertNotIn('messages.get', self.service.calls)
+
+        self.service.add_message(mail('m4', datetime(2024, 6, 1), 'cid@example.com'))
+        self.assertEqual(self.sync.sync(), (1, 1))
+        self.assertEqual(self.service.calls.count('messages.get'), 1)
+        self.assertEqual(self.last_interactions()['cid'], datetime(2024, 6, 1).isoformat())
+
+    def test_interrupted_first_sync_resumes_from_the_last_page(self):
+        list_message_page = self.gmail.list_message_page
+        pages = []
+
+        def fail_on_second_page(*args):
+            if pages:
+                raise ConnectionError('network down')
+            pages.append(args)
+            return list_message_page(*args)
+
+        self.gmail.list_message_page = fail_on_second_page
+        with self.assertRaises(ConnectionError):
+            self.sync.sync()
+        self.assertEqual(self.last_interactions()['ann'], datetime(2024, 5, 10).isoformat())
+
+        self.gmail.list_message_page = list_message_page
+        self.service.calls.clear()
+        self.assertEqual(self.sync.sync(), (1, 0))
+        self.assertEqual(self.service.calls.count('messages.get'), 1)
+
+    def test_expired_history_falls_back_to_a_scan(self):
+        self.sync.sync()
+        self.service.add_message(mail('m4', datetime(2024, 6, 1), 'cid@example.com'))
+        self.service.expire_history()
+        messages, updated = self.sync.sync()
+        self.assertEqual(updated, 1)
+        self.assertEqual(self.last_interactions()['cid'], datetime(2024, 6, 1).isoformat())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import sys
+import os
+import json
+import re
+import tempfile
+import time
+import unittest
+
+# Ensure the repository root is in the Python path to access utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from utilities.llm_backends import LLMBackend, LocalHTTPBackend
+from utilities.llm_helper import LLMHelper, answer_complete
+from utilities.resilience import ResilientBackend, RetryPolicy
+from fake_gmail import make_message
+from fake_llm_server import FakeCompletionsServer
+
+ANSWER = '[{"id": "1", "action": "archive", "confidence": 0.9, "explanation": "A [weekly] newsletter."}]'
+RAMBLE = '\n\nLet me explain my reasoning in more detail.' * 20
+
+def answer_all(prompt):
+    """Archive every email of a batched prompt."""
+    ids = re.findall(r'^\{"id": "(\d+)"', prompt, re.MULTILINE)
+    return json.dumps([{'id': email_id, 'action': 'archive', 'confidence': 0.9, 'explanation': 'Newsletter.'} for email_id in ids])
+
+class TestLocalHTTPBackend(unittest.TestCase):
+    def start_server(self, answer, **options):
+        server = FakeCompletionsServer(answer, **options)
+        server.__enter__()
+        self.addCleanup(server.__exit__)
+        return server
+
+    def make_backend(self, server, **config):
+        backend = LocalHTTPBackend({'model': 'llama', 'api_type': 'local', 'base_url': server.base_url, 'api_key': 'x', **config})
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_streamed_requests_reuse_one_connection(self):
+        """Test that consecutive requests share a keep-alive connection."""
+        server = self.start_server(lambda prompt: ANSWER)
+        backend = self.make_backend(server)
+
+        for _ in range(3):
+            text, _ = backend.complete('system', 'user', max_tokens=100)
+            self.assertEqual(text, ANSWER)
+
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(server.connections), 1)
+        self.assertEqual(server.requests[0]['max_tokens'], 100)
+        self.assertTrue(server.requests[0]['stream'])
+
+    def test_stream_stops_once_answer_is_complete(self):
+        """Test that the client hangs up as soon as the JSON array is closed."""
+        server = self.start_server(lambda prompt: ANSWER, trailer=RAMBLE, delay=0.005)
+        backend = self.make_backend(server)
+
+        started = time.monotonic()
+        text, _ = backend.complete('system', 'user', stop_when=answer_complete)
+        elapsed = time.monotonic() - started
+
+        self.assertTrue(text.startswith(ANSWER))
+        self.assertLess(len(text), len(ANSWER) + 8)
+        total_chunks = -(-len(ANSWER + RAMBLE) // server.chunk_size)
+        self.assertLess(elapsed, total_chunks * server.delay / 2)
+
+    def test_non_streaming_response(self):
+        """Test servers (or configs) that answer with a single JSON document."""
+        server = self.start_server(lambda prompt: ANSWER)
+        backend = self.make_backend(server, stream=False)
+
+        text, usage = backend.complete('system', 'user')
+
+        self.assertEqual(text, ANSWER)
+        self.assertEqual(usage[1], 42)
+
+class TestLLMBackend(unittest.TestCase):
+    def test_backend_without_complete_cannot_be_created(self):
+        """Test that an incomplete backend fails at construction instead of on its first request."""
+        class Incomplete(LLMBackend):
+            def close(self):
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+class TestLLMHelperWithLocalModel(unittest.TestCase):
+    def test_suggest_actions_with_retry(self):
+        """Test the local model path end to end, including a retried 503."""
+        server = FakeCompletionsServer(answer_all)
+        server.statuses = [503]
+        with server:
+            tmpdir = tempfile.TemporaryDirectory()
+            self.addCleanup(tmpdir.cleanup)
+            config_path = os.path.join(tmpdir.name, 'OAI_CONFIG_LIST')
+            with open(config_path, 'w') as file:
+                json.dump([{'model': 'llama', 'api_type': 'local', 'base_url': server.base_url, 'api_key': 'x'}], file)
+            helper = LLMHelper(model_choice='llama', config_path=config_path,
+                               backend=ResilientBackend('llama', retry_policy=RetryPolicy(base_delay=0.01)))
+            self.addCleanup(helper.close)
+
+            emails = [make_message(f'm{i}', subject=f'Digest {i}') for i in range(3)]
+            results = helper.suggest_actions(emails)
+
+        self.assertEqual([action for action, _, _ in results], ['archive'] * 3)
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(helper.backend.metrics.snapshot()['retries'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
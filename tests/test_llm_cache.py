@@ -0,0 +1,81 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Ensure the repository root is in the Python path to access utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utilities.llm_cache import LLMCache
+from utilities.llm_helper import LLMHelper
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        """Set up a cache in a temporary directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache = LLMCache(path=os.path.join(self.tmpdir.name, 'cache.db'))
+        self.addCleanup(self.cache.close)
+
+    def test_key_ignores_case_and_whitespace(self):
+        """Test that trivially different copies of an email share a key."""
+        key = self.cache.make_key('gpt-4', 1, 'Weekly  Digest', 'Hello\nWorld')
+        self.assertEqual(key, self.cache.make_key('gpt-4', 1, 'weekly digest', 'hello world '))
+        self.assertNotEqual(key, self.cache.make_key('gpt-4o', 1, 'weekly digest', 'hello world'))
+        self.assertNotEqual(key, self.cache.make_key('gpt-4', 2, 'weekly digest', 'hello world'))
+
+    def test_hits_misses_and_ttl(self):
+        """Test hit/miss counters and that expired entries are misses."""
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.set('k', ['archive', 'newsletter'])
+        self.assertEqual(self.cache.get('k'), ['archive', 'newsletter'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+        self.cache.ttl_seconds = -1
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entries are evicted above max_entries."""
+        self.cache.max_entries = 10
+        for i in range(100):
+            self.cache.set(f'k{i}', i)
+        self.assertLessEqual(self.cache.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0], 10)
+        self.assertIsNone(self.cache.get('k0'))
+        self.assertEqual(self.cache.get('k99'), 99)
+
+class TestLLMHelperCache(unittest.TestCase):
+    def setUp(self):
+        """Set up an OpenAI-backed LLMHelper with a temporary config and cache."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        config_path = os.path.join(self.tmpdir.name, 'OAI_CONFIG_LIST')
+        with open(config_path, 'w') as file:
+            json.dump([{'model': 'gpt-4o-mini', 'api_type': 'openai', 'api_key': 'test'}], file)
+
+        with patch('openai.Client'):
+            self.helper = LLMHelper(model_choice='gpt-4o-mini', config_path=config_path,
+                                    cache=LLMCache(path=os.path.join(self.tmpdir.name, 'cache.db')))
+        self.addCleanup(self.helper.cache.close)
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '[{"id": "1", "action": "archive", "confidence": 0.95, "explanation": "It is a newsletter."}]'
+        response.usage.prompt_tokens = 80
+        response.usage.completion_tokens = 12
+        self.helper.model_backend.client.chat.completions.create.return_value = response
+
+    def test_rerun_is_served_from_cache(self):
+        """Test that the same email only queries the model once."""
+        email_data = {'payload': {'headers': [{'name': 'Subject', 'value': 'Weekly digest'}]}}
+
+        first = self.helper.suggest_action(email_data)
+        second = self.helper.suggest_action(email_data)
+
+        self.assertEqual(first, ('archive', 'It is a newsletter.', 0.95))
+        self.assertEqual(second, first)
+        self.helper.model_backend.client.chat.completions.create.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
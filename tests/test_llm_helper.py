@@ -0,0 +1,96 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Ensure the repository root is in the Python path to access utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from utilities.llm_helper import LLMHelper, normalize_action, MAX_REASKS
+from fake_gmail import make_message
+
+def completion(content):
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    response.usage.prompt_tokens = 500
+    response.usage.completion_tokens = 50
+    return response
+
+def answer(*items):
+    return json.dumps([{'id': str(email_id), 'action': action, 'confidence': 0.9, 'explanation': 'ok'}
+                       for email_id, action in items])
+
+class TestBatchClassification(unittest.TestCase):
+    def setUp(self):
+        """Set up an OpenAI-backed LLMHelper with a temporary config."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        config_path = os.path.join(self.tmpdir.name, 'OAI_CONFIG_LIST')
+        with open(config_path, 'w') as file:
+            json.dump([{'model': 'gpt-4o-mini', 'api_type': 'openai', 'api_key': 'test'}], file)
+
+        with patch('openai.Client'):
+            self.helper = LLMHelper(model_choice='gpt-4o-mini', config_path=config_path, max_batch_size=5)
+        self.create = self.helper.model_backend.client.chat.completions.create
+        self.emails = [make_message(f'm{i}', subject=f'Subject {i}', body=f'Body {i}') for i in range(12)]
+
+    def test_normalize_action(self):
+        """Test that formatted answers map to the actions apply_instruction knows."""
+        self.assertEqual(normalize_action('**Archive**'), 'archive')
+        self.assertEqual(normalize_action('Suggestion: Reply.'), 'reply')
+        self.assertIsNone(normalize_action('delete'))
+
+    def test_one_request_per_batch(self):
+        """Test that emails are packed max_batch_size per request and answers are matched by ID."""
+        def reply(model, messages, **params):
+            lines = [json.loads(line) for line in messages[1]['content'].split('\n') if line.startswith('{"id"')]
+            # Answer out of order, with markdown formatting, in a code fence
+            return completion('```json\n' + answer(*[(line['id'], '**Archive**' if line['subject'].endswith('0') else 'reply')
+                                                     for line in reversed(lines)]) + '\n```')
+        self.create.side_effect = reply
+
+        results = self.helper.suggest_actions(self.emails)
+
+        self.assertEqual(self.create.call_count, 3)
+        self.assertEqual(results[0], ('archive', 'ok', 0.9))
+        self.assertEqual(results[10], ('archive', 'ok', 0.9))
+        self.assertEqual([action for action, _, _ in results].count('reply'), 10)
+        self.assertEqual(self.helper.cost_tracker.requests, 3)
+        self.assertEqual(self.helper.cost_tracker.totals()['emails'], 12)
+
+    def test_only_failed_items_are_asked_again(self):
+        """Test that invalid or missing answers are re-asked, and only those."""
+        self.create.side_effect = [
+            completion(json.dumps([{'id': '1', 'action': 'archive', 'confidence': 0.8},
+                                   {'id': '2', 'action': 'delete'},
+                                   {'id': '3', 'action': 'reply', 'confidence': 7}])),
+            completion(answer((1, 'ignore'), (2, 'reply'))),
+            completion(answer((1, 'reply'))),
+        ]
+
+        results = self.helper.suggest_actions(self.emails[:4])
+
+        self.assertEqual(self.create.call_count, 3)
+        retried = self.create.call_args_list[1].kwargs['messages'][1]['content']
+        self.assertIn('Subject 1', retried)
+        self.assertIn('Subject 3', retried)
+        self.assertNotIn('Subject 0', retried)
+        self.assertEqual([action for action, _, _ in results], ['archive', 'ignore', 'reply', 'reply'])
+        self.assertEqual(self.helper.cost_tracker.by_action['invalid']['emails'], 3 + 1)
+
+    def test_gives_up_after_reasks(self):
+        """Test that an email without a valid answer is reported unclassified."""
+        self.create.return_value = completion('I cannot help with that.')
+
+        action, explanation, confidence = self.helper.suggest_action(self.emails[0])
+
+        self.assertIsNone(action)
+        self.assertIn('No valid answer', explanation)
+        self.assertEqual(self.create.call_count, 1 + MAX_REASKS)
+
+if __name__ == '__main__':
+    unittest.main()
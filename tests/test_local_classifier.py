@@ -0,0 +1,47 @@
+import sys
+import os
+import unittest
+
+# Ensure the repository root is in the Python path to access email_agents
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from email_agents.local_classifier import LocalClassifier
+
+class TestLocalClassifier(unittest.TestCase):
+    def setUp(self):
+        """Set up a classifier with recurring newsletters and a few customer threads."""
+        training_data = {"always_ignore_senders": ["spam@example.com"]}
+        for week in range(1, 6):
+            training_data[f"Product digest week {week}"] = {"action": "archive", "sender": "Digest <news@product.example>"}
+        for name in ["pricing", "renewal", "contract"]:
+            training_data[f"Question about {name}"] = {"action": "reply", "sender": f"{name}@customer.example"}
+        self.classifier = LocalClassifier.from_training_data(training_data)
+
+    def test_predicts_when_neighbors_agree(self):
+        """Test that a new copy of a recurring email is answered locally."""
+        prediction = self.classifier.predict("Product digest week 6", "Digest <news@product.example>")
+        self.assertEqual(prediction.action, 'archive')
+        self.assertGreaterEqual(prediction.confidence, 0.8)
+
+    def test_defers_to_llm_when_unsure(self):
+        """Test that unrelated emails and low thresholds of agreement go to the LLM."""
+        self.assertIsNone(self.classifier.predict("Dinner on Friday?", "friend@home.example"))
+
+        self.classifier.min_confidence = 1.01
+        self.assertIsNone(self.classifier.predict("Product digest week 6", "news@product.example"))
+
+    def test_evaluate_reports_reduction_and_agreement(self):
+        """Test the leave-one-out evaluation report."""
+        report = self.classifier.evaluate()
+        self.assertEqual(report['examples'], 8)
+        self.assertEqual(report['answered_locally'], 5)
+        self.assertEqual(report['agreement_rate'], 1.0)
+
+    def test_add_example_grows_index(self):
+        """Test that examples added one by one are searchable."""
+        for i in range(100):
+            self.classifier.add_example(f"Build {i} failed", "ci@build.example", 'ignore')
+        self.assertEqual(self.classifier.predict("Build 1234 failed", "ci@build.example").action, 'ignore')
+
+if __name__ == '__main__':
+    unittest.main()
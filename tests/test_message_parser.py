@@ -0,0 +1,64 @@
+import sys
+import os
+import base64
+import unittest
+
+# Ensure the repository root is in the Python path to access utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utilities import message_parser
+
+def encode(text, charset='utf-8'):
+    return base64.urlsafe_b64encode(text.encode(charset)).decode()
+
+def part(mime_type, text, charset='utf-8', filename=''):
+    return {
+        'mimeType': mime_type,
+        'filename': filename,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': encode(text, charset)},
+    }
+
+class TestMessageParser(unittest.TestCase):
+    def test_decodes_nested_text_plain(self):
+        """Test that text/plain is found inside nested multiparts and decoded."""
+        email_data = {'payload': {'mimeType': 'multipart/mixed', 'parts': [
+            {'mimeType': 'multipart/alternative', 'parts': [
+                part('text/plain', 'Hello Francis,\nCan we meet on Tuesday?'),
+                part('text/html', '<p>Hello Francis</p>'),
+            ]},
+            part('text/plain', 'attached notes', filename='notes.txt'),
+        ]}}
+        self.assertEqual(message_parser.extract_body(email_data), 'Hello Francis,\nCan we meet on Tuesday?')
+
+    def test_html_only_and_charset(self):
+        """Test HTML-only mail is converted to text, honouring the part's charset."""
+        html = ('<html><head><style>p {color: red}</style></head><body><p>Caf&eacute; ouvert</p>'
+                '<script>track()</script><div>Réservez&nbsp;vite</div></body></html>')
+        email_data = {'payload': part('text/html', html, charset='iso-8859-1')}
+        self.assertEqual(message_parser.extract_body(email_data), 'Café ouvert\nRéservez vite')
+
+    def test_strips_quoted_reply_and_signature(self):
+        """Test that quoted replies and signatures are removed."""
+        text = ("Sounds good, see you then.\n\n-- \nJane Doe\nCEO\n\n"
+                "On Mon, Oct 14, 2024 at 9:00 AM Francis <f@example.com> wrote:\n> Are you free Tuesday?")
+        email_data = {'payload': part('text/plain', text)}
+        self.assertEqual(message_parser.extract_body(email_data), 'Sounds good, see you then.')
+
+        text = "Yes.\n\nOn Mon, Oct 14, 2024 at 9:00 AM Francis <f@example.com> wrote:\n> Are you free?"
+        self.assertEqual(message_parser.extract_body({'payload': part('text/plain', text)}), 'Yes.')
+
+    def test_truncates_to_token_budget(self):
+        """Test that huge bodies are cut to the budget without decoding everything."""
+        email_data = {'payload': part('text/plain', 'word ' * 500000)}
+        body = message_parser.extract_body(email_data, max_tokens=100)
+        self.assertLessEqual(len(body), 100 * message_parser.CHARS_PER_TOKEN + len(message_parser.TRUNCATION_MARKER))
+        self.assertTrue(body.endswith(message_parser.TRUNCATION_MARKER))
+
+    def test_no_body(self):
+        """Test messages without a readable part."""
+        self.assertEqual(message_parser.extract_body({'payload': {'headers': []}}), message_parser.NO_BODY)
+        self.assertEqual(message_parser.get_header({'payload': {'headers': [{'name': 'subject', 'value': 'Hi'}]}}, 'Subject'), 'Hi')
+
+if __name__ == '__main__':
+    unittest.main()
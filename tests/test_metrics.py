@@ -0,0 +1,106 @@
+import sys
+import os
+import io
+import json
+import logging
+import tempfile
+import unittest
+import urllib.request
+from contextlib import redirect_stdout
+
+# Ensure the repository root and the test helpers are in the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from email_agents.email_agent import EmailAgent
+from integration.gmail_integration import GmailIntegration
+from utilities.metrics import Histogram, JsonLinesExporter, Metrics, PrometheusExporter, SummaryExporter, prometheus_text
+from utilities.storage import Storage
+from fake_gmail import FakeGmailService, make_message
+from fake_llm import FakeLLMHelper
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_quantiles(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for seconds in [0.05, 0.05, 0.5, 3.0]:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.95), 3.0)
+
+    def test_labelled_counters(self):
+        metrics = Metrics()
+        metrics.increment('emails', action='archive')
+        metrics.increment('emails', 2, action='reply')
+        metrics.increment('emails', action='archive')
+        self.assertEqual(metrics.snapshot()['counters'], [('emails', {'action': 'archive'}, 2), ('emails', {'action': 'reply'}, 2)])
+        self.assertEqual(metrics.counter_total('emails'), 4)
+
+    def test_events_are_only_built_for_event_exporters(self):
+        lines = []
+        metrics = Metrics([SummaryExporter(output=lines.append)])
+        self.assertIsNone(metrics.new_trace_id())
+        metrics.event('email', message_id='1')
+        metrics.close()
+        self.assertTrue(lines[0].startswith('stage'))
+
+    def test_json_lines_exporter(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'metrics.jsonl')
+            metrics = Metrics([JsonLinesExporter(path)])
+            trace_id = metrics.new_trace_id()
+            with metrics.timer('apply'):
+                pass
+            metrics.event('email', trace_id=trace_id, message_id='1')
+            metrics.close()
+            with open(path) as file:
+                records = [json.loads(line) for line in file]
+        self.assertEqual(records[0]['trace_id'], trace_id)
+        self.assertEqual(records[1]['event'], 'summary')
+        self.assertEqual(records[1]['stages']['apply']['count'], 1)
+
+    def test_prometheus_endpoint(self):
+        metrics = Metrics()
+        exporter = PrometheusExporter(port=0)
+        metrics.add_exporter(exporter)
+        self.addCleanup(metrics.close)
+        metrics.increment('emails', action='archive')
+        metrics.observe('llm', 0.3)
+        with urllib.request.urlopen(f'http://127.0.0.1:{exporter.port}/metrics') as response:
+            text = response.read().decode()
+        self.assertEqual(text, prometheus_text(metrics))
+        self.assertIn('email_agent_emails_total{action="archive"} 1', text)
+        self.assertIn('email_agent_stage_seconds_bucket{stage="llm",le="0.5"} 1', text)
+        self.assertIn('email_agent_stage_seconds_count{stage="llm"} 1', text)
+
+class TestEmailAgentMetrics(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeGmailService([make_message(str(i), subject=f'Subject {i}') for i in range(3)])
+        self.storage = Storage(':memory:')
+        self.addCleanup(self.storage.close)
+        self.metrics = Metrics()
+        self.gmail = GmailIntegration(service=self.service, metrics=self.metrics)
+
+    def run_agent(self, log_level):
+        agent = EmailAgent(gmail=self.gmail, llm_helper=FakeLLMHelper(lambda email_data: ('archive', '')),
+                           storage=self.storage, metrics=self.metrics, log_level=log_level)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            agent.process_emails()
+        return output.getvalue()
+
+    def test_stages_and_actions_are_recorded(self):
+        self.run_agent(logging.INFO)
+        snapshot = self.metrics.snapshot()
+        self.assertIn(('emails', {'action': 'archive', 'source': 'llm'}, 3), snapshot['counters'])
+        for stage in ['gmail.messages.list', 'gmail.messages.get.batch', 'gmail.messages.batchModify', 'rules', 'apply']:
+            self.assertIn(stage, snapshot['stages'])
+        self.assertEqual(snapshot['stages']['rules']['count'], 3)
+
+    def test_warning_level_prints_nothing_per_email(self):
+        self.assertIn('Processing Email', self.run_agent(logging.INFO))
+        self.service.add_message(make_message('4', subject='Another one'))
+        self.assertEqual(self.run_agent(logging.WARNING), '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Ensure the repository root is in the Python path to access utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from utilities.model_cascade import create_llm_helper
+from fake_gmail import make_message
+
+def model_reply(confidence_of):
+    """Fake chat completion that answers every email of a batched prompt with confidence_of(subject)."""
+    def create(model, messages, **params):
+        lines = [json.loads(line) for line in messages[1]['content'].split('\n') if line.startswith('{"id"')]
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = json.dumps([
+            {'id': line['id'], 'action': 'reply' if model == 'gpt-4o' else 'archive',
+             'confidence': confidence_of(line['subject']), 'explanation': model} for line in lines])
+        response.usage.prompt_tokens = 100
+        response.usage.completion_tokens = 20
+        return response
+    return create
+
+class TestModelCascade(unittest.TestCase):
+    def setUp(self):
+        """Set up a gpt-4o-mini -> gpt-4o cascade with mocked OpenAI clients."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        config_path = os.path.join(self.tmpdir.name, 'OAI_CONFIG_LIST')
+        with open(config_path, 'w') as file:
+            json.dump([
+                {'model': 'gpt-4o-mini', 'api_type': 'openai', 'api_key': 'test',
+                 'cascade_min_confidence': 0.7, 'cascade_vip_senders': ['@bigcustomer.com']},
+                {'model': 'gpt-4o', 'api_type': 'openai', 'api_key': 'test'},
+            ], file)
+
+        # One client per tier
+        with patch('openai.Client', side_effect=lambda **kwargs: MagicMock()):
+            self.cascade = create_llm_helper('cascade:gpt-4o-mini,gpt-4o', config_path=config_path, max_run_tokens=100000)
+        self.small, self.large = self.cascade.tiers
+        self.small.model_backend.client.chat.completions.create.side_effect = model_reply(
+            lambda subject: 0.4 if 'contract' in subject.lower() else 0.95)
+        self.large.model_backend.client.chat.completions.create.side_effect = model_reply(lambda subject: 0.9)
+
+    def test_low_confidence_is_escalated(self):
+        """Test that only the unsure emails reach the large model."""
+        emails = [make_message('m1', subject='Your receipt'), make_message('m2', subject='Contract renewal'),
+                  make_message('m3', subject='Weekly digest')]
+
+        results = self.cascade.suggest_actions(emails)
+
+        self.assertEqual([action for action, _, _ in results], ['archive', 'reply', 'archive'])
+        self.assertEqual(results[1][1], 'gpt-4o')
+        large_prompt = self.large.model_backend.client.chat.completions.create.call_args.kwargs['messages'][1]['content']
+        self.assertIn('Contract renewal', large_prompt)
+        self.assertNotIn('Weekly digest', large_prompt)
+        self.assertEqual(self.cascade.stats[0].escalations, {'low confidence': 1})
+        self.assertEqual(self.cascade.stats[1].emails, 1)
+
+    def test_vip_senders_skip_the_small_model(self):
+        """Test that VIP mail goes straight to the large model."""
+        results = self.cascade.suggest_actions([make_message('m1', subject='Hello', sender='Jane <jane@eu.bigcustomer.com>')])
+
+        self.assertEqual(results[0][0], 'reply')
+        self.small.model_backend.client.chat.completions.create.assert_not_called()
+        self.assertEqual(self.cascade.stats[0].escalations, {'vip': 1})
+        self.assertTrue(any('escalated 1 (100%: 1 vip)' in line for line in self.cascade.report()))
+
+    def test_tiers_share_the_run_budget(self):
+        """Test that all tiers draw from one token budget."""
+        self.assertIs(self.small.prompt_builder.budget, self.large.prompt_builder.budget)
+        self.cascade.suggest_actions([make_message('m1', subject='Contract renewal')])
+        self.assertEqual(self.small.prompt_builder.budget.used, 2 * (100 + 20))
+
+    def test_needs_two_models(self):
+        """Test that a cascade of a single model is rejected."""
+        with self.assertRaises(ValueError):
+            create_llm_helper('cascade:gpt-4o')
+
+if __name__ == '__main__':
+    unittest.main()
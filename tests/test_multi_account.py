@@ -0,0 +1,125 @@
+import sys
+import os
+import io
+import json
+import logging
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+# Ensure the repository root and the test helpers are in the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from email_agents.multi_account import MultiAccountRunner, load_accounts
+from integration.gmail_integration import GmailIntegration
+from utilities.metrics import Metrics
+from fake_gmail import FakeGmailService, make_message
+from fake_llm import FakeLLMHelper
+
+class TestLoadAccounts(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'accounts.json')
+
+    def write(self, entries):
+        with open(self.path, 'w') as file:
+            json.dump(entries, file)
+
+    def test_defaults(self):
+        self.write([{'name': 'alice'}, {'name': 'bob', 'data_dir': '/srv/bob', 'training_data': 'bob.json'}])
+        alice, bob = load_accounts(self.path)
+        self.assertEqual(alice.data_dir, os.path.join('accounts', 'alice'))
+        self.assertEqual(alice.training_data_path, os.path.join('accounts', 'alice', 'training_data.json'))
+        self.assertEqual(alice.credentials_path, 'credentials.json')
+        self.assertEqual((bob.data_dir, bob.training_data_path), ('/srv/bob', 'bob.json'))
+
+    def test_accounts_cannot_share_state(self):
+        for entries in ([{'name': 'alice'}, {'name': 'alice'}],
+                        [{'name': 'alice', 'data_dir': 'shared'}, {'name': 'bob', 'data_dir': 'shared'}],
+                        [{'name': '../alice'}],
+                        [{'name': 'alice', 'token': 'x'}],
+                        []):
+            self.write(entries)
+            with self.assertRaises(ValueError):
+                load_accounts(self.path)
+
+class TestMultiAccountRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        # One LLM helper and one set of metrics for every account, as in main.py
+        self.llm_helper = FakeLLMHelper(lambda email_data: ('reply', ''))
+        self.metrics = Metrics()
+        self.services = {}
+        self.order = []
+
+    def add_account(self, name, messages, training_data=None):
+        manifest = os.path.join(self.tmpdir.name, f'{name}.json')
+        with open(manifest, 'w') as file:
+            json.dump([{'name': name, 'data_dir': os.path.join(self.tmpdir.name, name)}], file)
+        account = load_accounts(manifest)[0]
+        if training_data is not None:
+            os.makedirs(account.data_dir, exist_ok=True)
+            with open(account.training_data_path, 'w') as file:
+                json.dump(training_data, file)
+
+        self.services[name] = FakeGmailService(messages, email_address=f'{name}@example.com')
+        agent = account.create_agent(self.llm_helper, self.metrics, gmail=GmailIntegration(service=self.services[name]),
+                                     log_level=logging.WARNING)
+        process_email = agent.process_email
+
+        def recorded_process_email(message_id, email_data, suggestion=None):
+            self.order.append(name)
+            process_email(message_id, email_data, suggestion)
+
+        agent.process_email = recorded_process_email
+        return agent
+
+    def run_accounts(self, agents, **options):
+        runner = MultiAccountRunner(agents, **options)
+        self.addCleanup(runner.close)
+        with redirect_stdout(io.StringIO()):
+            return runner.process_emails()
+
+    def test_rules_and_ledgers_are_per_account(self):
+        rule = {'Weekly report': {'action': 'archive', 'reason': 'FYI only', 'sender': 'boss@example.com', 'recipients': [], 'cc_list': []}}
+        agents = {
+            'alice': self.add_account('alice', [make_message('a1', subject='Weekly report', sender='boss@example.com')], rule),
+            'bob': self.add_account('bob', [make_message('b1', subject='Weekly report', sender='boss@example.com')]),
+        }
+        results = self.run_accounts(agents)
+
+        self.assertEqual(results['alice']['emails'], 1)
+        self.assertEqual(results['bob']['emails'], 1)
+        # Only bob has no rule for the report, so only bob's email reached the shared LLM helper
+        self.assertEqual(self.llm_helper.classified, ['b1'])
+        self.assertNotIn('INBOX', self.services['alice'].messages['a1']['labelIds'])
+        self.assertIn('Weekly report', agents['alice'].training_data)
+        self.assertNotIn('Weekly report', agents['bob'].training_data)
+        self.assertEqual(agents['alice'].sync_state.filter_unprocessed(['a1', 'b1']), ['b1'])
+        self.assertEqual(agents['bob'].sync_state.filter_unprocessed(['a1', 'b1']), ['a1'])
+
+    def test_turns_alternate_between_accounts(self):
+        agents = {
+            'big': self.add_account('big', [make_message(f'big{i}', subject=f'Newsletter {i}') for i in range(6)]),
+            'small': self.add_account('small', [make_message(f'small{i}', subject=f'Question {i}') for i in range(2)]),
+        }
+        results = self.run_accounts(agents, workers=1, turn_size=2)
+        # The small inbox is done after the big one's first turn instead of waiting for all of it
+        self.assertEqual(self.order, ['big', 'big', 'small', 'small', 'big', 'big', 'big', 'big'])
+        self.assertEqual(results['big'], {'emails': 6, 'turns': 3, 'error': None})
+
+    def test_failing_account_does_not_stop_the_others(self):
+        agents = {
+            'broken': self.add_account('broken', [make_message('x1')]),
+            'fine': self.add_account('fine', [make_message(f'f{i}', subject=f'Hello {i}') for i in range(3)]),
+        }
+        self.services['broken'].errors['getProfile'] = [RuntimeError('invalid_grant')]
+        results = self.run_accounts(agents, workers=2, turn_size=1)
+        self.assertEqual(results['broken']['error'], 'invalid_grant')
+        self.assertEqual(results['fine']['emails'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Ensure the repository root is in the Python path to access utilities and email_agents
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from email_agents.email_agent import EmailAgent
+from integration.gmail_integration import GmailIntegration
+from integration.sync_state import SyncState
+from utilities.storage import Storage
+from utilities.cost_tracker import CostTracker
+from utilities.llm_helper import LLMHelper
+from utilities.prompt_builder import PromptBuilder, TokenBudget, TokenBudgetExceeded
+from fake_gmail import FakeGmailService, make_message
+from fake_llm import FakeLLMHelper, answers
+
+class TestPromptBuilder(unittest.TestCase):
+    def test_email_budget(self):
+        """Test that a huge newsletter is cut to the per-email budget."""
+        builder = PromptBuilder('gpt-4o-mini', max_email_tokens=200)
+        summary, tokens = builder.summarize('Weekly digest', 'news@example.com', 'lorem ipsum dolor ' * 20000)
+
+        self.assertTrue(summary['body'].endswith('[...]'))
+        self.assertLessEqual(tokens, 200 + 30)
+
+    def test_short_email_is_unchanged(self):
+        """Test that emails within the budget are sent as they are."""
+        builder = PromptBuilder('gpt-4o-mini')
+        summary, _ = builder.summarize('Lunch?', 'jane@example.com', 'Are you free on Tuesday?')
+        _, user_prompt, _ = builder.build_batch([('1', summary)])
+        self.assertIn('{"id": "1", "subject": "Lunch?", "from": "jane@example.com", "body": "Are you free on Tuesday?"}', user_prompt)
+
+    def test_batches_follow_the_token_budgets(self):
+        """Test that batch size is capped by the batch size, the batch token budget and the run budget."""
+        builder = PromptBuilder('gpt-4o-mini', max_batch_tokens=builder_tokens(100, 4))
+        self.assertEqual(builder.plan_batches([100] * 10, max_batch_size=10), [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.assertEqual(builder.plan_batches([100] * 10, max_batch_size=3), [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+
+        builder.budget.max_tokens = builder_tokens(100, 4) + builder_tokens(100, 2)
+        self.assertEqual(builder.plan_batches([100] * 10, max_batch_size=10), [[0, 1, 2, 3], [4, 5]])
+
+    def test_run_budget(self):
+        """Test that reservations beyond the run budget raise, and that settling frees tokens."""
+        budget = TokenBudget(1000)
+        budget.reserve(600)
+        with self.assertRaises(TokenBudgetExceeded):
+            budget.reserve(600)
+        budget.settle(600, 300)
+        budget.reserve(600)
+        self.assertEqual(budget.used, 900)
+        self.assertEqual(budget.remaining(), 100)
+
+def builder_tokens(summary_tokens, count):
+    return PromptBuilder('gpt-4o-mini').batch_tokens([summary_tokens] * count)
+
+class TestCostTracker(unittest.TestCase):
+    def test_cost_per_action(self):
+        """Test cost estimates from the price table, config overrides and free local models."""
+        tracker = CostTracker()
+        tracker.record({'model': 'gpt-4o-mini-2024-07-18', 'api_type': 'openai'}, 1_000_000, 0, 'archive')
+        tracker.record({'model': 'gpt-4o-mini', 'api_type': 'openai'}, 0, 1_000_000, 'reply')
+        tracker.record({'model': 'custom', 'api_type': 'openai', 'price_per_million_input': 1.0}, 500_000, 10, 'archive')
+        tracker.record({'model': 'llama', 'api_type': 'local'}, 1_000_000, 1_000_000, 'ignore')
+
+        self.assertAlmostEqual(tracker.by_action['archive']['cost'], 0.15 + 0.5)
+        self.assertAlmostEqual(tracker.by_action['reply']['cost'], 0.60)
+        self.assertEqual(tracker.by_action['ignore']['cost'], 0.0)
+        self.assertEqual(tracker.totals()['emails'], 4)
+        self.assertEqual(tracker.requests, 4)
+        self.assertTrue(any(line.startswith('total') for line in tracker.summary()))
+
+    def test_batch_tokens_are_shared(self):
+        """Test that the tokens of a batched request are split between its emails."""
+        tracker = CostTracker()
+        tracker.record_batch({'model': 'gpt-4o-mini', 'api_type': 'openai'}, 1001, 90, ['archive', 'archive', 'reply'])
+
+        self.assertEqual(tracker.by_action['archive']['prompt_tokens'], 334 + 334)
+        self.assertEqual(tracker.by_action['reply']['completion_tokens'], 30)
+        self.assertEqual(tracker.totals()['prompt_tokens'], 1001)
+        self.assertEqual(tracker.requests, 1)
+
+class TestLLMHelperBudget(unittest.TestCase):
+    def setUp(self):
+        """Set up an OpenAI-backed LLMHelper with a small run budget."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        config_path = os.path.join(self.tmpdir.name, 'OAI_CONFIG_LIST')
+        with open(config_path, 'w') as file:
+            json.dump([{'model': 'gpt-4o-mini', 'api_type': 'openai', 'api_key': 'test'}], file)
+
+        with patch('openai.Client'):
+            self.helper = LLMHelper(model_choice='gpt-4o-mini', config_path=config_path, max_run_tokens=1000)
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '[{"id": "1", "action": "archive", "confidence": 0.9, "explanation": "Newsletter."}]'
+        response.usage.prompt_tokens = 120
+        response.usage.completion_tokens = 30
+        self.helper.model_backend.client.chat.completions.create.return_value = response
+
+    def test_usage_is_recorded_until_budget_runs_out(self):
+        """Test that reported usage is tracked and the call that would exceed the budget is refused."""
+        email_data = make_message('m1', subject='Weekly digest', body='news ' * 100)
+
+        calls = 0
+        while self.helper.suggest_action(email_data)[0] == 'archive':
+            calls += 1
+
+        self.assertGreater(calls, 1)
+        self.assertIn('budget', self.helper.suggest_action(email_data)[1])
+        self.assertEqual(self.helper.prompt_builder.budget.used, calls * 150)
+        self.assertEqual(self.helper.cost_tracker.by_action['archive']['prompt_tokens'], calls * 120)
+        self.assertEqual(self.helper.model_backend.client.chat.completions.create.call_count, calls)
+
+class TestAgentBudget(unittest.TestCase):
+    def setUp(self):
+        """Set up an agent whose LLM runs out of budget after 3 emails."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.sync_state = SyncState(path=os.path.join(self.tmpdir.name, 'sync_state.db'))
+        self.addCleanup(self.sync_state.close)
+
+        self.service = FakeGmailService([make_message(f'm{i}', subject=f'Unseen subject {i}') for i in range(5)])
+        self.llm_helper = FakeLLMHelper(suggest=answers(*[('ignore', '')] * 3 + [(None, 'Run token budget of 10 reached')] * 2))
+        self.agent = EmailAgent(gmail=GmailIntegration(service=self.service), llm_helper=self.llm_helper,
+                                sync_state=self.sync_state, storage=Storage(':memory:'))
+
+    def test_skipped_emails_stay_for_next_run(self):
+        """Test that emails over budget are untouched, not recorded, and the checkpoint stays."""
+        self.agent.process_emails()
+
+        self.assertEqual(self.sync_state.filter_unprocessed([f'm{i}' for i in range(5)]), ['m3', 'm4'])
+        self.assertIsNone(self.sync_state.get_history_id())
+        self.assertEqual(self.service.calls.count('messages.batchModify'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import sys
+import os
+import unittest
+from argparse import Namespace
+
+# Ensure the repository root and the benchmarks are in the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from bench_replay import replay, synthetic_mailbox
+
+class TestReplayBenchmark(unittest.TestCase):
+    def test_replay_with_injected_errors(self):
+        messages = synthetic_mailbox(60)
+        args = Namespace(gmail_latency=0.0, gmail_error_rate=0.2, gmail_quota=False, llm_latency=0.0, llm_error_rate=0.2,
+                         llm_batch_size=10, concurrency=2, sync=True, local_classifier=False, tracemalloc=False)
+        results = replay(messages, args)
+        # Every message gets an action despite the failed calls, which are retried
+        self.assertEqual(results['emails'], 60)
+        self.assertEqual(sum(results['actions'].values()), 60)
+        self.assertGreater(results['llm_requests_per_email'], 0)
+        self.assertLessEqual(results['latency_p50_ms'], results['latency_p99_ms'])
+
+    def test_large_mailbox_is_processed_whole(self):
+        # More unread messages than a listing page and a flush, so emails are marked read while paging is not over
+        messages = synthetic_mailbox(1200)
+        args = Namespace(gmail_latency=0.0, gmail_error_rate=0.0, gmail_quota=False, llm_latency=0.0, llm_error_rate=0.0,
+                         llm_batch_size=10, concurrency=1, sync=False, local_classifier=False, tracemalloc=False)
+        results = replay(messages, args)
+        self.assertEqual(results['emails'], 1200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+import io
+import logging
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch, MagicMock
+
+# Ensure the repository root is in the Python path to access utilities and integration
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from integration.gmail_integration import GmailIntegration
+from utilities.rate_limiter import RateLimiter
+from utilities.resilience import CircuitBreaker, ResilientBackend, RetryPolicy
+from fake_gmail import FakeGmailService, http_error, make_message
+
+class TestResilientBackend(unittest.TestCase):
+    def setUp(self):
+        """Set up a backend whose sleeps are recorded instead of waited."""
+        patcher = patch('utilities.resilience.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = ResilientBackend('test', retry_policy=RetryPolicy(max_attempts=3),
+                                        circuit_breaker=CircuitBreaker(failure_threshold=10))
+
+    def test_retries_and_honours_retry_after(self):
+        """Test that a 429 is retried after the delay requested by Retry-After."""
+        function = MagicMock(side_effect=[http_error(429, {'retry-after': '7'}), 'ok'])
+
+        self.assertEqual(self.backend.call(function), 'ok')
+        self.sleep.assert_called_once_with(7.0)
+        self.assertEqual(self.backend.metrics.snapshot()['retries'], 1)
+
+    def test_gives_up_after_max_attempts_and_does_not_retry_client_errors(self):
+        """Test that retries are bounded and that a 400 is raised immediately."""
+        function = MagicMock(side_effect=http_error(503))
+        with self.assertRaises(Exception):
+            self.backend.call(function)
+        self.assertEqual(function.call_count, 3)
+        self.assertEqual(self.backend.metrics.snapshot()['failures'], 1)
+
+        function = MagicMock(side_effect=http_error(400))
+        with self.assertRaises(Exception):
+            self.backend.call(function)
+        self.assertEqual(function.call_count, 1)
+
+    def test_circuit_breaker_pauses_failing_backend(self):
+        """Test that consecutive failures open the circuit and pause the next calls."""
+        self.backend.circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        function = MagicMock(side_effect=[ConnectionResetError(), ConnectionResetError(), 'ok'])
+
+        self.assertEqual(self.backend.call(function), 'ok')
+        self.assertEqual(self.backend.metrics.snapshot()['circuit_opens'], 1)
+        # The third attempt waited for the circuit to half-open
+        self.assertTrue(any(call.args[0] > 29 for call in self.sleep.call_args_list))
+        self.assertEqual(self.backend.circuit_breaker.state, 'closed')
+
+    def test_circuit_notice_is_not_printed_at_warning_level(self):
+        """Test that an opened circuit is only counted in unattended runs."""
+        self.backend = ResilientBackend('test', circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30),
+                                        log_level=logging.WARNING)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(self.backend.call(MagicMock(side_effect=[ConnectionResetError(), 'ok'])), 'ok')
+        self.assertEqual(output.getvalue(), '')
+        self.assertEqual(self.backend.metrics.snapshot()['circuit_opens'], 1)
+
+class TestRateLimiter(unittest.TestCase):
+    @patch('utilities.rate_limiter.time.sleep')
+    def test_large_requests_go_into_debt_instead_of_blocking_forever(self, sleep):
+        """Test that a request larger than the bucket waits for a full bucket only."""
+        limiter = RateLimiter(600, burst=10)
+        self.assertEqual(limiter.acquire(10), 0.0)
+        limiter.acquire(50)
+        self.assertLess(limiter.tokens, 0)
+
+class TestGmailRetries(unittest.TestCase):
+    @patch('time.sleep')
+    def test_rate_limited_messages_of_a_batch_are_retried(self, sleep):
+        """Test that only the 429'd calls of a batch are fetched again."""
+        service = FakeGmailService([make_message(f'm{i}') for i in range(10)])
+        service.errors['messages.get'] = [http_error(429), http_error(429)]
+        gmail = GmailIntegration(service=service)
+
+        messages = gmail.get_messages([f'm{i}' for i in range(10)])
+
+        self.assertTrue(all(messages))
+        self.assertEqual(service.calls.count('messages.get'), 12)
+        self.assertEqual(gmail.backend.metrics.snapshot()['retries'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
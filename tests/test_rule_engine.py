@@ -0,0 +1,74 @@
+import sys
+import os
+import unittest
+
+# Ensure the repository root is in the Python path to access email_agents
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from email_agents.rule_engine import Rule, RuleEngine, template_subject
+
+class TestRuleEngine(unittest.TestCase):
+    def setUp(self):
+        """Set up a rule engine from a small training data set."""
+        self.engine = RuleEngine.from_training_data({
+            "Reminder: Invoice from Kathryn Fulton Consulting Inc.": {"action": "archive", "reason": "AP handles these"},
+            "[Amplitude] Weekly summary for Oct 12": {"action": "ignore", "reason": "Not interested"},
+            "always_ignore_senders": ["\"Jesus\" <jesus@spam.example>"],
+            "rules": [
+                {"field": "sender_domain", "pattern": "notification.intuit.com", "action": "archive"},
+                {"field": "subject_prefix", "pattern": "[jira]", "action": "ignore"},
+                {"field": "subject_prefix", "pattern": "[jira] mention", "action": "reply"},
+                {"field": "subject_regex", "pattern": r"order #\d+ shipped", "action": "archive"},
+                {"field": "list_id", "pattern": "<digest.example.com>", "action": "ignore"},
+                {"field": "cc", "pattern": "*@accounting.example", "action": "archive"},
+            ],
+        })
+
+    def test_exact_subject_returns_action_not_training_entry(self):
+        """Test that the stored action string (not the whole training entry) is returned."""
+        rule = self.engine.match(subject="RE: Reminder: Invoice from Kathryn Fulton Consulting Inc.")
+        self.assertEqual(rule.action, 'archive')
+        self.assertEqual(rule.field, 'subject')
+
+    def test_templated_subject_matches_recurring_mail(self):
+        """Test that dates and numbers in recurring subjects still match."""
+        self.assertEqual(template_subject("Weekly summary for Oct 19"), template_subject("weekly summary for Nov 2"))
+        rule = self.engine.match(subject="[Amplitude] Weekly summary for Oct 19")
+        self.assertEqual((rule.field, rule.action), ('subject_template', 'ignore'))
+
+    def test_longest_prefix_and_regex(self):
+        """Test the prefix trie and the combined regex."""
+        self.assertEqual(self.engine.match(subject="[JIRA] Mention in ABC-12").action, 'reply')
+        self.assertEqual(self.engine.match(subject="[JIRA] Status change").action, 'ignore')
+        self.assertEqual(self.engine.match(subject="Your order #1234 shipped!").field, 'subject_regex')
+
+    def test_regexes_with_backreferences_keep_their_groups(self):
+        """Test that regexes relying on their own group numbers are not merged into the alternation."""
+        self.engine.add_rule(Rule('subject_regex', r'(\w+) and \1', 'ignore', '', 'test'))
+        self.engine.add_rule(Rule('subject_regex', r'(?P<word>\w+) or (?P=word)', 'archive', '', 'test'))
+        self.engine.add_rule(Rule('subject_regex', r'literal \\1 text', 'reply', '', 'test'))
+        self.assertEqual(self.engine.match(subject="Tea and tea").action, 'ignore')
+        self.assertIsNone(self.engine.match(subject="Tea and coffee"))
+        self.assertEqual(self.engine.match(subject="Now or now").action, 'archive')
+        self.assertEqual(self.engine.match(subject="A literal \\1 text").action, 'reply')
+        self.assertEqual(self.engine.match(subject="Your order #1234 shipped!").field, 'subject_regex')
+        self.assertEqual(len(self.engine.separate_regexes), 2)
+        with self.assertRaises(ValueError):
+            self.engine.add_rule(Rule('subject_regex', r'unbalanced (', 'ignore', '', 'test'))
+
+    def test_header_rules(self):
+        """Test sender, sender domain, List-Id and CC rules."""
+        self.assertEqual(self.engine.match(subject="Hi", sender="Jesus <JESUS@spam.example>").action, 'ignore')
+        self.assertEqual(self.engine.match(subject="Hi", sender="QuickBooks <qb@mail.notification.intuit.com>").field, 'sender_domain')
+        self.assertEqual(self.engine.match(subject="Hi", list_id="Daily Digest <digest.example.com>").field, 'list_id')
+        self.assertEqual(self.engine.match(subject="Hi", cc_list=['"Doe, Jane" <jane@accounting.example>']).field, 'cc')
+        self.assertIsNone(self.engine.match(subject="Hi", sender="friend@example.com"))
+
+    def test_thousands_of_rules(self):
+        """Test that adding many rules keeps the earlier ones reachable."""
+        for i in range(5000):
+            self.engine.add_rule(Rule('sender', f'user{i}@example.com', 'archive', '', 'test'))
+        self.assertEqual(self.engine.match(sender="user4999@example.com").pattern, 'user4999@example.com')
+
+if __name__ == '__main__':
+    unittest.main()
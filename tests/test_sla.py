@@ -0,0 +1,72 @@
+import sys
+import os
+import unittest
+from datetime import datetime
+
+# Ensure the repository root is in the Python path to access contact_agent and utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from contact_agent.sla import SLAEngine, contact_name, sla_days
+from utilities.storage import Storage
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+def contact(first_name, category=None, vip=False, last_interaction=None):
+    return {'first_name': first_name, 'last_name': 'Doe', 'email': f'{first_name.lower()}@example.com',
+            'category': category, 'vip': vip, 'last_interaction': last_interaction}
+
+class TestSLAEngine(unittest.TestCase):
+    def setUp(self):
+        """Set up an in-memory store with a few contacts."""
+        self.storage = Storage(':memory:')
+        self.addCleanup(self.storage.close)
+        self.settings = {'categories': {'friends': {'sla': 60, 'vip_sla': 30}, 'customers': {'sla': 120, 'vip_sla': 60}}}
+        self.engine = SLAEngine(self.storage, self.settings)
+        self.engine.update_contacts({
+            'ann': contact('Ann', 'friends', last_interaction='2024-03-01T09:00:00'),            # due 2024-04-30
+            'bob': contact('Bob', 'friends', last_interaction='2024-05-01T09:00:00'),            # due 2024-06-30
+            'cid': contact('Cid', 'customers', vip=True, last_interaction='2024-02-01T09:00:00'),  # due 2024-04-01
+            'dan': contact('Dan', 'friends'),                                                     # never contacted
+        })
+
+    def due_ids(self, now=NOW):
+        return [contact_id for contact_id, _, _ in self.engine.due_contacts(now)]
+
+    def test_due_contacts_are_ordered_by_due_date(self):
+        self.assertEqual(self.due_ids(), ['cid', 'ann'])
+
+    def test_contacts_without_interaction_are_never_due(self):
+        self.assertNotIn('dan', self.due_ids(datetime(2100, 1, 1)))
+
+    def test_vip_change_updates_only_that_contact(self):
+        bob = self.storage.load_contacts()['bob']
+        bob['vip'] = True
+        self.engine.update_contacts({'bob': bob})
+        self.assertEqual(self.due_ids(), ['cid', 'ann', 'bob'])
+
+    def test_category_change_updates_the_due_date(self):
+        ann = self.storage.load_contacts()['ann']
+        ann['category'] = 'customers'
+        self.engine.update_contacts({'ann': ann})
+        self.assertEqual(self.due_ids(), ['cid'])
+
+    def test_settings_change_recomputes_all_due_dates(self):
+        self.settings['categories']['friends']['sla'] = 10
+        self.assertEqual(self.due_ids(), ['ann', 'cid', 'bob'])
+
+    def test_recompute_matches_single_updates(self):
+        expected = {contact_id: self.engine.due_date(value) for contact_id, value in self.storage.load_contacts().items()}
+        self.assertEqual(self.engine.recompute(), 3)
+        due = {contact_id: due_at for contact_id, _, due_at in self.engine.due_contacts(datetime(2100, 1, 1))}
+        self.assertEqual(due, {contact_id: due_at for contact_id, due_at in expected.items() if due_at})
+
+    def test_unknown_category_uses_default_sla(self):
+        self.assertEqual(sla_days({'category': None}, self.settings), 60)
+        self.assertEqual(sla_days({'category': 'other', 'vip': True}, self.settings), 30)
+
+    def test_contact_name(self):
+        self.assertEqual(contact_name(contact('Ann')), 'Ann Doe')
+        self.assertEqual(contact_name({'first_name': '', 'last_name': '', 'email': 'x@example.com'}), 'x@example.com')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import sys
+import os
+import subprocess
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules that only the command or backend using them may load
+HEAVY_MODULES = ['openai', 'pandas', 'numpy', 'googleapiclient.discovery', 'google_auth_oauthlib', 'requests']
+
+def loaded_heavy_modules(code, cwd=ROOT):
+    """Run code in a fresh interpreter and return the heavy modules it loaded."""
+    probe = f"import sys\n{code}\nprint('heavy:' + ','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', probe], cwd=cwd, check=True, capture_output=True, text=True).stdout
+    return [name for name in output.strip().splitlines()[-1][len('heavy:'):].split(',') if name]
+
+class TestStartup(unittest.TestCase):
+    def test_email_agent_import_is_light(self):
+        self.assertEqual(loaded_heavy_modules('import email_agents.email_agent\nimport email_agents.email_drafting_agent'), [])
+
+    def test_main_help_is_light(self):
+        code = "import runpy\nsys.argv = ['main.py', '--help']\ntry:\n    runpy.run_path('main.py', run_name='__main__')\nexcept SystemExit:\n    pass"
+        self.assertEqual(loaded_heavy_modules(code), [])
+
+    def test_contact_agent_import_reads_no_settings(self):
+        # Run from the repository root, where there is no settings.json
+        self.assertEqual(loaded_heavy_modules('import contact_agent.main'), [])
+
+if __name__ == '__main__':
+    unittest.main()
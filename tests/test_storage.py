@@ -0,0 +1,104 @@
+import sys
+import os
+import json
+import pickle
+import tempfile
+import unittest
+
+# Ensure the repository root is in the Python path to access utilities
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utilities.storage import Storage
+
+class FakeCredentials:
+    """Picklable stand-in for google.oauth2 credentials."""
+
+    def to_json(self):
+        return json.dumps({'refresh_token': 'secret'})
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up a store and legacy files in a temporary directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.db_path = self.path('agent_data.db')
+        self.storage = Storage(self.db_path)
+        self.addCleanup(self.storage.close)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def write_json(self, name, data):
+        with open(self.path(name), 'w') as file:
+            json.dump(data, file)
+        return self.path(name)
+
+    def test_training_data_is_imported_when_it_changes(self):
+        """Test that training_data.json is imported on first use, and again only after an edit."""
+        path = self.write_json('training_data.json', {
+            'Weekly digest': {'action': 'ignore', 'sender': 'news@example.com'},
+            'always_ignore_senders': ['spam@example.com'],
+        })
+
+        self.assertTrue(self.storage.migrate_training_data(path))
+        self.storage.save_example('Invoice', {'action': 'archive'})
+        # A correction recorded after the import
+        self.storage.save_example('Weekly digest', {'action': 'archive', 'sender': 'news@example.com'})
+        self.assertFalse(self.storage.migrate_training_data(path))
+
+        self.write_json('training_data.json', {
+            'Weekly digest': {'action': 'ignore', 'sender': 'news@example.com'},
+            'rules': [{'field': 'subject_prefix', 'pattern': '[jira]', 'action': 'ignore'}],
+        })
+        os.utime(path, (0, 0))
+        self.assertTrue(self.storage.migrate_training_data(path))
+
+        training_data = self.storage.load_training_data()
+        self.assertEqual(training_data['Weekly digest']['action'], 'archive')
+        self.assertEqual(training_data['Invoice']['action'], 'archive')
+        self.assertEqual(training_data['rules'][0]['pattern'], '[jira]')
+        self.assertEqual(training_data['always_ignore_senders'], ['spam@example.com'])
+
+    def test_changes_survive_reopening(self):
+        """Test that examples and ignored senders are saved row by row and persist."""
+        self.storage.save_example('Invoice', {'action': 'archive'})
+        self.storage.save_example('Invoice', {'action': 'reply'})
+        self.assertTrue(self.storage.add_ignored_sender('a@example.com'))
+        self.assertTrue(self.storage.add_ignored_sender('b@example.com'))
+        self.assertFalse(self.storage.add_ignored_sender('a@example.com'))
+        self.storage.close()
+
+        reopened = Storage(self.db_path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.load_training_data(), {
+            'Invoice': {'action': 'reply'},
+            'always_ignore_senders': ['a@example.com', 'b@example.com'],
+        })
+
+    def test_corrupted_json_is_not_imported(self):
+        """Test that an unreadable legacy file leaves the store empty instead of failing."""
+        with open(self.path('contact_data.json'), 'w') as file:
+            file.write('{"truncated": ')
+
+        self.assertTrue(self.storage.migrate_contacts(self.path('contact_data.json')))
+        self.assertEqual(self.storage.load_contacts(), {})
+
+    def test_contacts_are_upserted(self):
+        """Test that saving some contacts keeps the others."""
+        self.storage.migrate_contacts(self.write_json('contact_data.json', {'ann': {'vip': False}, 'bob': {'vip': False}}))
+        self.storage.save_contact('ann', {'vip': True})
+
+        self.assertEqual(self.storage.load_contacts(), {'ann': {'vip': True}, 'bob': {'vip': False}})
+
+    def test_pickled_token_is_moved_to_the_store(self):
+        """Test that token.pickle is converted to JSON once and deleted."""
+        with open(self.path('token.pickle'), 'wb') as file:
+            pickle.dump(FakeCredentials(), file)
+
+        self.assertTrue(self.storage.migrate_pickled_token('gmail', self.path('token.pickle')))
+
+        self.assertFalse(os.path.exists(self.path('token.pickle')))
+        self.assertEqual(json.loads(self.storage.load_token('gmail')), {'refresh_token': 'secret'})
+
+if __name__ == '__main__':
+    unittest.main()
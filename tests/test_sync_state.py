@@ -0,0 +1,119 @@
+import sys
+import os
+import io
+import logging
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+# Ensure the repository root is in the Python path to access email_agents and integration
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from email_agents.email_agent import EmailAgent
+from integration.gmail_integration import GmailIntegration
+from integration.sync_state import SyncState
+from utilities.storage import Storage
+from fake_gmail import FakeGmailService, http_error, make_message
+from fake_llm import FakeLLMHelper, answers
+
+class TestIncrementalSync(unittest.TestCase):
+    def setUp(self):
+        """Set up an agent with a sync state in a temporary directory and 10 unread emails."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.sync_state = SyncState(path=os.path.join(self.tmpdir.name, 'sync_state.db'))
+        self.addCleanup(self.sync_state.close)
+
+        self.service = FakeGmailService([make_message(f'm{i}', subject=f'Unseen subject {i}') for i in range(10)])
+        # 'reply' leaves the messages unread, like mail the user chose to keep unread
+        self.llm_helper = FakeLLMHelper(suggest=lambda email_data: ('reply', ''), max_batch_size=5)
+        self.agent = EmailAgent(gmail=GmailIntegration(service=self.service), llm_helper=self.llm_helper,
+                                sync_state=self.sync_state, storage=Storage(':memory:'))
+
+    def test_second_run_only_processes_new_mail(self):
+        """Test that a rerun uses the history and skips mail that is still unread."""
+        self.agent.process_emails()
+        self.assertEqual(len(self.llm_helper.classified), 10)
+        self.assertEqual(self.sync_state.get_history_id(), str(self.service.history_id))
+
+        self.service.add_message(make_message('new', subject='Brand new'))
+        self.agent.process_emails()
+
+        self.assertEqual(len(self.llm_helper.classified), 11)
+        self.assertIn('history.list', self.service.calls)
+        self.assertEqual(self.service.calls.count('messages.list'), 1)
+
+    def test_expired_history_falls_back_to_full_scan(self):
+        """Test the full-scan fallback, where the ledger still prevents reclassification."""
+        self.agent.process_emails()
+        self.service.add_message(make_message('new', subject='Brand new'))
+        self.service.expire_history()
+
+        self.agent.process_emails()
+
+        self.assertEqual(self.service.calls.count('messages.list'), 2)
+        self.assertEqual(len(self.llm_helper.classified), 11)
+
+    def test_messages_read_or_moved_since_they_arrived_are_left_alone(self):
+        """Test that the history's labels are checked again on the fetched messages."""
+        self.agent.process_emails()
+        for message_id in ('read', 'spam', 'new'):
+            self.service.add_message(make_message(message_id, subject=f'Arrived {message_id}'))
+        # The user reads one and Gmail moves another to spam before the next run
+        self.service.messages['read']['labelIds'].remove('UNREAD')
+        self.service.messages['spam']['labelIds'].append('SPAM')
+        self.llm_helper.suggest = lambda email_data: ('archive', '')
+
+        self.agent.process_emails()
+
+        self.assertEqual(self.llm_helper.classified[10:], ['new'])
+        self.assertEqual(self.service.messages['read']['labelIds'], ['INBOX'])
+        self.assertEqual(self.service.messages['spam']['labelIds'], ['INBOX', 'UNREAD', 'SPAM'])
+        self.assertNotIn('INBOX', self.service.messages['new']['labelIds'])
+
+    def test_warning_level_runs_print_nothing(self):
+        """Test that the full-scan fallback and bulk actions stay quiet in unattended runs."""
+        self.agent.log_level = logging.WARNING
+        self.llm_helper.suggest = lambda email_data: ('ignore', '')
+        self.sync_state.set_history_id('1')
+        self.service.expire_history()
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.agent.process_emails()
+
+        self.assertEqual(output.getvalue(), '')
+        self.assertIn(('history_expired', {}, 1), self.agent.metrics.snapshot()['counters'])
+
+    def test_checkpoint_not_moved_when_run_fails(self):
+        """Test that a crashed run leaves the checkpoint in place but records applied actions."""
+        # The second LLM request (emails 6 to 10) fails
+        self.llm_helper.suggest = answers(*[('reply', '')] * 5 + [RuntimeError('LLM down')])
+
+        with self.assertRaises(RuntimeError):
+            self.agent.process_emails()
+
+        self.assertIsNone(self.sync_state.get_history_id())
+        self.assertEqual(len(self.sync_state.filter_unprocessed([f'm{i}' for i in range(10)])), 5)
+
+    def test_failed_modify_is_retried_next_run(self):
+        """Test that emails whose batchModify failed stay out of the ledger and keep the checkpoint in place."""
+        self.llm_helper.suggest = lambda email_data: ('archive', '')
+        self.service.errors['messages.batchModify'] = [http_error(400)]
+
+        with redirect_stdout(io.StringIO()):
+            self.agent.process_emails()
+
+        self.assertIn('INBOX', self.service.messages['m0']['labelIds'])
+        self.assertEqual(len(self.sync_state.filter_unprocessed([f'm{i}' for i in range(10)])), 10)
+        self.assertIsNone(self.sync_state.get_history_id())
+
+        # The next run processes and archives them again
+        with redirect_stdout(io.StringIO()):
+            self.agent.process_emails()
+        self.assertTrue(all('INBOX' not in message['labelIds'] for message in self.service.messages.values()))
+        self.assertEqual(self.sync_state.get_history_id(), str(self.service.history_id))
+
+if __name__ == '__main__':
+    unittest.main()
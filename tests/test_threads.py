@@ -0,0 +1,147 @@
+import sys
+import os
+import logging
+import unittest
+from unittest.mock import MagicMock
+
+# Ensure the repository root and the test helpers are in the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from email_agents.email_agent import EmailAgent
+from email_agents.threads import thread_subject
+from integration.gmail_integration import GmailIntegration
+from integration.sync_state import SyncState
+from utilities.llm_helper import THREAD_DIGEST
+from utilities.metrics import Metrics
+from utilities.prompt_builder import PromptBuilder
+from utilities.storage import Storage
+from fake_gmail import FakeGmailService, make_message
+from fake_llm import FakeLLMHelper
+
+def thread_message(message_id, thread_id, position, subject='Quarterly planning', sender='ann@example.com', to='me@example.com',
+                   cc=None, unread=True):
+    """A message of a conversation; every message after the first one is a reply."""
+    message = make_message(message_id, subject=subject if position == 0 else f'Re: {subject}', sender=sender, to=to, cc=cc,
+                           body=f'Message number {position}')
+    message['threadId'] = thread_id
+    message['internalDate'] = str(1700000000000 + position * 60000)
+    message['snippet'] = f'Message number {position}'
+    message['labelIds'] = ['INBOX', 'UNREAD'] if unread else ['INBOX']
+    if position:
+        message['payload']['headers'].append({'name': 'In-Reply-To', 'value': f'<{thread_id}-{position - 1}@example.com>'})
+    return message
+
+class TestThreadGrouping(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeGmailService()
+        self.storage = Storage(':memory:')
+        self.addCleanup(self.storage.close)
+        self.classified = []
+        self.action = 'archive'
+        self.metrics = Metrics()
+        self.sync_state = None
+
+    def suggest(self, email_data):
+        self.classified.append(email_data)
+        return self.action, 'Planning thread'
+
+    def run_agent(self, **options):
+        agent = EmailAgent(gmail=GmailIntegration(service=self.service, metrics=self.metrics),
+                           llm_helper=FakeLLMHelper(self.suggest), storage=self.storage, sync_state=self.sync_state,
+                           metrics=self.metrics, log_level=logging.WARNING, **options)
+        agent.process_emails()
+        return agent
+
+    def test_thread_is_classified_once(self):
+        # An earlier message of the conversation was read before, and is still in the inbox
+        self.service.add_message(thread_message('t1-0', 't1', 0, unread=False))
+        for position in range(1, 15):
+            self.service.add_message(thread_message(f't1-{position}', 't1', position, sender=('ann@example.com', 'bob@example.com')[position % 2]))
+        self.run_agent()
+
+        # One classification, of the latest message, with a digest of the earlier ones
+        self.assertEqual([email_data['id'] for email_data in self.classified], ['t1-14'])
+        self.assertIn('bob@example.com: Message number 13', self.classified[0][THREAD_DIGEST])
+        self.assertIn(('emails', {'action': 'archive', 'source': 'thread'}, 13), self.metrics.snapshot()['counters'])
+        # One batchModify archives the classified messages; the message that was already read is left alone
+        self.assertEqual(self.service.calls.count('messages.batchModify'), 1)
+        self.assertIn('INBOX', self.service.messages['t1-0']['labelIds'])
+        self.assertTrue(all('INBOX' not in self.service.messages[f't1-{position}']['labelIds'] for position in range(1, 15)))
+
+    def test_conversation_classified_reply_gets_one_draft(self):
+        self.action = 'reply'
+        for position in range(5):
+            self.service.add_message(thread_message(f't1-{position}', 't1', position))
+        self.service.add_message(thread_message('t2-0', 't2', 0, subject='Other topic'))
+        drafting_agent = MagicMock(your_name='Me')
+        drafting_agent.draft_replies.side_effect = lambda emails: [f"Re {email_data['id']}" for email_data in emails]
+        self.run_agent(drafting_agent=drafting_agent)
+
+        # One draft per conversation, answering its latest message
+        self.assertEqual(sorted(draft['message']['threadId'] for draft in self.service.drafts), ['t1', 't2'])
+        self.assertEqual(sorted(email_data['id'] for email_data in drafting_agent.draft_replies.call_args.args[0]), ['t1-4', 't2-0'])
+
+    def test_unclassified_messages_of_the_thread_stay_in_the_inbox(self):
+        for position in range(2):
+            self.service.add_message(thread_message(f't1-{position}', 't1', position))
+        agent = EmailAgent(gmail=GmailIntegration(service=self.service, metrics=self.metrics),
+                           llm_helper=FakeLLMHelper(self.suggest), storage=self.storage, metrics=self.metrics,
+                           log_level=logging.WARNING)
+        for message_id, email_data, suggestion in agent.iter_classified_emails(query='is:unread'):
+            agent.process_email(message_id, email_data, suggestion)
+            # A reply arrives after the listing, before the archive is flushed
+            self.service.add_message(thread_message('t1-2', 't1', 2))
+        agent.flush_actions()
+        self.assertNotIn('INBOX', self.service.messages['t1-1']['labelIds'])
+        self.assertEqual(self.service.messages['t1-2']['labelIds'], ['INBOX', 'UNREAD'])
+
+    def test_decision_is_reused_until_the_conversation_changes(self):
+        # Archived messages stay unread; the ledger keeps later runs to the new messages
+        self.sync_state = SyncState(':memory:')
+        self.addCleanup(self.sync_state.close)
+        for position in range(2):
+            self.service.add_message(thread_message(f't1-{position}', 't1', position))
+        self.run_agent()
+        self.assertEqual(len(self.classified), 1)
+
+        # A reply from the same people about the same thing reuses the stored decision
+        self.service.add_message(thread_message('t1-2', 't1', 2))
+        self.run_agent()
+        self.assertEqual(len(self.classified), 1)
+
+        # A new participant, a changed subject or a change of direct recipient is classified again
+        self.service.add_message(thread_message('t1-3', 't1', 3, cc='carol@example.com'))
+        self.run_agent()
+        self.service.add_message(thread_message('t1-4', 't1', 4, subject='Offsite budget'))
+        self.run_agent()
+        self.service.add_message(thread_message('t1-5', 't1', 5, subject='Offsite budget', to='team@example.com', cc='me@example.com'))
+        self.run_agent()
+        self.assertEqual([email_data['id'] for email_data in self.classified], ['t1-1', 't1-3', 't1-4'])
+
+    def test_ignored_threads_are_marked_read_message_by_message(self):
+        self.action = 'ignore'
+        for position in range(3):
+            self.service.add_message(thread_message(f't1-{position}', 't1', position))
+        self.run_agent()
+        self.assertEqual(self.service.calls.count('messages.batchModify'), 1)
+        self.assertTrue(all('UNREAD' not in message['labelIds'] for message in self.service.messages.values()))
+
+    def test_without_grouping_every_message_is_classified(self):
+        for position in range(3):
+            self.service.add_message(thread_message(f't1-{position}', 't1', position))
+        self.run_agent(group_threads=False)
+        self.assertEqual(len(self.classified), 3)
+
+    def test_thread_subject(self):
+        self.assertEqual(thread_subject('RE: Fwd:  Quarterly   Planning'), 'quarterly planning')
+        self.assertEqual(thread_subject('Re[2]: AW: Budget'), 'budget')
+
+    def test_digest_takes_from_the_body_budget(self):
+        builder = PromptBuilder('gpt-4o-mini', max_email_tokens=200)
+        summary, tokens = builder.summarize('Re: Lunch', 'jane@example.com', 'word ' * 1000, 'bob@example.com: Tuesday? ' * 100)
+        self.assertTrue(summary['earlier'].endswith('[...]'))
+        self.assertLessEqual(tokens, 200 + 40)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+from email.utils import getaddresses, parseaddr
+
+def normalize_address(value):
+    """Return the bare, lowercased e-mail address of a header value."""
+    return parseaddr(value or '')[1].strip().lower()
+
+def parse_addresses(*values):
+    """Return the (display name, lowercased address) pairs of one or more address header values.
+
+    Uses RFC 5322 parsing, so commas inside quoted display names do not split an address.
+    """
+    return [(name, address.strip().lower()) for name, address in getaddresses([value for value in values if value])
+            if address.strip()]
+
+def address_domain(address):
+    return address.rpartition('@')[2]
+
+def parent_domains(domain):
+    """Yield a domain and its parent domains: mail.example.com, example.com, com."""
+    parts = domain.split('.')
+    for i in range(len(parts)):
+        yield '.'.join(parts[i:])
+
+class AddressIndex:
+    """Hashed sets of addresses and domains that header values are matched against.
+
+    Patterns are addresses ('ceo@example.com', or a full '"Name" <ceo@example.com>' header value) or
+    domain rules ('example.com', '@example.com' or '*@example.com'). A domain rule also matches its
+    subdomains, so a lookup costs one set probe per label of the sender's domain.
+    """
+
+    def __init__(self, patterns=()):
+        self.addresses = set()
+        self.domains = set()
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        pattern = pattern.strip().lower()
+        if pattern.startswith('*@') or pattern.startswith('@'):
+            self.domains.add(pattern.lstrip('*@'))
+        elif '@' in pattern:
+            self.addresses.add(normalize_address(pattern) or pattern)
+        elif pattern:
+            self.domains.add(pattern.lstrip('*.'))
+
+    def matches(self, value):
+        """True if the address of a header value is in the index, directly or through its domain."""
+        address = normalize_address(value)
+        if not address:
+            return False
+        if address in self.addresses:
+            return True
+        return any(domain in self.domains for domain in parent_domains(address_domain(address)))
+
+    def __contains__(self, value):
+        return self.matches(value)
+
+    def match_any(self, values):
+        """True if any of the addresses is in the index."""
+        return any(self.matches(value) for value in values)
+
+    def __len__(self):
+        return len(self.addresses) + len(self.domains)
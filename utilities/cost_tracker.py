@@ -0,0 +1,88 @@
+import threading
+
+# USD per 1M (input, output) tokens; override with price_per_million_input/output in OAI_CONFIG_LIST
+MODEL_PRICES = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+
+def model_prices(model_config):
+    """Return the (input, output) price per 1M tokens for a model config; local models are free."""
+    if 'price_per_million_input' in model_config or 'price_per_million_output' in model_config:
+        return model_config.get('price_per_million_input', 0.0), model_config.get('price_per_million_output', 0.0)
+    if model_config.get('api_type') != 'openai':
+        return 0.0, 0.0
+    model = model_config['model']
+    # Dated snapshots (e.g. gpt-4o-mini-2024-07-18) use the price of their family
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_PRICES[name]
+    return 0.0, 0.0
+
+class CostTracker:
+    """Records prompt/completion tokens and estimated cost of LLM requests, per email, grouped by suggested action."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_action = {}
+        self.requests = 0
+        # Latency of the requests, in seconds
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.cached_calls = 0
+
+    def record(self, model_config, prompt_tokens, completion_tokens, action, seconds=0.0):
+        """Record a request about a single email."""
+        return self.record_batch(model_config, prompt_tokens, completion_tokens, [action], seconds)
+
+    def record_batch(self, model_config, prompt_tokens, completion_tokens, actions, seconds=0.0):
+        """Record a request about several emails, sharing its tokens equally between them.
+
+        Emails without a valid answer are recorded under the 'invalid' action.
+        """
+        input_price, output_price = model_prices(model_config)
+        cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+        with self.lock:
+            self.requests += 1
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            for position, action in enumerate(actions):
+                totals = self.by_action.setdefault(action, {'emails': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0})
+                totals['emails'] += 1
+                # Integer shares, the first emails take the remainder so the totals stay exact
+                totals['prompt_tokens'] += prompt_tokens // len(actions) + (position < prompt_tokens % len(actions))
+                totals['completion_tokens'] += completion_tokens // len(actions) + (position < completion_tokens % len(actions))
+                totals['cost'] += cost / len(actions)
+        return cost
+
+    def record_cached(self):
+        with self.lock:
+            self.cached_calls += 1
+
+    def totals(self):
+        with self.lock:
+            total = {'emails': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0}
+            for totals in self.by_action.values():
+                for key in total:
+                    total[key] += totals[key]
+            return total
+
+    def summary(self):
+        """Return the end-of-run report as a list of lines."""
+        lines = [f"{'action':<12} {'emails':>6} {'prompt tok':>11} {'compl. tok':>11} {'cost USD':>10}"]
+        with self.lock:
+            rows = sorted(self.by_action.items(), key=lambda item: -item[1]['cost'])
+        for action, totals in rows:
+            lines.append(f"{action:<12} {totals['emails']:>6} {totals['prompt_tokens']:>11} {totals['completion_tokens']:>11} {totals['cost']:>10.4f}")
+        total = self.totals()
+        lines.append(f"{'total':<12} {total['emails']:>6} {total['prompt_tokens']:>11} {total['completion_tokens']:>11} {total['cost']:>10.4f}")
+        line = f"{self.requests} LLM requests for {total['emails']} emails"
+        if self.requests:
+            line += f", {self.seconds / self.requests:.2f}s per request (max {self.max_seconds:.2f}s)"
+        lines.append(line + ".")
+        if self.cached_calls:
+            lines.append(f"{self.cached_calls} suggestions were served from the cache at no cost.")
+        return lines
@@ -0,0 +1,140 @@
+"""Model backends used by LLMHelper: the OpenAI API, and OpenAI-compatible local HTTP servers (llama.cpp, vLLM, ...).
+
+openai and requests are imported by the backend that uses them, so importing this module (and the agents) stays cheap.
+"""
+import json
+from abc import ABC, abstractmethod
+
+# (connect, read) timeouts in seconds; override with "timeout" in OAI_CONFIG_LIST
+DEFAULT_TIMEOUT = (5, 60)
+# Keep-alive connections kept open to a local server; override with "max_connections"
+DEFAULT_MAX_CONNECTIONS = 16
+
+class LLMBackend(ABC):
+    """Sends one prompt to a model and returns (text, usage), usage being (prompt_tokens, completion_tokens) or None.
+
+    A backend without complete() cannot be instantiated, so it fails when it is configured rather than mid-run.
+    """
+
+    @abstractmethod
+    def complete(self, system_prompt, user_prompt, max_tokens=None, stop_when=None):
+        """Return the model's answer. stop_when(text) may end a streamed answer as soon as it returns True."""
+
+    def close(self):
+        pass
+
+class OpenAIBackend(LLMBackend):
+    """Chat completions through the OpenAI client."""
+
+    def __init__(self, model_config):
+        import openai
+
+        self.model = model_config['model']
+        # Retries are handled by the ResilientBackend around every call
+        self.client = openai.Client(api_key=model_config['api_key'], timeout=timeout_from_config(model_config)[1], max_retries=0)
+
+    def complete(self, system_prompt, user_prompt, max_tokens=None, stop_when=None):
+        params = {}
+        if max_tokens:
+            params['max_tokens'] = max_tokens
+        response = self.client.chat.completions.create(
+            model=self.model,  # Model from config (e.g., "gpt-4")
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            **params
+        )
+
+        usage = None
+        if response.usage is not None:
+            usage = (response.usage.prompt_tokens, response.usage.completion_tokens)
+        # Extract the completion from the response using dot notation
+        return response.choices[0].message.content, usage
+
+    def close(self):
+        self.client.close()
+
+class LocalHTTPBackend(LLMBackend):
+    """Text completions from a local OpenAI-compatible server, streamed over a pooled keep-alive session."""
+
+    def __init__(self, model_config):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.model = model_config['model']
+        self.url = f"{model_config['base_url'].rstrip('/')}/completions"
+        self.timeout = timeout_from_config(model_config)
+        # Streaming lets us hang up once the answer is complete, which stops generation on the server
+        self.stream = model_config.get('stream', True)
+
+        max_connections = model_config.get('max_connections', DEFAULT_MAX_CONNECTIONS)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=max_connections))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_connections))
+        if model_config.get('api_key'):
+            self.session.headers['Authorization'] = f"Bearer {model_config['api_key']}"
+
+    def complete(self, system_prompt, user_prompt, max_tokens=None, stop_when=None):
+        data = {
+            "model": self.model,  # The local model to query
+            "prompt": f"{system_prompt}\n\n{user_prompt}",
+            "temperature": 0,
+            "stream": self.stream,
+        }
+        if max_tokens:
+            data['max_tokens'] = max_tokens
+
+        response = self.session.post(self.url, json=data, timeout=self.timeout, stream=self.stream)
+        with response:
+            # Raise on 429/5xx so the resilience layer can retry
+            response.raise_for_status()
+            if response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                return self.read_stream(response, stop_when)
+            return self.read_json(response.json())
+
+    def read_json(self, response_data):
+        if 'choices' in response_data and len(response_data['choices']) > 0:
+            return response_data['choices'][0]['text'], usage_from_data(response_data)
+        raise ValueError("Invalid response from local LLM")
+
+    def read_stream(self, response, stop_when):
+        """Collect the text of server-sent events until [DONE] or until stop_when says the answer is complete."""
+        text = []
+        usage = None
+        done = False
+        for line in response.iter_lines(decode_unicode=True):
+            # After [DONE], keep reading to the end of the body so the connection goes back to the pool
+            if done or not line or not line.startswith('data:'):
+                continue
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                done = True
+                continue
+            event = json.loads(payload)
+            usage = usage_from_data(event) or usage
+            if event.get('choices'):
+                text.append(event['choices'][0].get('text') or '')
+                if stop_when is not None and stop_when(''.join(text)):
+                    # Closing the response drops the connection, and the server stops generating
+                    break
+        return ''.join(text), usage
+
+    def close(self):
+        self.session.close()
+
+def timeout_from_config(model_config):
+    timeout = model_config.get('timeout', DEFAULT_TIMEOUT)
+    return tuple(timeout) if isinstance(timeout, (list, tuple)) else (timeout, timeout)
+
+def usage_from_data(response_data):
+    usage = response_data.get('usage')
+    if not usage:
+        return None
+    return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+
+def create_backend(model_config):
+    """Return the backend for a model config entry, based on its api_type."""
+    if model_config['api_type'] == "openai":
+        return OpenAIBackend(model_config)
+    return LocalHTTPBackend(model_config)
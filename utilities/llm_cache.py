@@ -0,0 +1,97 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+# Default lifetime of a cached suggestion (30 days)
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+# Default maximum number of cached suggestions before least recently used ones are evicted
+DEFAULT_MAX_ENTRIES = 50000
+# How many writes happen between two size checks
+EVICTION_INTERVAL = 100
+
+class LLMCache:
+    """On-disk (SQLite) cache of LLM responses keyed on a hash of the model, prompt version and email content."""
+
+    def __init__(self, path='llm_cache.db', ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+
+        # Worker threads share one connection, serialized by self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        self.conn.commit()
+
+    @staticmethod
+    def normalize(text):
+        """Lowercase and collapse whitespace so trivially different copies share a key."""
+        return re.sub(r'\s+', ' ', text or '').strip().lower()
+
+    def make_key(self, model, prompt_version, *parts):
+        """Build the content-addressed key for a model, prompt template version and email fields."""
+        normalized = '\0'.join(self.normalize(part) for part in parts)
+        return hashlib.sha256(f'{model}\0{prompt_version}\0{normalized}'.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss or an expired entry."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        """Store a JSON-serializable value under key."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, created_at, last_used) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now)
+            )
+            self.writes += 1
+            if self.writes % EVICTION_INTERVAL == 0:
+                self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries."""
+        self.conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        count = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        """Return the hit/miss counters for this run."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
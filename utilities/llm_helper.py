@@ -1,25 +1,117 @@
-import openai
 import json
+import logging
+import re
+import time
+from utilities import message_parser
+from utilities.cost_tracker import CostTracker
+from utilities.llm_backends import create_backend
+from utilities.metrics import Metrics
+from utilities.prompt_builder import PromptBuilder, TokenBudgetExceeded, COMPLETION_TOKENS_PER_EMAIL, DEFAULT_BATCH_TOKENS, DEFAULT_EMAIL_TOKENS
+from utilities.rate_limiter import RateLimiter
+from utilities.resilience import ResilientBackend
+
+# Default limits when the model config does not set requests_per_minute / tokens_per_minute
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 30000
+
+# Most emails sent to the LLM in one request (the token budget may make batches smaller)
+DEFAULT_BATCH_SIZE = 10
+# How many times the emails of a batch without a valid answer are asked again
+MAX_REASKS = 2
+
+VALID_ACTIONS = ('archive', 'reply', 'ignore')
+ACTION_PATTERN = re.compile(r'\b(archive|reply|ignore)\b', re.IGNORECASE)
+JSON_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+# Bump whenever the prompt changes so cached answers to the old prompt are not reused
+PROMPT_VERSION = 4
+# Key of the digest of earlier messages that the agent adds to the latest email of a conversation (see email_agents/threads.py)
+THREAD_DIGEST = 'threadDigest'
+
+def normalize_action(text):
+    """Return the action named in an answer such as '**Archive**' or 'Suggestion: reply.', or None."""
+    found = ACTION_PATTERN.search(text)
+    return found.group(1).lower() if found else None
+
+def parse_confidence(value):
+    """Return a confidence in [0, 1], None when the answer has none, or raise ValueError when it is invalid."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 1:
+        raise ValueError(f"Invalid confidence {value!r}")
+    return float(value)
+
+def answer_complete(text):
+    """True once a streamed answer contains a complete JSON array, so the rest of the stream can be skipped."""
+    start = text.find('[')
+    if start == -1 or ']' not in text:
+        return False
+    depth = 0
+    in_string = escaped = False
+    for char in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '[{':
+            depth += 1
+        elif char in ']}':
+            depth -= 1
+            if depth == 0:
+                return True
+    return False
+
+def load_json_array(text):
+    """Parse the JSON array of an answer, tolerating code fences, text around it or a wrapping object."""
+    text = JSON_FENCE.sub('', text.strip())
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end < start:
+        return []
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return []
+    return items if isinstance(items, list) else []
 
 class LLMHelper:
-    def __init__(self, model_choice="gpt-4-turbo"):
+    def __init__(self, model_choice="gpt-4-turbo", config_path='OAI_CONFIG_LIST', cache=None, backend=None,
+                 max_email_tokens=DEFAULT_EMAIL_TOKENS, max_run_tokens=None, max_batch_size=DEFAULT_BATCH_SIZE,
+                 max_batch_tokens=DEFAULT_BATCH_TOKENS, token_budget=None, metrics=None, log_level=logging.INFO):
         # Load configuration from the OAI_CONFIG_LIST file
-        with open('OAI_CONFIG_LIST', 'r') as file:
+        with open(config_path, 'r') as file:
             config = json.load(file)
 
         # Find the model config based on the model_choice
         self.model_config = self.get_model_config(config, model_choice)
 
-        # If using an OpenAI model, set up the API key and OpenAI client
-        if self.model_config['api_type'] == "openai":
-            self.client = openai.Client(api_key=self.model_config['api_key'])
-            self.use_openai = True
-        else:
-            # For local models, store the base URL and other config
-            self.use_openai = False
-            self.base_url = self.model_config['base_url']
-            self.api_key = self.model_config['api_key']
-            self.model = self.model_config['model']
+        # Shared by all worker threads so concurrent classification stays under the provider's limits,
+        # with retries on 429/5xx and a circuit breaker that pauses calls while the provider is failing
+        self.backend = backend or ResilientBackend(self.model_config['model'], limiters={
+            'requests': RateLimiter(self.model_config.get('requests_per_minute', DEFAULT_REQUESTS_PER_MINUTE)),
+            'tokens': RateLimiter(self.model_config.get('tokens_per_minute', DEFAULT_TOKENS_PER_MINUTE)),
+        }, log_level=log_level)
+
+        # Persistent response cache, so reruns over the same emails cost no tokens (None disables it)
+        self.cache = cache
+
+        # Counts tokens with the model's tokenizer and keeps prompts within the per-email, per-batch and per-run budgets
+        self.prompt_builder = PromptBuilder(self.model_config['model'], max_email_tokens=max_email_tokens,
+                                            max_run_tokens=max_run_tokens, max_batch_tokens=max_batch_tokens,
+                                            budget=token_budget)
+        # Several emails share one request, so the instructions are only sent once per batch
+        self.max_batch_size = max(1, max_batch_size)
+        # Token usage and estimated spend of the calls actually sent to the model
+        self.cost_tracker = CostTracker()
+        # Run-wide request latency, token, cache and error counters, shared with the agent
+        self.metrics = metrics or Metrics()
+
+        # OpenAI client, or a pooled keep-alive session to a local OpenAI-compatible server
+        self.model_backend = create_backend(self.model_config)
 
     def get_model_config(self, config, model_choice):
         """Get the model configuration for the specified model_choice."""
@@ -29,53 +121,167 @@ class LLMHelper:
         raise ValueError(f"Model {model_choice} not found in the configuration")
 
     def suggest_action(self, email_data):
-        """Query the selected LLM to suggest an action for the email."""
-        subject = self.extract_subject(email_data)
-        body = self.extract_body(email_data)
-        
-        if self.use_openai:
-            return self.query_openai(subject, body)
-        else:
-            return self.query_local_model(subject, body)
-
-    def query_openai(self, subject, body):
-        """Query OpenAI's API for a suggested action using the OpenAI client."""
-        response = self.client.chat.completions.create(
-            model=self.model_config['model'],  # Model from config (e.g., "gpt-4")
-            messages=[
-                {"role": "system", "content": "You are an assistant helping process emails."},
-                {"role": "user", "content": f"Subject: {subject}\nBody: {body}\n\nPlease respond with an action suggestion (archive/reply/ignore), followed by an explanation under 50 words. Format your answer as: **suggestion action** \n explanation."}
-            ]
-        )
-
-        # Extract the completion from the response using dot notation
-        action_response = response.choices[0].message.content
-
-        # Split the response into the recommended action and an optional explanation
-        suggested_action, explanation = self.extract_suggestion_and_explanation(action_response)
-
-        return suggested_action.strip().lower(), explanation.strip()
-
-
-    def query_local_model_with_prompt(self, prompt):
-        """Query the locally hosted LLM."""
-        import requests
-
-        data = {
-            "model": self.model,  # The local model to query
-            "prompt": prompt
-        }
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        
-        response = requests.post(f"{self.base_url}/completions", json=data, headers=headers)
-        response_data = response.json()
-
-        if 'choices' in response_data and len(response_data['choices']) > 0:
-            action_response = response_data['choices'][0]['text']
-            suggested_action, explanation = self.extract_suggestion_and_explanation(action_response)
-            return suggested_action.strip().lower(), explanation.strip()
-        else:
-            raise ValueError("Invalid response from local LLM")
+        """Query the selected LLM to suggest an action for the email, see suggest_actions."""
+        return self.suggest_actions([email_data])[0]
+
+    def suggest_actions(self, emails):
+        """Suggest an (action, explanation, confidence) triple for each email, in as few requests as the budgets allow.
+
+        Emails that could not be classified (run token budget reached, no valid answer) get (None, reason, None).
+        """
+        results = [None] * len(emails)
+        pending = []
+        for index, email_data in enumerate(emails):
+            summary, tokens = self.prompt_builder.summarize(self.extract_subject(email_data),
+                                                            self.extract_sender(email_data),
+                                                            self.extract_body(email_data),
+                                                            email_data.get(THREAD_DIGEST))
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self.cache.make_key(self.model_config['model'], PROMPT_VERSION, summary['subject'], summary['from'], summary['body'],
+                                                summary.get('earlier', ''))
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.cost_tracker.record_cached()
+                    self.metrics.increment('llm_cache_hits')
+                    results[index] = tuple(cached)
+                    continue
+                self.metrics.increment('llm_cache_misses')
+            pending.append((index, summary, tokens, cache_key))
+
+        for attempt in range(1 + MAX_REASKS):
+            if not pending:
+                break
+            batches = self.prompt_builder.plan_batches([tokens for _, _, tokens, _ in pending], self.max_batch_size)
+            failed = []
+            for batch in batches:
+                items = [pending[i] for i in batch]
+                try:
+                    answers = self.query_batch([(index, summary) for index, summary, _, _ in items])
+                except TokenBudgetExceeded as error:
+                    # Another thread used up the budget since the batches were planned
+                    answers = {}
+                    for index, _, _, _ in items:
+                        results[index] = (None, str(error), None)
+                for item in items:
+                    index, _, _, cache_key = item
+                    if index in answers:
+                        results[index] = answers[index]
+                        if cache_key is not None:
+                            self.cache.set(cache_key, list(answers[index]))
+                    elif results[index] is None:
+                        # Only the emails without a valid answer are asked again
+                        failed.append(item)
+
+            # Emails that did not fit in any batch are over the run budget
+            planned = {i for batch in batches for i in batch}
+            for i, (index, _, _, _) in enumerate(pending):
+                if i not in planned:
+                    results[index] = (None, f"Run token budget of {self.prompt_builder.budget.max_tokens} reached", None)
+            pending = failed
+
+        for index, _, _, _ in pending:
+            results[index] = (None, f"No valid answer from {self.model_config['model']} after {1 + MAX_REASKS} attempts", None)
+        return results
+
+    def query_batch(self, items):
+        """Send one batched request for (index, summary) pairs; return {index: (action, explanation, confidence)}
+        for the emails with a valid answer."""
+        ids = {str(number): index for number, (index, _) in enumerate(items, start=1)}
+        system_prompt, user_prompt, prompt_tokens = self.prompt_builder.build_batch(
+            [(number, summary) for number, (_, summary) in zip(ids, items)])
+
+        # Cached answers are free, so only requests to the model count against the run budget
+        estimate = prompt_tokens + COMPLETION_TOKENS_PER_EMAIL * len(items)
+        self.prompt_builder.budget.reserve(estimate)
+
+        # Room for the answers, so a rambling model cannot run up the bill
+        query = lambda: self.model_backend.complete(system_prompt, user_prompt, max_tokens=2 * COMPLETION_TOKENS_PER_EMAIL * len(items),
+                                                    stop_when=answer_complete)
+        started = time.monotonic()
+        try:
+            response_text, usage = self.backend.call(query, {'requests': 1, 'tokens': estimate})
+        except Exception:
+            self.prompt_builder.budget.settle(estimate, 0)
+            self.metrics.increment('errors', stage='llm')
+            raise
+        seconds = time.monotonic() - started
+
+        # Replace the estimate by what the provider reports (or our own count if it reports nothing)
+        if usage is None:
+            usage = (prompt_tokens, self.prompt_builder.count_tokens(response_text))
+        self.prompt_builder.budget.settle(estimate, sum(usage))
+
+        answers = self.parse_batch_answer(response_text, ids)
+        self.cost_tracker.record_batch(self.model_config, usage[0], usage[1],
+                                       [answers[index][0] if index in answers else 'invalid' for index in ids.values()],
+                                       seconds=seconds)
+        self.record_usage('llm', seconds, usage, invalid=len(ids) - len(answers))
+        return answers
+
+    def record_usage(self, stage, seconds, usage, invalid=0):
+        """Record the latency and tokens of a request sent to the model in the run metrics."""
+        model = self.model_config['model']
+        self.metrics.observe(stage, seconds)
+        self.metrics.increment('llm_requests', model=model)
+        self.metrics.increment('llm_prompt_tokens', usage[0], model=model)
+        self.metrics.increment('llm_completion_tokens', usage[1], model=model)
+        if invalid:
+            self.metrics.increment('llm_invalid_answers', invalid, model=model)
+
+    def complete(self, system_prompt, user_prompt, max_tokens, action='completion'):
+        """Send a free-form prompt (e.g. a reply draft) through the same limits, run budget and cost report as classification."""
+        prompt_tokens = self.prompt_builder.count_tokens(system_prompt) + self.prompt_builder.count_tokens(user_prompt)
+        estimate = prompt_tokens + max_tokens
+        self.prompt_builder.budget.reserve(estimate)
+
+        query = lambda: self.model_backend.complete(system_prompt, user_prompt, max_tokens=max_tokens)
+        started = time.monotonic()
+        try:
+            response_text, usage = self.backend.call(query, {'requests': 1, 'tokens': estimate})
+        except Exception:
+            self.prompt_builder.budget.settle(estimate, 0)
+            self.metrics.increment('errors', stage=f'llm.{action}')
+            raise
+        seconds = time.monotonic() - started
+
+        if usage is None:
+            usage = (prompt_tokens, self.prompt_builder.count_tokens(response_text))
+        self.prompt_builder.budget.settle(estimate, sum(usage))
+        self.cost_tracker.record(self.model_config, usage[0], usage[1], action, seconds=seconds)
+        self.record_usage(f'llm.{action}', seconds, usage)
+        return response_text.strip()
+
+    def parse_batch_answer(self, response_text, ids):
+        """Validate a batched answer against the batch IDs; return {index: (action, explanation, confidence)}."""
+        answers = {}
+        for item in load_json_array(response_text):
+            if not isinstance(item, dict) or not isinstance(item.get('action'), str):
+                continue
+            index = ids.get(str(item.get('id')))
+            action = normalize_action(item['action'])
+            try:
+                confidence = parse_confidence(item.get('confidence'))
+            except ValueError:
+                continue
+            if index is None or action is None:
+                continue
+            answers[index] = (action, str(item.get('explanation') or '').strip(), confidence)
+
+        if not answers and len(ids) == 1:
+            # Small local models often ignore the JSON format for a single email; accept "**action**\nexplanation"
+            suggested_action, explanation = self.extract_suggestion_and_explanation(response_text)
+            action = normalize_action(suggested_action)
+            if action is not None:
+                answers[next(iter(ids.values()))] = (action, explanation.strip(), None)
+        return answers
+
+    def report(self):
+        """Return the end-of-run report (throttling, retries, tokens and cost), as a list of lines."""
+        return [self.backend.summary()] + self.cost_tracker.summary()
+
+    def close(self):
+        self.model_backend.close()
 
     def extract_suggestion_and_explanation(self, response_text):
         """Extract the action suggestion and optional explanation from the response."""
@@ -89,17 +295,13 @@ class LLMHelper:
             return lines[0], ""
 
     def extract_subject(self, email_data):
-        """Extract the subject of the email."""
-        headers = email_data['payload'].get('headers', [])
-        for header in headers:
-            if header['name'] == 'Subject':
-                return header['value']
-        return "No Subject"
+        """Extract the subject from the email headers."""
+        return message_parser.get_header(email_data, 'Subject', "No Subject")
+
+    def extract_sender(self, email_data):
+        """Extract the sender from the email headers."""
+        return message_parser.get_header(email_data, 'From')
 
     def extract_body(self, email_data):
-        """Extract the body of the email."""
-        if 'parts' in email_data['payload']:
-            for part in email_data['payload']['parts']:
-                if part['mimeType'] == 'text/plain':
-                    return part['body'].get('data', '')
-        return "No body content"
+        """Extract the decoded, readable body of the email; the prompt builder cuts it to the exact budget."""
+        return message_parser.extract_body(email_data, max_tokens=self.prompt_builder.max_email_tokens)
@@ -0,0 +1,146 @@
+"""Shared helpers to read Gmail API message resources: headers, and a decoded, cleaned-up body."""
+import base64
+import html
+import re
+
+# Default size of the body handed to the LLM, in (approximate) tokens
+DEFAULT_BODY_TOKENS = 1000
+# Rough number of characters per token for English text
+CHARS_PER_TOKEN = 4
+# How much more decoded text than the budget to read, since quotes, signatures and markup are dropped
+DECODE_HEADROOM = {'text/plain': 3, 'text/html': 10}
+
+NO_BODY = "No body content"
+TRUNCATION_MARKER = " [...]"
+
+SCRIPT_STYLE = re.compile(r'<(script|style|head)\b.*?(</\1\s*>|$)', re.IGNORECASE | re.DOTALL)
+BLOCK_TAGS = re.compile(r'<\s*(br|/p|/div|/li|/tr|/h[1-6]|/table|hr)\b[^>]*>', re.IGNORECASE)
+TAGS = re.compile(r'<[^>]+>')
+COMMENTS = re.compile(r'<!--.*?-->', re.DOTALL)
+HORIZONTAL_SPACE = re.compile(r'[ \t\r\f\v\xa0]+')
+BLANK_LINES = re.compile(r'\n\s*\n\s*\n+')
+CHARSET = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+# Lines that start the quoted copy of an earlier message in a reply
+REPLY_HEADERS = [
+    re.compile(r'^On .{0,200}wrote:\s*$'),
+    re.compile(r'^Le .{0,200}a écrit\s*:\s*$'),
+    re.compile(r'^-{2,}\s*(Original Message|Forwarded message)\s*-{2,}\s*$', re.IGNORECASE),
+    re.compile(r'^From: .+$'),
+    re.compile(r'^_{10,}\s*$'),
+]
+# Lines that start a signature
+SIGNATURE_MARKERS = [
+    re.compile(r'^--\s?$'),
+    re.compile(r'^Sent from my \w+', re.IGNORECASE),
+    re.compile(r'^Get Outlook for \w+', re.IGNORECASE),
+]
+
+def get_header(email_data, name, default=""):
+    """Return the first header called name (case-insensitive)."""
+    name = name.lower()
+    for header in email_data.get('payload', {}).get('headers', []):
+        if header['name'].lower() == name:
+            return header['value']
+    return default
+
+def iter_parts(part):
+    """Walk a MIME tree depth-first, yielding every part (including multipart containers)."""
+    yield part
+    for child in part.get('parts', []) or []:
+        yield from iter_parts(child)
+
+def find_body_part(payload):
+    """Return the first inline text/plain part, or the first text/html part if there is none."""
+    html_part = None
+    for part in iter_parts(payload):
+        # Attached files carry a filename and usually no inline data
+        if part.get('filename') or not part.get('body', {}).get('data'):
+            continue
+        mime_type = part.get('mimeType', '').lower()
+        if mime_type == 'text/plain':
+            return part
+        if mime_type == 'text/html' and html_part is None:
+            html_part = part
+    return html_part
+
+def part_charset(part):
+    for header in part.get('headers', []) or []:
+        if header['name'].lower() == 'content-type':
+            found = CHARSET.search(header['value'])
+            if found:
+                return found.group(1)
+    return 'utf-8'
+
+def decode_data(data, charset='utf-8', max_chars=None):
+    """Decode base64url data; with max_chars, only the needed prefix of the data is decoded."""
+    truncated = False
+    if max_chars is not None:
+        # 4 base64 characters hold 3 bytes; allow for 2 bytes per decoded character
+        limit = -(-max_chars * 2 // 3) * 4
+        if len(data) > limit:
+            data, truncated = data[:limit], True
+    raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    try:
+        text = raw.decode(charset, errors='replace')
+    except LookupError:
+        text = raw.decode('utf-8', errors='replace')
+    if truncated:
+        # The cut may have split the last character
+        text = text[:-1]
+    return text[:max_chars] if max_chars is not None else text
+
+def html_to_text(markup):
+    """Cheap HTML to text conversion: drop scripts, styles and tags, keep line breaks."""
+    text = COMMENTS.sub('', markup)
+    text = SCRIPT_STYLE.sub('', text)
+    text = BLOCK_TAGS.sub('\n', text)
+    text = TAGS.sub('', text)
+    return html.unescape(text)
+
+def strip_quotes_and_signature(text):
+    """Drop quoted replies (> lines, "On ... wrote:" blocks) and the signature."""
+    kept = []
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if any(marker.match(stripped) for marker in REPLY_HEADERS) and kept:
+            break
+        if any(marker.match(stripped) for marker in SIGNATURE_MARKERS):
+            break
+        if stripped.startswith('>'):
+            continue
+        kept.append(line)
+    return '\n'.join(kept)
+
+def normalize_whitespace(text):
+    text = HORIZONTAL_SPACE.sub(' ', text)
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    return BLANK_LINES.sub('\n\n', text).strip()
+
+def truncate(text, max_tokens):
+    """Cut text to about max_tokens tokens, on a word boundary."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + TRUNCATION_MARKER
+
+def extract_body(email_data, max_tokens=DEFAULT_BODY_TOKENS):
+    """Return the readable body of a message: decoded, HTML converted to text, without quotes
+    and signature, and cut to max_tokens (None for no limit)."""
+    part = find_body_part(email_data.get('payload', {}))
+    if part is None:
+        return NO_BODY
+
+    mime_type = part.get('mimeType', '').lower()
+    max_chars = None
+    if max_tokens is not None:
+        max_chars = max_tokens * CHARS_PER_TOKEN * DECODE_HEADROOM.get(mime_type, 3)
+    text = decode_data(part['body']['data'], part_charset(part), max_chars)
+
+    if mime_type == 'text/html':
+        text = html_to_text(text)
+    text = normalize_whitespace(strip_quotes_and_signature(text))
+    if not text:
+        return NO_BODY
+    return truncate(text, max_tokens) if max_tokens is not None else text
@@ -0,0 +1,255 @@
+"""Counters and per-stage timings of a run, with pluggable exporters (summary table, JSON lines, Prometheus)."""
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the timing histogram buckets; the last bucket catches the rest
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Count, sum, max and bucket counts of the durations observed for one stage."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the max for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+class Metrics:
+    """Thread-safe counters (optionally labelled) and timing histograms per pipeline stage.
+
+    Exporters are told about events (per-email records, only built when an exporter wants them)
+    and about the end of the run.
+    """
+
+    def __init__(self, exporters=()):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.exporters = []
+        self.tracing = False
+        for exporter in exporters:
+            self.add_exporter(exporter)
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+        exporter.attach(self)
+        # Per-email trace IDs and event records are only produced for exporters that keep them
+        self.tracing = any(exporter.wants_events for exporter in self.exporters)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a block as one observation of stage (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def new_trace_id(self):
+        """A fresh per-email trace ID, or None when no exporter records events."""
+        return uuid.uuid4().hex[:16] if self.tracing else None
+
+    def event(self, name, **fields):
+        """Hand a structured record to the exporters that keep events; free when none does."""
+        if not self.tracing:
+            return
+        record = {'time': round(time.time(), 3), 'event': name, **fields}
+        for exporter in self.exporters:
+            if exporter.wants_events:
+                exporter.export_event(record)
+
+    def counter_total(self, name):
+        with self.lock:
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def snapshot(self):
+        """Return {'counters': [(name, labels, value)], 'stages': {stage: {count, sum, max, p50, p95, buckets}}, 'seconds': run time}."""
+        with self.lock:
+            counters = [(name, dict(labels), value) for (name, labels), value in sorted(self.counters.items())]
+            stages = {stage: {'count': histogram.count, 'sum': histogram.sum, 'max': histogram.max,
+                              'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                              'buckets': list(zip(histogram.buckets, histogram.counts)), 'overflow': histogram.counts[-1]}
+                      for stage, histogram in sorted(self.histograms.items())}
+        return {'counters': counters, 'stages': stages, 'seconds': time.time() - self.started}
+
+    def summary(self):
+        """Return the end-of-run table of stage timings and counters, as a list of lines."""
+        snapshot = self.snapshot()
+        lines = [f"{'stage':<24} {'count':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+        for stage, data in snapshot['stages'].items():
+            mean = data['sum'] / data['count'] if data['count'] else 0.0
+            lines.append(f"{stage:<24} {data['count']:>7} {data['sum']:>9.2f} {mean * 1000:>9.1f} "
+                         f"{data['p50'] * 1000:>8.1f} {data['p95'] * 1000:>8.1f} {data['max'] * 1000:>8.1f}")
+        for name, labels, value in snapshot['counters']:
+            label = ','.join(f"{key}={value}" for key, value in labels.items())
+            lines.append(f"{name + (f'[{label}]' if label else ''):<48} {value:>10}")
+        return lines
+
+    def close(self):
+        """Tell every exporter the run is over (prints the summary, flushes files, stops servers)."""
+        for exporter in self.exporters:
+            exporter.close()
+
+class Exporter:
+    """Base class: receives per-email events (if wants_events) and the end of the run."""
+
+    wants_events = False
+
+    def attach(self, metrics):
+        self.metrics = metrics
+
+    def export_event(self, record):
+        pass
+
+    def close(self):
+        pass
+
+class SummaryExporter(Exporter):
+    """Prints the summary table at the end of the run."""
+
+    def __init__(self, output=print):
+        self.output = output
+
+    def close(self):
+        for line in self.metrics.summary():
+            self.output(line)
+
+class JsonLinesExporter(Exporter):
+    """Writes one JSON object per event, and a final 'summary' record, to a file ('-' for stdout)."""
+
+    wants_events = True
+
+    def __init__(self, path='-'):
+        self.lock = threading.Lock()
+        self.owns_file = path != '-'
+        self.file = open(path, 'a') if self.owns_file else sys.stdout
+
+    def export_event(self, record):
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        snapshot = self.metrics.snapshot()
+        record = {'time': round(time.time(), 3), 'event': 'summary', 'seconds': round(snapshot['seconds'], 3),
+                  'counters': [{'name': name, 'labels': labels, 'value': value} for name, labels, value in snapshot['counters']],
+                  'stages': {stage: {key: data[key] for key in ('count', 'sum', 'max', 'p50', 'p95')}
+                             for stage, data in snapshot['stages'].items()}}
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            if self.owns_file:
+                self.file.close()
+
+def prometheus_name(name):
+    return 'email_agent_' + ''.join(character if character.isalnum() else '_' for character in name)
+
+def prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+def prometheus_text(metrics):
+    """Render counters and stage histograms in the Prometheus text exposition format."""
+    snapshot = metrics.snapshot()
+    lines = []
+    names = []
+    for name, labels, value in snapshot['counters']:
+        metric = prometheus_name(name) + '_total'
+        if metric not in names:
+            names.append(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{prometheus_labels(labels)} {value}")
+
+    if snapshot['stages']:
+        metric = prometheus_name('stage_seconds')
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, data in snapshot['stages'].items():
+            cumulative = 0
+            for bound, count in data['buckets']:
+                cumulative += count
+                lines.append(f"{metric}_bucket{prometheus_labels({'stage': stage, 'le': bound})} {cumulative}")
+            lines.append(f"{metric}_bucket{prometheus_labels({'stage': stage, 'le': '+Inf'})} {data['count']}")
+            lines.append(f"{metric}_sum{prometheus_labels({'stage': stage})} {data['sum']}")
+            lines.append(f"{metric}_count{prometheus_labels({'stage': stage})} {data['count']}")
+    return '\n'.join(lines) + '\n'
+
+class PrometheusExporter(Exporter):
+    """Serves the metrics as Prometheus text on http://host:port/metrics while the run lasts."""
+
+    def __init__(self, port, host='127.0.0.1'):
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def attach(self, metrics):
+        super().attach(metrics)
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(exporter.metrics).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are not worth a line on the console
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        # Port 0 picks a free port
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,122 @@
+import threading
+from utilities.address_index import AddressIndex
+from utilities.llm_helper import LLMHelper
+from utilities.prompt_builder import TokenBudget
+
+CASCADE_PREFIX = 'cascade:'
+# Answers below this confidence go to the next tier; override with "cascade_min_confidence" in a tier's config entry
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+def create_llm_helper(model_choice, config_path='OAI_CONFIG_LIST', max_run_tokens=None, **options):
+    """Return an LLMHelper, or a ModelCascade when model_choice is 'cascade:small,large'."""
+    if not model_choice.startswith(CASCADE_PREFIX):
+        return LLMHelper(model_choice=model_choice, config_path=config_path, max_run_tokens=max_run_tokens, **options)
+
+    models = [model.strip() for model in model_choice[len(CASCADE_PREFIX):].split(',') if model.strip()]
+    if len(models) < 2:
+        raise ValueError(f"A cascade needs at least two models, e.g. cascade:gpt-4o-mini,gpt-4o (got {model_choice})")
+    # All tiers draw from the same run budget
+    budget = TokenBudget(max_run_tokens)
+    return ModelCascade([LLMHelper(model_choice=model, config_path=config_path, token_budget=budget, **options) for model in models])
+
+class TierStats:
+    """Emails routed to one cascade tier and the ones it escalated; requests and latency come from its cost tracker."""
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.emails = 0
+        self.escalations = {}
+
+    def escalated(self):
+        return sum(self.escalations.values())
+
+    def summary(self):
+        costs = self.tier.cost_tracker
+        line = f"{self.tier.model_config['model']}: {self.emails} emails, {costs.requests} requests"
+        if costs.requests:
+            line += f", {costs.seconds / costs.requests:.2f}s per request (max {costs.max_seconds:.2f}s)"
+        if self.emails and self.escalations:
+            reasons = ', '.join(f"{count} {reason}" for reason, count in sorted(self.escalations.items()))
+            line += f", escalated {self.escalated()} ({self.escalated() / self.emails:.0%}: {reasons})"
+        return line
+
+class ModelCascade:
+    """Classifies emails with the cheapest model first and escalates to the next tier when it is unsure.
+
+    An answer is escalated when its confidence is below the tier's cascade_min_confidence, when the tier
+    has no valid answer, or when the sender is one of the tier's cascade_vip_senders (those emails skip
+    the tier entirely). The last tier's answer is final.
+    """
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.stats = [TierStats(tier) for tier in tiers]
+        # Addresses and domains ('ceo@example.com', '@example.com') whose mail skips a tier
+        self.vip_senders = [AddressIndex(tier.model_config.get('cascade_vip_senders', [])) for tier in tiers]
+        self.lock = threading.Lock()
+        # Emails are batched by the agent; every tier splits them again for its own token budget
+        self.max_batch_size = min(tier.max_batch_size for tier in tiers)
+
+    def suggest_action(self, email_data):
+        return self.suggest_actions([email_data])[0]
+
+    def suggest_actions(self, emails):
+        """Suggest an (action, explanation, confidence) triple for each email, see LLMHelper.suggest_actions."""
+        results = [None] * len(emails)
+        pending = list(range(len(emails)))
+        for level, tier in enumerate(self.tiers):
+            last = level == len(self.tiers) - 1
+            min_confidence = tier.model_config.get('cascade_min_confidence', DEFAULT_MIN_CONFIDENCE)
+            vip_senders = self.vip_senders[level]
+
+            # VIP mail goes straight to a bigger model
+            asked = []
+            escalations = {}
+            for index in pending:
+                if not last and vip_senders and tier.extract_sender(emails[index]) in vip_senders:
+                    escalations['vip'] = escalations.get('vip', 0) + 1
+                else:
+                    asked.append(index)
+            escalated = sorted(set(pending) - set(asked))
+
+            if asked:
+                answers = tier.suggest_actions([emails[index] for index in asked])
+                for index, (action, explanation, confidence) in zip(asked, answers):
+                    results[index] = (action, explanation, confidence)
+                    if last:
+                        continue
+                    if action is None:
+                        escalations['no answer'] = escalations.get('no answer', 0) + 1
+                    elif confidence is None or confidence < min_confidence:
+                        escalations['low confidence'] = escalations.get('low confidence', 0) + 1
+                    else:
+                        continue
+                    escalated.append(index)
+            self.record(level, len(pending), escalations)
+
+            pending = sorted(escalated)
+            if not pending:
+                break
+        return results
+
+    def complete(self, system_prompt, user_prompt, max_tokens, action='completion'):
+        """Free-form prompts (e.g. reply drafts) go to the largest model, see LLMHelper.complete."""
+        return self.tiers[-1].complete(system_prompt, user_prompt, max_tokens, action=action)
+
+    def record(self, level, emails, escalations):
+        with self.lock:
+            stats = self.stats[level]
+            stats.emails += emails
+            for reason, count in escalations.items():
+                stats.escalations[reason] = stats.escalations.get(reason, 0) + count
+
+    def report(self):
+        """Return the end-of-run report of every tier, as a list of lines."""
+        lines = ["Model cascade:"] + [f"  {stats.summary()}" for stats in self.stats]
+        for tier in self.tiers:
+            lines.extend(tier.report())
+        return lines
+
+    def close(self):
+        for tier in self.tiers:
+            tier.close()
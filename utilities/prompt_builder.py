@@ -0,0 +1,166 @@
+import functools
+import json
+import threading
+
+# Default token budgets: the summary of one email, and the subject and sender within it
+DEFAULT_EMAIL_TOKENS = 1000
+SUBJECT_TOKENS = 100
+SENDER_TOKENS = 30
+# Digest of the earlier messages of a conversation, sent along with its latest message
+EARLIER_TOKENS = 200
+# Default size of a batched request (instructions, email summaries and expected answers)
+DEFAULT_BATCH_TOKENS = 8000
+# Tokens reserved for the answer about one email when sizing batches and checking the run budget
+COMPLETION_TOKENS_PER_EMAIL = 60
+# Approximation used when tiktoken (or the model's encoding) is unavailable
+CHARS_PER_TOKEN = 4
+
+SYSTEM_PROMPT = "You are an assistant helping process emails. You answer with JSON only."
+BATCH_PROMPT_TEMPLATE = (
+    "Suggest an action (archive/reply/ignore) for each of the emails below, with your confidence "
+    "between 0 and 1 and an explanation under 30 words.\n"
+    "Answer with a JSON array only, one object per email: "
+    '[{{"id": "<email id>", "action": "archive", "confidence": 0.9, "explanation": "..."}}]\n'
+    'An email with an "earlier" field is the latest of a conversation whose earlier unread messages it lists; '
+    "the action applies to the whole conversation.\n\n"
+    "Emails (one JSON object per line):\n{emails}"
+)
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a prompt would exceed the token budget of the run."""
+
+class TokenBudget:
+    """Thread-safe count of the tokens used in a run, against an optional limit; shared by the tiers of a cascade."""
+
+    def __init__(self, max_tokens=None):
+        self.max_tokens = max_tokens
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        """Tokens left in the budget, or None without a limit."""
+        with self.lock:
+            if self.max_tokens is None:
+                return None
+            return max(0, self.max_tokens - self.used)
+
+    def reserve(self, tokens):
+        """Count tokens against the budget, or raise TokenBudgetExceeded."""
+        with self.lock:
+            if self.max_tokens is not None and self.used + tokens > self.max_tokens:
+                raise TokenBudgetExceeded(f"Run token budget of {self.max_tokens} reached")
+            self.used += tokens
+
+    def settle(self, reserved, used):
+        """Replace a reservation by the number of tokens the call actually used."""
+        with self.lock:
+            self.used += used - reserved
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """Return the tiktoken encoding for a model, or None when tiktoken or the encoding is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Local and unknown models: cl100k_base is a reasonable stand-in
+        try:
+            return tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            return None
+    except Exception:
+        # The encoding files could not be downloaded (e.g. no network)
+        return None
+
+def summary_line(email_id, summary):
+    """Serialize an email summary as the JSON line used in batched prompts."""
+    return json.dumps({'id': email_id, **summary}, ensure_ascii=False)
+
+class PromptBuilder:
+    """Builds batched classification prompts within per-email, per-batch and per-run token budgets."""
+
+    def __init__(self, model, max_email_tokens=DEFAULT_EMAIL_TOKENS, max_run_tokens=None, max_batch_tokens=DEFAULT_BATCH_TOKENS, budget=None):
+        self.model = model
+        self.max_email_tokens = max_email_tokens
+        self.max_batch_tokens = max_batch_tokens
+        self.budget = budget or TokenBudget(max_run_tokens)
+        # Tokens of a request without any email in it
+        self.overhead_tokens = self.count_tokens(SYSTEM_PROMPT) + self.count_tokens(BATCH_PROMPT_TEMPLATE.format(emails=''))
+
+    def count_tokens(self, text):
+        encoding = get_encoding(self.model)
+        if encoding is None:
+            return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        """Keep the beginning of text, up to max_tokens, cut at a word boundary when possible."""
+        if max_tokens <= 0:
+            return ""
+        encoding = get_encoding(self.model)
+        if encoding is None:
+            max_chars = max_tokens * CHARS_PER_TOKEN
+            if len(text) <= max_chars:
+                return text
+            kept = text[:max_chars]
+        else:
+            tokens = encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            kept = encoding.decode(tokens[:max_tokens])
+        cut = kept.rfind(' ')
+        if cut > len(kept) // 2:
+            kept = kept[:cut]
+        return kept.rstrip() + " [...]"
+
+    def summarize(self, subject, sender, body, earlier=None):
+        """Return (summary, tokens): the fields of an email sent to the LLM, cut to the per-email budget.
+
+        earlier optionally digests the earlier messages of the email's conversation; it takes from the body's budget.
+        """
+        subject = self.truncate(subject, SUBJECT_TOKENS)
+        sender = self.truncate(sender, SENDER_TOKENS)
+        earlier = self.truncate(earlier, EARLIER_TOKENS) if earlier else None
+        body_tokens = self.max_email_tokens - self.count_tokens(subject) - self.count_tokens(sender)
+        body = self.truncate(body, body_tokens - (self.count_tokens(earlier) if earlier else 0))
+        summary = {'subject': subject, 'from': sender, 'body': body}
+        if earlier:
+            summary['earlier'] = earlier
+        # Batch IDs are short numbers, '0000' stands in for any of them (plus the line break)
+        return summary, self.count_tokens(summary_line('0000', summary)) + 1
+
+    def build_batch(self, items):
+        """Return (system_prompt, user_prompt, prompt_tokens) for a list of (email_id, summary) pairs."""
+        lines = '\n'.join(summary_line(email_id, summary) for email_id, summary in items)
+        user_prompt = BATCH_PROMPT_TEMPLATE.format(emails=lines)
+        return SYSTEM_PROMPT, user_prompt, self.count_tokens(SYSTEM_PROMPT) + self.count_tokens(user_prompt)
+
+    def batch_tokens(self, summary_tokens):
+        """Estimated tokens of a request (prompt and answer) for emails with the given summary sizes."""
+        return self.overhead_tokens + sum(summary_tokens) + COMPLETION_TOKENS_PER_EMAIL * len(summary_tokens)
+
+    def plan_batches(self, summary_tokens, max_batch_size):
+        """Split emails, given their summary sizes, into batches that fit the batch and remaining run budgets.
+
+        Returns lists of indexes into summary_tokens. Emails left out of every batch do not fit the run budget.
+        """
+        remaining = self.budget.remaining()
+        batches = []
+        batch = []
+        for index, tokens in enumerate(summary_tokens):
+            sizes = [summary_tokens[i] for i in batch] + [tokens]
+            if batch and (len(batch) >= max_batch_size or self.batch_tokens(sizes) > self.max_batch_tokens):
+                batches.append(batch)
+                if remaining is not None:
+                    remaining -= self.batch_tokens(sizes[:-1])
+                batch = []
+                sizes = [tokens]
+            if remaining is not None and self.batch_tokens(sizes) > remaining:
+                break
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+        return batches
@@ -0,0 +1,32 @@
+import threading
+import time
+
+class RateLimiter:
+    """Thread-safe token bucket that keeps calls under a per-minute limit."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute / 60))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available, consume them and return the seconds spent waiting.
+
+        Requests larger than the bucket wait for a full bucket and then leave it in debt,
+        so that a single large LLM prompt is still throttled instead of blocking forever.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+                self.updated_at = now
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return waited
+                wait = (needed - self.tokens) / self.rate_per_second
+            time.sleep(wait)
+            waited += wait
@@ -0,0 +1,188 @@
+import logging
+import random
+import threading
+import time
+
+# HTTP statuses worth retrying: rate limited or a transient server error
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# Gmail reports per-user rate limits as 403s with one of these reasons
+RATE_LIMIT_REASONS = (b'rateLimitExceeded', b'userRateLimitExceeded')
+# Client exceptions that mean the request never got an answer
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'HttpLib2Error', 'ServerNotFoundError'}
+
+def error_status(error):
+    """Return the HTTP status of a googleapiclient, openai or requests error, if any."""
+    resp = getattr(error, 'resp', None)  # googleapiclient.errors.HttpError
+    if resp is not None and getattr(resp, 'status', None):
+        return int(resp.status)
+    status = getattr(error, 'status_code', None)  # openai.APIStatusError
+    if status:
+        return int(status)
+    response = getattr(error, 'response', None)  # requests.HTTPError
+    if response is not None and getattr(response, 'status_code', None):
+        return int(response.status_code)
+    return None
+
+def is_retryable(error):
+    status = error_status(error)
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403:
+        content = getattr(error, 'content', b'') or b''
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    if status is None:
+        # Connection resets, timeouts and DNS failures (requests errors are OSErrors too)
+        return isinstance(error, OSError) or type(error).__name__ in RETRYABLE_ERROR_NAMES
+    return False
+
+def retry_after(error):
+    """Return the delay requested by a Retry-After header, in seconds, or None."""
+    headers = None
+    if getattr(error, 'resp', None) is not None:
+        headers = error.resp
+    elif getattr(error, 'response', None) is not None:
+        headers = getattr(error.response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # HTTP-date values are rare for these APIs; fall back to exponential backoff
+        return None
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After when the server sends it."""
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, error=None):
+        """Seconds to wait before retry number `attempt` (1-based)."""
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """Pauses calls to a backend after consecutive failures, then lets trial calls through.
+
+    closed: calls go through. open: callers wait until reset_timeout has passed.
+    half-open: calls go through; one success closes the circuit, one failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+    def wait_until_closed(self):
+        """Block while the circuit is open; return the seconds spent paused."""
+        with self.lock:
+            remaining = 0.0 if self.opened_at is None else self.reset_timeout - (time.monotonic() - self.opened_at)
+        if remaining > 0:
+            time.sleep(remaining)
+            return remaining
+        return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        """Count a failure; return True when it opens (or reopens) the circuit."""
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+class ResilienceMetrics:
+    """Thread-safe counters of calls, throttling, retries and circuit openings."""
+
+    FIELDS = ('calls', 'throttled', 'throttled_seconds', 'retries', 'failures', 'circuit_opens', 'circuit_paused_seconds')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {field: 0 for field in self.FIELDS}
+
+    def increment(self, field, amount=1):
+        with self.lock:
+            self.counters[field] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+class ResilientBackend:
+    """Wraps calls to one backend (Gmail, an LLM provider) with rate limiting, retries and a circuit breaker.
+
+    `limiters` maps a name to a RateLimiter, e.g. {'requests': ..., 'tokens': ...}; each
+    call says how much of each it consumes (1 by default).
+    """
+
+    def __init__(self, name, limiters=None, retry_policy=None, circuit_breaker=None, log_level=logging.INFO):
+        self.name = name
+        # The circuit-open notice is printed at INFO; it is also counted in circuit_opens
+        self.log_level = log_level
+        self.limiters = limiters or {}
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.metrics = ResilienceMetrics()
+
+    def throttle(self, costs=None):
+        for limiter_name, limiter in self.limiters.items():
+            waited = limiter.acquire((costs or {}).get(limiter_name, 1))
+            if waited:
+                self.metrics.increment('throttled')
+                self.metrics.increment('throttled_seconds', waited)
+
+    def call(self, function, costs=None):
+        """Call function() and return its result, retrying retryable errors; the last error is re-raised."""
+        attempt = 1
+        while True:
+            paused = self.circuit_breaker.wait_until_closed()
+            if paused:
+                self.metrics.increment('circuit_paused_seconds', paused)
+            self.throttle(costs)
+            self.metrics.increment('calls')
+            try:
+                result = function()
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                if self.circuit_breaker.record_failure():
+                    self.metrics.increment('circuit_opens')
+                    if logging.INFO >= self.log_level:
+                        print(f"{self.name}: too many failures, pausing calls for {self.circuit_breaker.reset_timeout:.0f}s")
+                if attempt >= self.retry_policy.max_attempts:
+                    self.metrics.increment('failures')
+                    raise
+                delay = self.retry_policy.delay(attempt, error)
+                self.metrics.increment('retries')
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.circuit_breaker.record_success()
+                return result
+
+    def summary(self):
+        counters = self.metrics.snapshot()
+        return (f"{self.name}: {counters['calls']} calls, {counters['retries']} retried, "
+                f"{counters['throttled']} throttled ({counters['throttled_seconds']:.1f}s), "
+                f"{counters['failures']} failed, circuit opened {counters['circuit_opens']} times")
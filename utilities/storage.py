@@ -0,0 +1,241 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# Thread decisions not used for this long are dropped (90 days)
+THREAD_DECISION_TTL = 90 * 24 * 3600
+
+# Files that held the agents' state before it moved to SQLite
+TRAINING_DATA_JSON = 'training_data.json'
+CONTACTS_JSON = 'data/contact_data.json'
+TOKEN_PICKLE = 'token.pickle'
+
+class Storage:
+    """SQLite store for training examples, the ignore list, thread decisions, contacts and OAuth tokens.
+
+    Every change is one small transaction (an upsert of a single row), so saving does not grow with the
+    amount of data already stored, and a crash mid-write leaves the previous state intact.
+    """
+
+    def __init__(self, path='agent_data.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        # The daemon's push handler and the main loop share one connection, serialized by self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS training_data (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS ignored_senders ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, sender TEXT NOT NULL UNIQUE, added_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE TABLE IF NOT EXISTS contacts (contact_id TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        # When each contact's SLA runs out ('%Y-%m-%dT%H:%M:%S', so text order is time order); contacts without one have no row
+        self.conn.execute('CREATE TABLE IF NOT EXISTS contact_due (contact_id TEXT PRIMARY KEY, due_at TEXT NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS contact_due_at ON contact_due (due_at)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS tokens (name TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        # Last action taken on each Gmail thread, reused for its new messages (see email_agents/threads.py)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS thread_decisions (thread_id TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS thread_decisions_updated_at ON thread_decisions (updated_at)')
+        # Legacy JSON files that were imported, with their modification time at the time
+        self.conn.execute('CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, mtime REAL NOT NULL, migrated_at REAL NOT NULL)')
+        self.conn.commit()
+
+    # Training data
+
+    def load_training_data(self):
+        """Return the training data in the layout of training_data.json: examples by subject, plus the ignore list."""
+        with self.lock:
+            training_data = {key: json.loads(value) for key, value in self.conn.execute('SELECT key, value FROM training_data')}
+            senders = [row[0] for row in self.conn.execute('SELECT sender FROM ignored_senders ORDER BY id')]
+        if senders:
+            training_data['always_ignore_senders'] = senders
+        return training_data
+
+    def save_example(self, subject, example):
+        """Insert or replace the training example for a subject."""
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO training_data (key, value) VALUES (?, ?)', (subject, json.dumps(example)))
+
+    def add_ignored_sender(self, sender):
+        """Add a sender to the ignore list; return False if it was already there."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute('INSERT OR IGNORE INTO ignored_senders (sender, added_at) VALUES (?, ?)', (sender, time.time()))
+            return cursor.rowcount == 1
+
+    def migrate_training_data(self, path=TRAINING_DATA_JSON):
+        """Import training_data.json, on first use and again whenever the file is edited (e.g. to add rules).
+
+        Examples already stored win over the file, so corrections made since the import are kept;
+        the explicit rules are only ever written from the file, so an edited rules list replaces the stored one.
+        """
+        def load(file):
+            training_data = json.load(file)
+            senders = training_data.pop('always_ignore_senders', [])
+            if 'rules' in training_data:
+                self.conn.execute('INSERT OR REPLACE INTO training_data (key, value) VALUES (?, ?)',
+                                  ('rules', json.dumps(training_data.pop('rules'))))
+            self.conn.executemany('INSERT OR IGNORE INTO training_data (key, value) VALUES (?, ?)',
+                                  [(key, json.dumps(value)) for key, value in training_data.items()])
+            now = time.time()
+            self.conn.executemany('INSERT OR IGNORE INTO ignored_senders (sender, added_at) VALUES (?, ?)',
+                                  [(sender, now) for sender in senders])
+        return self.migrate(path, load)
+
+    # Thread decisions
+
+    def load_thread_decisions(self, thread_ids):
+        """Return {thread_id: decision} for the given threads that have a decision."""
+        decisions = {}
+        with self.lock:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(thread_ids), 500):
+                chunk = thread_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f'SELECT thread_id, value FROM thread_decisions WHERE thread_id IN ({placeholders})', chunk)
+                decisions.update((thread_id, json.loads(value)) for thread_id, value in rows)
+        return decisions
+
+    def save_thread_decisions(self, decisions):
+        """Upsert {thread_id: decision} and drop the decisions older than THREAD_DECISION_TTL, in a single transaction."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO thread_decisions (thread_id, value, updated_at) VALUES (?, ?, ?)',
+                                  [(thread_id, json.dumps(decision), now) for thread_id, decision in decisions.items()])
+            self.conn.execute('DELETE FROM thread_decisions WHERE updated_at < ?', (now - THREAD_DECISION_TTL,))
+
+    # Contacts
+
+    def load_contacts(self):
+        with self.lock:
+            return {contact_id: json.loads(value) for contact_id, value in self.conn.execute('SELECT contact_id, value FROM contacts')}
+
+    def data_version(self):
+        """Changes whenever another connection (e.g. a sync job) commits to the database; cheap to poll."""
+        with self.lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def save_contact(self, contact_id, contact):
+        self.save_contacts({contact_id: contact})
+
+    def save_contacts(self, contacts, due_dates=None):
+        """Insert or replace the given contacts in a single transaction; other contacts are left untouched.
+
+        due_dates optionally maps some of the contact IDs to their new SLA due date (None for no due date).
+        """
+        due_dates = due_dates or {}
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO contacts (contact_id, value) VALUES (?, ?)',
+                                  [(contact_id, json.dumps(contact)) for contact_id, contact in contacts.items()])
+            self.conn.executemany('DELETE FROM contact_due WHERE contact_id = ?',
+                                  [(contact_id,) for contact_id, due_at in due_dates.items() if due_at is None])
+            self.conn.executemany('INSERT OR REPLACE INTO contact_due (contact_id, due_at) VALUES (?, ?)',
+                                  [(contact_id, due_at) for contact_id, due_at in due_dates.items() if due_at is not None])
+
+    def replace_due_dates(self, rows):
+        """Replace every SLA due date by the (contact_id, due_at) rows, in a single transaction."""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM contact_due')
+            self.conn.executemany('INSERT INTO contact_due (contact_id, due_at) VALUES (?, ?)', rows)
+
+    def due_contacts(self, until):
+        """Return (contact_id, contact, due_at) for the contacts due at or before until, earliest first.
+
+        Walks the due_at index, so the cost grows with the number of due contacts, not with all contacts.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT contact_due.contact_id, contacts.value, contact_due.due_at FROM contact_due '
+                'JOIN contacts ON contacts.contact_id = contact_due.contact_id '
+                'WHERE contact_due.due_at <= ? ORDER BY contact_due.due_at', (until,)
+            ).fetchall()
+        return [(contact_id, json.loads(value), due_at) for contact_id, value, due_at in rows]
+
+    def add_contacts(self, contacts):
+        """Insert the contacts whose ID is not stored yet, in a single transaction; return how many were added."""
+        return self.add_contact_rows((contact_id, json.dumps(contact)) for contact_id, contact in contacts.items())
+
+    def add_contact_rows(self, rows):
+        """Like add_contacts, for (contact_id, contact serialized as JSON) pairs."""
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO contacts (contact_id, value) VALUES (?, ?)', rows)
+            return self.conn.total_changes - before
+
+    def migrate_contacts(self, path=CONTACTS_JSON):
+        """Import contact_data.json on first use; the file is left in place as a backup and contacts already stored win."""
+        def load(file):
+            contacts = json.load(file)
+            self.conn.executemany('INSERT OR IGNORE INTO contacts (contact_id, value) VALUES (?, ?)',
+                                  [(contact_id, json.dumps(contact)) for contact_id, contact in contacts.items()])
+        return self.migrate(path, load)
+
+    # Small named values (settings fingerprints, ...)
+
+    def get_state(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    # OAuth tokens
+
+    def load_token(self, name):
+        """Return the stored token (a JSON string), or None."""
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM tokens WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def save_token(self, name, value):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO tokens (name, value, updated_at) VALUES (?, ?, ?)', (name, value, time.time()))
+
+    def migrate_pickled_token(self, name, path=TOKEN_PICKLE):
+        """Move credentials pickled by earlier versions into the store, then delete the pickle.
+
+        The pickle was written by this agent; it is unpickled this one time and never read again.
+        """
+        if not os.path.exists(path) or self.load_token(name) is not None:
+            return False
+        with open(path, 'rb') as file:
+            creds = pickle.load(file)
+        self.save_token(name, creds.to_json())
+        os.remove(path)
+        return True
+
+    # Migrations
+
+    def migrate(self, path, load):
+        """Run load(file) on a legacy JSON file inside one transaction, unless this version of it was imported before.
+
+        load only adds the entries that are not stored yet, so touching or editing the file never
+        overwrites changes recorded in the database since the last import.
+        """
+        if not os.path.exists(path):
+            return False
+        name = os.path.abspath(path)
+        mtime = os.path.getmtime(path)
+        with self.lock:
+            row = self.conn.execute('SELECT mtime FROM migrations WHERE name = ?', (name,)).fetchone()
+            if row is not None and row[0] == mtime:
+                return False
+            with self.conn:
+                try:
+                    with open(path, 'r') as file:
+                        load(file)
+                except json.JSONDecodeError:
+                    print(f"Warning: {path} is empty or corrupted and was not imported.")
+                self.conn.execute('INSERT OR REPLACE INTO migrations (name, mtime, migrated_at) VALUES (?, ?, ?)',
+                                  (name, mtime, time.time()))
+        return True
+
+    def close(self):
+        with self.lock:
+            self.conn.close()